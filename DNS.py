@@ -1,12 +1,89 @@
 import random
+import select
 import socket
 import struct
+import time
+from collections import OrderedDict, namedtuple
 
+import metrics
+import profiling
+from bpf import attach_filter, drop_all_filter, udp_from_port_filter
+from capture import LINK_OFFSET, PacketRing
+from events import ERROR, REPLY, SENT, TIMEOUT, event, to_text
+from timer_wheel import TimerWheel
+from timing import ProbeTimings, enable_kernel_timestamps, now_ns, recv_with_timestamp
 
-def build_dns_query(domain):
+QTYPE_A = 1
+QTYPE_NS = 2
+QTYPE_CNAME = 5
+QTYPE_SOA = 6
+QTYPE_MX = 15
+QTYPE_TXT = 16
+QTYPE_AAAA = 28
+RCODE_SERVFAIL = 2
+RCODE_NXDOMAIN = 3
+RCODE_REFUSED = 5
+RCODE_NAMES = {0: 'NOERROR', 1: 'FORMERR', 2: 'SERVFAIL', 3: 'NXDOMAIN', 4: 'NOTIMP', 5: 'REFUSED'}
+
+DNS_HEADER = struct.Struct('!HHHHHH')
+DNS_QUESTION = struct.Struct('!HH')  # 问题: 类型、类
+DNS_RR = struct.Struct('!HHIH')  # 资源记录: 类型、类、TTL、数据长度
+_UDP_PORTS = struct.Struct('!HHH')  # UDP头: 源端口、目的端口、长度
+_MX = struct.Struct('!H')
+_SOA = struct.Struct('!IIIII')
+
+# 一个域名最多跟随的压缩指针数，超过即认为是指针循环
+_MAX_POINTERS = 64
+_MAX_NAME_LENGTH = 255
+
+ANSWER = 'answer'
+AUTHORITY = 'authority'
+ADDITIONAL = 'additional'
+
+MXData = namedtuple('MXData', 'preference exchange')
+SOAData = namedtuple('SOAData', 'mname rname serial refresh retry expire minimum')
+
+
+class DNSParseError(ValueError):
+    """DNS报文格式错误（截断、指针循环、域名过长等）"""
+
+
+class DNSQueryError(str):
+    """
+    单个查询失败（发送出错、服务器返回 SERVFAIL/REFUSED、响应ID不匹配或无法解析等）时的结果，内容为错误描述
+    rcode 为服务器返回的响应码，没有可用的响应码时为 None
+    """
+
+    def __new__(cls, message, rcode=None):
+        error = super().__new__(cls, message)
+        error.rcode = rcode
+        return error
+
+
+class DNSRecord:
+    """
+    资源记录
+    data 按类型解码: A/AAAA 为地址字符串，CNAME/NS 为域名，MX 为 MXData，
+    TXT 为字符串元组，SOA 为 SOAData，其他类型为原始字节
+    """
+    __slots__ = ('name', 'type', 'rclass', 'ttl', 'data')
+
+    def __init__(self, name, type_, rclass, ttl, data):
+        self.name = name
+        self.type = type_
+        self.rclass = rclass
+        self.ttl = ttl
+        self.data = data
+
+    def __repr__(self):
+        return f"DNSRecord({self.name!r}, type={self.type}, ttl={self.ttl}, data={self.data!r})"
+
+
+def build_dns_query(domain, qtype=QTYPE_A, transaction_id=None):
     """构建DNS查询报文"""
-    # 随机生成一个查询ID
-    transaction_id = random.randint(0, 65535)
+    # 未指定时随机生成一个查询ID
+    if transaction_id is None:
+        transaction_id = random.randint(0, 65535)
 
     # DNS头部标志
     flags = 0x0100  # 标准查询，期望递归
@@ -33,92 +110,441 @@ def build_dns_query(domain):
     query += b'\x00'  # 域名结束符
 
     # 添加查询类型和类
-    query_type = 1  # A记录
+    query_type = qtype  # 默认A记录
     query_class = 1  # IN (Internet)
     query += struct.pack('!HH', query_type, query_class)
 
     return dns_header + query, transaction_id
 
 
-def parse_dns_response(data, transaction_id):
-    """解析DNS响应"""
-    # 解析DNS头部
-    header = struct.unpack('!HHHHHH', data[:12])
-    if header[0] != transaction_id:
-        return "响应ID不匹配"
-
-    # 跳过问题部分
-    offset = 12
-    # 跳过查询的域名
+def read_name(view, offset):
+    """
+    从 offset 处读出一个域名，完整支持任意位置的压缩指针
+    返回 (域名, 域名在原位置之后的偏移)
+    """
+    labels = []
+    end = None  # 遇到第一个指针时记录原位置之后的偏移
+    pointers = 0
+    name_length = 0
     while True:
-        length = data[offset]
+        length = view[offset]
+        if length & 0xC0 == 0xC0:
+            if end is None:
+                end = offset + 2
+            pointers += 1
+            if pointers > _MAX_POINTERS:
+                raise DNSParseError("压缩指针循环")
+            offset = ((length & 0x3F) << 8) | view[offset + 1]
+            continue
+        if length & 0xC0:
+            raise DNSParseError(f"不支持的标签类型: {length:#x}")
+        offset += 1
         if length == 0:
             break
-        offset += length + 1
-    offset += 5  # 跳过查询类型和类
-
-    # 解析答案部分
-    answers = []
-    for _ in range(header[3]):  # header[3]是回答数量
-        # 处理压缩指针
-        if (data[offset] & 0xC0) == 0xC0:
-            offset += 2
-        else:
-            # 跳过名称
-            while True:
-                length = data[offset]
-                if length == 0:
-                    offset += 1
-                    break
-                offset += length + 1
+        name_length += length + 1
+        if name_length > _MAX_NAME_LENGTH or offset + length > len(view):
+            raise DNSParseError("域名过长或被截断")
+        labels.append(str(view[offset:offset + length], 'ascii', 'replace'))
+        offset += length
+    return '.'.join(labels), offset if end is None else end
 
-        # 解析资源记录
-        type_, class_, ttl, data_len = struct.unpack('!HHIH', data[offset:offset + 10])
-        offset += 10
 
-        # 如果是A记录（IPv4地址）
-        if type_ == 1 and data_len == 4:
-            ip = '.'.join(str(x) for x in data[offset:offset + 4])
-            answers.append(ip)
+def _decode_rdata(view, type_, offset, data_len):
+    """按记录类型解码数据部分"""
+    end = offset + data_len
+    if end > len(view):
+        raise DNSParseError("资源记录被截断")
+    if type_ == QTYPE_A and data_len == 4:
+        return socket.inet_ntoa(view[offset:end])
+    if type_ == QTYPE_AAAA and data_len == 16:
+        return socket.inet_ntop(socket.AF_INET6, view[offset:end])
+    if type_ == QTYPE_CNAME or type_ == QTYPE_NS:
+        return read_name(view, offset)[0]
+    if type_ == QTYPE_MX:
+        return MXData(_MX.unpack_from(view, offset)[0], read_name(view, offset + 2)[0])
+    if type_ == QTYPE_TXT:
+        strings = []
+        while offset < end:
+            length = view[offset]
+            if offset + 1 + length > end:
+                raise DNSParseError("TXT字符串超出记录长度")
+            strings.append(str(view[offset + 1:offset + 1 + length], 'utf-8', 'replace'))
+            offset += length + 1
+        return tuple(strings)
+    if type_ == QTYPE_SOA:
+        mname, offset = read_name(view, offset)
+        rname, offset = read_name(view, offset)
+        return SOAData(mname, rname, *_SOA.unpack_from(view, offset))
+    return bytes(view[offset:end])
 
-        offset += data_len
 
-    return answers
+class DNSMessage:
+    """
+    基于 memoryview 的DNS报文解析，不复制报文数据
+    构造时只解析头部和问题部分，资源记录在 iter_records() 中逐条惰性解码，
+    适合很大的 EDNS/TCP 响应；answers/authority/additional 在首次访问时一次性解码
+    """
+    __slots__ = ('view', 'id', 'flags', 'qdcount', 'ancount', 'nscount', 'arcount',
+                 'questions', '_records_offset', '_sections')
 
+    def __init__(self, data):
+        self.view = memoryview(data)
+        try:
+            (self.id, self.flags, self.qdcount, self.ancount,
+             self.nscount, self.arcount) = DNS_HEADER.unpack_from(self.view)
+            offset = DNS_HEADER.size
+            self.questions = []  # [(域名, 类型, 类)]
+            for _ in range(self.qdcount):
+                name, offset = read_name(self.view, offset)
+                self.questions.append((name, *DNS_QUESTION.unpack_from(self.view, offset)))
+                offset += DNS_QUESTION.size
+        except (IndexError, struct.error) as e:
+            raise DNSParseError(f"报文被截断: {e}") from None
+        self._records_offset = offset
+        self._sections = None
 
-def dns_query(domain, dns_server="8.8.8.8"):
-    """发送DNS查询并接收响应"""
+    @property
+    def rcode(self):
+        return self.flags & 0x000F
+
+    def iter_records(self):
+        """按顺序逐条生成 (所在部分, DNSRecord)"""
+        view = self.view
+        offset = self._records_offset
+        sections = ((ANSWER, self.ancount), (AUTHORITY, self.nscount), (ADDITIONAL, self.arcount))
+        try:
+            for section, count in sections:
+                for _ in range(count):
+                    name, offset = read_name(view, offset)
+                    type_, rclass, ttl, data_len = DNS_RR.unpack_from(view, offset)
+                    offset += DNS_RR.size
+                    yield section, DNSRecord(name, type_, rclass, ttl, _decode_rdata(view, type_, offset, data_len))
+                    offset += data_len
+        except (IndexError, struct.error) as e:
+            raise DNSParseError(f"报文被截断: {e}") from None
+
+    def _section(self, section):
+        if self._sections is None:
+            self._sections = {ANSWER: [], AUTHORITY: [], ADDITIONAL: []}
+            for name, record in self.iter_records():
+                self._sections[name].append(record)
+        return self._sections[section]
+
+    @property
+    def answers(self):
+        return self._section(ANSWER)
+
+    @property
+    def authority(self):
+        return self._section(AUTHORITY)
+
+    @property
+    def additional(self):
+        return self._section(ADDITIONAL)
+
+
+def iter_tcp_messages(data):
+    """
+    逐个生成DNS over TCP流中的报文（每个报文前有2字节长度），
+    报文以 memoryview 切片给出，不复制
+    """
+    view = memoryview(data)
+    offset = 0
+    while offset + 2 <= len(view):
+        length = (view[offset] << 8) | view[offset + 1]
+        offset += 2
+        if offset + length > len(view):
+            raise DNSParseError("TCP流中的报文被截断")
+        yield DNSMessage(view[offset:offset + length])
+        offset += length
+
+
+def parse_dns_response(data, transaction_id):
+    """解析DNS响应，返回A记录的IP列表；ID不匹配或报文格式错误时返回 DNSQueryError（错误描述字符串）"""
+    try:
+        message = DNSMessage(data)
+        if message.id != transaction_id:
+            return DNSQueryError("响应ID不匹配")
+        return [record.data for record in message.answers if record.type == QTYPE_A]
+    except DNSParseError as e:
+        return DNSQueryError(str(e))
+
+
+def dns_query_events(domain, dns_server="8.8.8.8", timeout=5):
+    """发送DNS查询并接收响应，逐个产生结果事件"""
+    trace = profiling.sample('DNS')
     # 创建UDP套接字
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    sock.settimeout(5)
-    string = ""
+    sock.settimeout(timeout)
+    if trace:
+        trace.mark('socket')
     try:
         # 构建DNS查询报文
         query_packet, transaction_id = build_dns_query(domain)
+        if trace:
+            trace.mark('build')
 
         # 发送查询
+        sent_ns = now_ns()
         sock.sendto(query_packet, (dns_server, 53))
-        string += f"已发送DNS查询到 {dns_server} 查询域名: {domain}"
+        if trace:
+            trace.mark('sendto')
+        yield event(SENT, 'DNS', domain, server=dns_server, id=transaction_id)
+        if trace:
+            trace.reset()
 
         # 接收响应
         response, _ = sock.recvfrom(1024)
+        rtt = (now_ns() - sent_ns) / 1e6
+        if trace:
+            trace.mark('recv')
 
         # 解析响应
         answers = parse_dns_response(response, transaction_id)
+        if trace:
+            trace.mark('parse')
 
         if isinstance(answers, list):
-            string += f"\n查询结果:"
-            string += f"\n域名: {domain}"
-            string += f"\nIP地址:"
-            for ip in answers:
-                string += f"\n  {ip}"
+            yield event(REPLY, 'DNS', domain, rtt=rtt, server=dns_server, answers=answers)
         else:
-            string += f"\n解析错误: {answers}"
+            yield event(ERROR, 'DNS', domain, message=f"解析错误: {answers}")
 
     except socket.timeout:
-        string += f"\n查询超时"
+        yield event(TIMEOUT, 'DNS', domain, server=dns_server)
     except Exception as e:
-        string += f"\n发生错误: {e}"
+        yield event(ERROR, 'DNS', domain, message=f"发生错误: {e}")
     finally:
         sock.close()
-        return string
+
+
+def dns_query(domain, dns_server="8.8.8.8"):
+    """发送DNS查询并接收响应，返回格式化的文本"""
+    return to_text(dns_query_events(domain, dns_server))
+
+
+_CACHE_HITS = metrics.counter('rawsock_cache_hits_total', '缓存命中次数', cache='dns')
+_CACHE_MISSES = metrics.counter('rawsock_cache_misses_total', '缓存未命中次数', cache='dns')
+
+
+class DNSCache:
+    """
+    有界LRU缓存，键为 (域名, 查询类型)，条目按记录TTL过期
+    否定应答（NXDOMAIN/无记录）缓存为空列表，没有SOA可参考时使用 negative_ttl
+    """
+
+    def __init__(self, maxsize=100000, negative_ttl=60):
+        self.maxsize = maxsize
+        self.negative_ttl = negative_ttl
+        self._entries = OrderedDict()  # key -> (过期时间, 应答列表)
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, name, qtype=QTYPE_A, now=None):
+        """返回缓存的应答列表（否定应答为空列表），未命中或已过期返回 None"""
+        key = (name.lower(), qtype)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            _CACHE_MISSES.inc()
+            return None
+        now = time.monotonic() if now is None else now
+        if entry[0] <= now:
+            del self._entries[key]
+            self.misses += 1
+            _CACHE_MISSES.inc()
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        _CACHE_HITS.inc()
+        return entry[1]
+
+    def put(self, name, qtype, answers, ttl, now=None):
+        now = time.monotonic() if now is None else now
+        key = (name.lower(), qtype)
+        self._entries[key] = (now + ttl, answers)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+
+class DNSResolver:
+    """
+    流水线DNS解析器：共享一个UDP套接字，同时保持最多 window 个查询在途，
+    回复按事务ID匹配，超时由时间轮处理并可重试，结果写入 DNSCache，
+    每次查询的响应时间记录在 timings 中
+    use_ring 为 True 时通过 AF_PACKET mmap 环（capture.PacketRing）接收回复（需要root），UDP套接字只用于发送
+    dns_server 可以是主机名，构造时解析一次，之后发送和按来源匹配回复都用解析出的IP（无法解析时抛出 socket.gaierror）
+    """
+
+    def __init__(self, dns_server="8.8.8.8", timeout=5, retries=1, window=1000, cache=None, use_ring=False):
+        self.dns_server = socket.gethostbyname(dns_server)
+        self.timeout = timeout
+        self.retries = retries
+        self.window = min(window, 65535)
+        self.cache = DNSCache() if cache is None else cache
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.ring = None
+        if use_ring:
+            try:
+                # 先绑定得到源端口，环上按它匹配回复；套接字本身不再接收
+                self.sock.bind(('0.0.0.0', 0))
+                attach_filter(self.sock, drop_all_filter())
+                self.ring = PacketRing(bpf_filter=udp_from_port_filter(53, self.sock.getsockname()[1],
+                                                                       link_offset=LINK_OFFSET))
+            except OSError:
+                self.close()
+                raise
+        else:
+            # 大量查询在途时回复会集中到达，加大接收缓冲区
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        self.sock.setblocking(False)
+        enable_kernel_timestamps(self.sock)
+        self.timings = ProbeTimings()
+
+    def close(self):
+        self.sock.close()
+        if self.ring is not None:
+            self.ring.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _negative_ttl(self, message):
+        """否定应答的缓存时间：授权部分有SOA时取 min(SOA TTL, SOA minimum)（RFC 2308）"""
+        for record in message.authority:
+            if record.type == QTYPE_SOA:
+                return min(record.ttl, record.data.minimum)
+        return self.cache.negative_ttl
+
+    def resolve(self, domain, qtype=QTYPE_A):
+        """解析单个域名，返回记录数据列表；超时返回 None，失败返回 DNSQueryError"""
+        return self.resolve_many([domain], qtype)[domain]
+
+    def resolve_many(self, domains, qtype=QTYPE_A):
+        """
+        批量解析，返回 {域名: 记录数据列表}（A记录为IP字符串，其他类型见 DNSRecord）
+        NXDOMAIN或没有记录时为空列表，重试后仍超时为 None；
+        发送出错或服务器返回其他响应码（SERVFAIL、REFUSED 等）时为 DNSQueryError，其 rcode 为响应码
+        """
+        results = {}
+        queue = []
+        for domain in domains:
+            if domain in results:
+                continue
+            cached = self.cache.get(domain, qtype)
+            if cached is not None:
+                results[domain] = cached
+            else:
+                results[domain] = None
+                queue.append(domain)
+        queue.reverse()  # 从尾部弹出，保持原顺序
+
+        in_flight = {}  # 事务ID -> [域名, 已尝试次数, 本次发送的探测序号]
+        wheel = TimerWheel(tick=0.05)
+        buffer = bytearray(4096)
+        view = memoryview(buffer)
+        address = (self.dns_server, 53)
+
+        def handle(data, recv_ns):
+            """匹配一个DNS响应（接收缓冲区或抓包环中的视图，只在调用期间有效）"""
+            # 直接在视图上解析，不复制报文
+            try:
+                message = DNSMessage(data)
+            except DNSParseError:
+                return
+            probe = in_flight.get(message.id)
+            if probe is None:
+                return
+            try:
+                # 问题部分必须与查询一致，防止错配或伪造的回复
+                if (not message.questions
+                        or message.questions[0][0].lower() != probe[0].lower().rstrip('.')):
+                    return
+                records = message.answers
+            except DNSParseError:
+                return
+            del in_flight[message.id]
+            wheel.cancel(message.id)
+            self.timings.finish(probe[2], recv_ns)
+            answers = [record.data for record in records if record.type == qtype]
+            rcode = message.rcode
+            if answers:
+                ttl = min(record.ttl for record in records if record.type == qtype)
+                self.cache.put(probe[0], qtype, answers, ttl)
+            elif rcode in (0, RCODE_NXDOMAIN):
+                self.cache.put(probe[0], qtype, [], self._negative_ttl(message))
+            else:
+                # SERVFAIL/REFUSED 等不是否定应答，不缓存
+                answers = DNSQueryError(f"服务器返回 {RCODE_NAMES.get(rcode, rcode)}", rcode)
+            results[probe[0]] = answers
+
+        if self.ring is not None:
+            server = socket.inet_aton(self.dns_server)
+            local_port = self.sock.getsockname()[1]
+
+            def handle_frame(frame, length, recv_ns):
+                ihl = (frame[0] & 0x0F) * 4
+                if length < ihl + 8 + DNS_HEADER.size or frame[12:16] != server:
+                    return
+                sport, dport, udp_length = _UDP_PORTS.unpack_from(frame, ihl)
+                if sport != 53 or dport != local_port:
+                    return
+                handle(frame[ihl + 8:min(length, ihl + udp_length)], recv_ns)
+
+            self.ring.add_handler(socket.IPPROTO_UDP, handle_frame)
+
+        def send(transaction_id, domain):
+            try:
+                packet, _ = build_dns_query(domain, qtype, transaction_id)
+                in_flight[transaction_id][2] = self.timings.start()
+                self.sock.sendto(packet, address)
+            except BlockingIOError:
+                # 发送缓冲区满：留给超时重试处理
+                pass
+            except (OSError, ValueError) as e:
+                # 只有这一个查询失败（如域名标签过长、网络不可达），其余查询继续
+                del in_flight[transaction_id]
+                wheel.cancel(transaction_id)
+                results[domain] = DNSQueryError(f"发送失败: {e}")
+                return
+            wheel.add(transaction_id, self.timeout)
+
+        while queue or in_flight:
+            # 填满发送窗口
+            while queue and len(in_flight) < self.window:
+                transaction_id = random.randint(0, 65535)
+                while transaction_id in in_flight:
+                    transaction_id = random.randint(0, 65535)
+                domain = queue.pop()
+                in_flight[transaction_id] = [domain, 1, None]
+                send(transaction_id, domain)
+
+            if not in_flight:
+                # 全部发送失败
+                continue
+            if self.ring is not None:
+                self.ring.poll_once(wheel.next_timeout())
+            elif select.select([self.sock], [], [], wheel.next_timeout())[0]:
+                while True:
+                    try:
+                        length, addr, recv_ns = recv_with_timestamp(self.sock, buffer)
+                    except BlockingIOError:
+                        break
+                    if addr[0] != self.dns_server or length < DNS_HEADER.size:
+                        continue
+                    handle(view[:length], recv_ns)
+
+            for transaction_id in wheel.advance():
+                probe = in_flight[transaction_id]
+                if probe[1] <= self.retries:
+                    probe[1] += 1
+                    send(transaction_id, probe[0])
+                else:
+                    del in_flight[transaction_id]
+        return results
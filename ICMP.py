@@ -1,102 +1,355 @@
+import itertools
+import os
+import select
 import socket
 import struct
 import time
 
+import pcap
+import profiling
+from bpf import attach_filter, drop_all_filter, icmp_echo_reply_filter
+from capture import LINK_OFFSET, PacketRing
 from checksum import calculate_checksum
+from events import ERROR, REPLY, SENT, START, SUMMARY, TIMEOUT, TextSink, event, to_text
+from pacing import Pacer
+from timer_wheel import TimerWheel
+from timing import ProbeTimings, enable_kernel_timestamps, percentile, recv_with_timestamp
 
+# ICMP头部格式，预编译避免每次解析格式串
+ICMP_HEADER = struct.Struct('!BBHHH')
+ICMP_CHECKSUM = struct.Struct('!H')  # 校验和字段，位于偏移2
+ICMP_ECHO_REQUEST = 8
+ICMP_ECHO_REPLY = 0
+ICMP_DEST_UNREACHABLE = 3
+ICMP_PORT_UNREACHABLE = 3  # 目标不可达的代码3
+ICMP_TIME_EXCEEDED = 11
+ICMP_PAYLOAD = b'abcdefghijklmnopqrstuvwabcdefghi'  # 32字节负载
+ICMP_ID = 12345  # next_icmp_id 分配标识符的起点，每次分配递增，并发的Ping互不干扰
+_ping_ids = itertools.count(ICMP_ID)
 
-def send_icmp_ping(dest_addr, count=4, timeout=2):
+
+def next_icmp_id():
+    """分配一个本进程内未用过的ICMP标识符（ping_events 每次调用、AsyncPinger 每个实例各取一个）"""
+    return next(_ping_ids) & 0xFFFF
+
+
+def ping_events(dest_addr, count=4, timeout=2, interval=1):
+    """逐个Ping目标，每 interval 秒发送一个探测，每个探测产生 已发送/回复/超时 事件，最后产生汇总事件"""
     lost_count = 0
-    rtts = []
-    string = f"正在 Ping {dest_addr} 具有 32 字节的数据:"
+    pacer = Pacer(1 / interval if interval else None, burst=1)
+    timings = ProbeTimings()
+    recv_buffer = bytearray(1024)
+    icmp_id = next_icmp_id()
+    yield event(START, 'ICMP', dest_addr, size=len(ICMP_PAYLOAD), count=count)
     for i in range(count):
+        # 按发送时间计算间隔（与 ping 相同），等待回复的时间不会拉长间隔
+        pacer.wait()
+        trace = profiling.sample('ICMP')
         try:
             # 创建原始套接字，使用ICMP协议
             icmp_socket = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP)
             icmp_socket.settimeout(timeout)
+            # 只让内核把带有我们标识符的Echo Reply交上来
+            attach_filter(icmp_socket, icmp_echo_reply_filter(icmp_id))
+            # 接收时间使用内核时间戳
+            enable_kernel_timestamps(icmp_socket)
         except socket.error as e:
-            string += f"\n套接字创建失败: {e}"
-            return string
+            yield event(ERROR, 'ICMP', dest_addr, message=f"套接字创建失败: {e}")
+            return
+        if trace:
+            trace.mark('socket')
 
         # ICMP报文内容
-        icmp_type = 8  # Echo Request
+        icmp_type = ICMP_ECHO_REQUEST  # Echo Request
         icmp_code = 0
         icmp_checksum = 0
-        icmp_id = 12345  # 进程ID
-        icmp_seq = 1  # 序列号
-        payload = b'abcdefghijklmnopqrstuvwabcdefghi'
-
-        # 打包ICMP头部和数据
-        icmp_header = struct.pack('!BBHHH',
-                                  icmp_type,  # B: ICMP类型
-                                  icmp_code,  # B: ICMP代码
-                                  icmp_checksum,  # H: 校验和
-                                  icmp_id,  # H: 标识符
-                                  icmp_seq  # H: 序列号
-                                  )
-
-        # 计算校验和
-        icmp_packet = icmp_header + payload
-        icmp_checksum = calculate_checksum(icmp_packet)
+        icmp_seq = i + 1  # 序列号
+        payload = ICMP_PAYLOAD
 
-        # 重新打包带校验和的ICMP头部
-        icmp_header = struct.pack('!BBHHH',
-                                  icmp_type,
-                                  icmp_code,
-                                  icmp_checksum,
-                                  icmp_id,
-                                  icmp_seq
-                                  )
+        # 打包ICMP头部和数据（校验和先为0）
+        icmp_packet = bytearray(ICMP_HEADER.size + len(payload))
+        ICMP_HEADER.pack_into(icmp_packet, 0,
+                              icmp_type,  # B: ICMP类型
+                              icmp_code,  # B: ICMP代码
+                              icmp_checksum,  # H: 校验和
+                              icmp_id,  # H: 标识符
+                              icmp_seq  # H: 序列号
+                              )
+        icmp_packet[ICMP_HEADER.size:] = payload
+        if trace:
+            trace.mark('build')
 
-        # 最终的ICMP数据包
-        icmp_packet = icmp_header + payload
+        # 计算校验和并原地写回
+        icmp_checksum = calculate_checksum(icmp_packet)
+        ICMP_CHECKSUM.pack_into(icmp_packet, 2, icmp_checksum)
+        if trace:
+            trace.mark('checksum')
 
         try:
             # 记录发送时间
-            send_time = time.time()
+            probe = timings.start()
 
             # 发送ICMP包
             icmp_socket.sendto(icmp_packet, (dest_addr, 0))
+            if trace:
+                trace.mark('sendto')
+            pcap.record(icmp_packet, dest_addr, socket.IPPROTO_ICMP)
+            yield event(SENT, 'ICMP', dest_addr, seq=icmp_seq)
+            if trace:
+                trace.reset()
+
+            # 接收响应，跳过不属于这个探测的报文（如过滤器挂上之前已进入队列的报文）
+            deadline = time.monotonic() + timeout
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise socket.timeout
+                icmp_socket.settimeout(remaining)
+                length, addr, recv_ns = recv_with_timestamp(icmp_socket, recv_buffer)
+                if trace:
+                    trace.mark('recv')
 
-            # 接收响应
-            recv_packet, addr = icmp_socket.recvfrom(1024)
-            recv_time = time.time()
+                # 解析接收到的数据包，IP头部长度取自首字节
+                ihl = (recv_buffer[0] & 0x0F) * 4
+                if length < ihl + ICMP_HEADER.size:
+                    continue
+                reply_type, _, _, reply_id, reply_seq = ICMP_HEADER.unpack_from(recv_buffer, ihl)
+                if trace:
+                    trace.mark('parse')
+                if reply_type == ICMP_ECHO_REPLY and reply_id == icmp_id and reply_seq == icmp_seq:
+                    break
 
             # 计算RTT（往返时间）
-            rtt = (recv_time - send_time) * 1000  # 转换为毫秒
-            rtts.append(rtt)
-
-            # 解析接收到的数据包
-            # ip_header = recv_packet[:20]  # IP头部20字节
-            icmp_reply = recv_packet[20:28]  # ICMP头部8字节
-            icmp_type, icmp_code, _, _, _ = struct.unpack('!BBHHH', icmp_reply)
-
-            if icmp_type == 0:  # ICMP Echo Reply
-                string += f"\n来自 {addr[0]} 的回复: 字节=32 时间={int(rtt)}ms TTL=64"
-            else:
-                string += f"收到非Echo Reply的ICMP包: 类型={icmp_type}, 代码={icmp_code}"
-                lost_count += 1
+            rtt = timings.finish(probe, recv_ns) / 1e6  # 转换为毫秒
+            yield event(REPLY, 'ICMP', dest_addr, seq=icmp_seq, rtt=rtt,
+                        addr=addr[0], size=length - ihl - ICMP_HEADER.size, ttl=recv_buffer[8])
         except socket.timeout:
-            string += f"请求超时"
+            yield event(TIMEOUT, 'ICMP', dest_addr, seq=icmp_seq)
             lost_count += 1
         except socket.error as e:
-            string += f"发送/接收出错: {e}"
+            yield event(ERROR, 'ICMP', dest_addr, seq=icmp_seq, message=f"发送/接收出错: {e}")
             lost_count += 1
         finally:
             icmp_socket.close()
-            time.sleep(1)
-
-    # 输出统计信息
-    received = count - lost_count
-    loss_rate = (lost_count / count) * 100
-
-    string += f"\n{dest_addr} 的 Ping 统计信息:"
-    string += f"\n    数据包: 已发送 = {count}, 已接收 = {received}, 丢失 = {lost_count} ({int(loss_rate)}% 丢失)"
-
-    if rtts:
-        min_rtt = min(rtts)
-        max_rtt = max(rtts)
-        avg_rtt = sum(rtts) / len(rtts)
-        string += f"\n往返行程的估计时间(以毫秒为单位):"
-        string += f"\n    最短 = {int(min_rtt)}ms，最长 = {int(max_rtt)}ms，平均 = {int(avg_rtt)}ms"
-    return string
+
+    # 统计信息
+    yield event(SUMMARY, 'ICMP', dest_addr, sent=count, received=count - lost_count, lost=lost_count,
+                loss_rate=(lost_count / count) * 100, timings=timings.summary())
+
+
+def send_icmp_ping(dest_addr, count=4, timeout=2):
+    """Ping目标，返回格式化的文本"""
+    return to_text(ping_events(dest_addr, count, timeout))
+
+
+class PingStats:
+    """单个目标的Ping统计"""
+
+    def __init__(self, host):
+        self.host = host
+        self.sent = 0
+        self.received = 0
+        self.rtts = []  # 毫秒
+
+    @property
+    def lost(self):
+        return self.sent - self.received
+
+    @property
+    def loss_rate(self):
+        return (self.lost / self.sent) * 100 if self.sent else 0.0
+
+    @property
+    def min_rtt(self):
+        return min(self.rtts) if self.rtts else None
+
+    @property
+    def max_rtt(self):
+        return max(self.rtts) if self.rtts else None
+
+    @property
+    def avg_rtt(self):
+        return sum(self.rtts) / len(self.rtts) if self.rtts else None
+
+    def percentile(self, p):
+        return percentile(sorted(self.rtts), p)
+
+
+def _sendto(sock, packet, address, timeout=0.05):
+    """非阻塞发送，发送缓冲区满时等待可写后重试一次"""
+    try:
+        return sock.sendto(packet, address)
+    except BlockingIOError:
+        select.select([], [sock], [], timeout)
+        return sock.sendto(packet, address)
+
+
+def _sweep_summary(host_stats):
+    summary = {'min': host_stats.min_rtt, 'avg': host_stats.avg_rtt, 'max': host_stats.max_rtt,
+               'p90': host_stats.percentile(90)}
+    return event(SUMMARY, 'SWEEP', host_stats.host, sent=host_stats.sent, received=host_stats.received,
+                 lost=host_stats.lost, loss_rate=host_stats.loss_rate, timings=summary, stats=host_stats)
+
+
+def ping_sweep_events(targets, count=4, timeout=2, interval=0.2, use_ring=False, rate=None, burst=None):
+    """
+    用一个共享的ICMP套接字同时Ping多个目标
+    每轮向所有目标各发一个Echo Request，回复按 (标识符, 序列号) 在在途表中查找，
+    超时由时间轮统一处理，总耗时约为 (count - 1) * interval + timeout
+    rate 为每秒发送的Echo Request数上限（令牌桶，burst 为桶容量，见 pacing.Pacer），None 表示每轮连续发完；
+    限速时一轮发完之后再过 interval 秒开始下一轮
+    回复和超时到达时立即产生事件，最后为每个目标产生一个汇总事件（info['stats'] 为 PingStats）
+    域名先解析为地址，解析失败的目标产生错误事件，不参与Ping
+    use_ring 为 True 时通过 AF_PACKET mmap 环（capture.PacketRing）接收回复，ICMP套接字只用于发送
+    """
+    # 延迟导入：template 依赖本模块中的报文常量
+    from template import ICMPEchoTemplate
+
+    addresses = {}  # 目标 -> 地址，回复按地址匹配
+    for host in dict.fromkeys(targets):
+        try:
+            addresses[host] = socket.gethostbyname(host)
+        except (OSError, UnicodeError) as e:
+            yield event(ERROR, 'SWEEP', host, message=f"无法解析目标: {e}")
+    targets = list(addresses)
+    if not targets:
+        return
+    stats = {host: PingStats(host) for host in targets}
+    template = ICMPEchoTemplate('0.0.0.0', '0.0.0.0', os.getpid() & 0xFFFF)
+    # 在内核中过滤掉不属于本次扫描的ICMP报文；标识符回绕时只按类型过滤
+    last_id = template.icmp_id + ((len(targets) * count - 1) >> 16)
+    id_range = (template.icmp_id, last_id) if last_id <= 0xFFFF else None
+    icmp_socket = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP)
+    icmp_socket.setblocking(False)
+    ring = None
+    if use_ring:
+        try:
+            ring = PacketRing(bpf_filter=icmp_echo_reply_filter(id_range=id_range, link_offset=LINK_OFFSET))
+        except OSError:
+            icmp_socket.close()
+            raise
+    try:
+        attach_filter(icmp_socket, drop_all_filter() if ring else icmp_echo_reply_filter(id_range=id_range))
+    except OSError:
+        pass
+    enable_kernel_timestamps(icmp_socket)
+    timings = ProbeTimings()
+    wheel = TimerWheel(tick=0.01)
+    in_flight = {}  # (标识符, 序列号) -> (目标地址, 探测序号)
+    probe_no = 0
+    pacer = Pacer(rate, burst)
+    next_round = time.monotonic()
+    rounds_left = count
+    position = len(targets)  # 本轮下一个要发送的目标，等于 len(targets) 时本轮已发完
+    buffer = bytearray(2048)
+    replies = []  # 本次接收匹配到的回复事件
+    sample = profiling.sample
+
+    def handle(view, length, recv_ns):
+        """匹配一个收到的IP+ICMP报文（套接字缓冲区或抓包环中的视图）"""
+        ihl = (view[0] & 0x0F) * 4
+        if length < ihl + ICMP_HEADER.size:
+            return
+        icmp_type, _, _, icmp_id, seq = ICMP_HEADER.unpack_from(view, ihl)
+        if icmp_type != ICMP_ECHO_REPLY:
+            return
+        probe = in_flight.get((icmp_id, seq))
+        if probe is None or addresses[probe[0]] != socket.inet_ntoa(view[12:16]):
+            return
+        del in_flight[(icmp_id, seq)]
+        wheel.cancel((icmp_id, seq))
+        host_stats = stats[probe[0]]
+        host_stats.received += 1
+        rtt = timings.finish(probe[1], recv_ns) / 1e6
+        host_stats.rtts.append(rtt)
+        replies.append(event(REPLY, 'SWEEP', probe[0], seq=probe[2], rtt=rtt))
+
+    if ring is not None:
+        ring.add_handler(socket.IPPROTO_ICMP, handle)
+
+    try:
+        while rounds_left or position < len(targets) or in_flight:
+            if rounds_left and position == len(targets) and time.monotonic() >= next_round:
+                position = 0
+                rounds_left -= 1
+            wait = None
+            while position < len(targets):
+                delay = pacer.delay()
+                if delay:
+                    wait = delay
+                    break
+                pacer.take()
+                host = targets[position]
+                position += 1
+                if position == len(targets):
+                    next_round = time.monotonic() + interval
+                # 序列号用完一圈后换标识符，保证在途探测的 (id, seq) 唯一
+                icmp_id = (template.icmp_id + (probe_no >> 16)) & 0xFFFF
+                seq = probe_no & 0xFFFF
+                probe_no += 1
+                trace = sample('SWEEP')
+                template.build(seq, icmp_id=icmp_id)
+                if trace:
+                    trace.mark('build')
+                key = (icmp_id, seq)
+                # 发送失败也计入已发送，按丢失统计
+                stats[host].sent += 1
+                probe = timings.start()
+                try:
+                    _sendto(icmp_socket, template.transport, (addresses[host], 0))
+                    if trace:
+                        trace.mark('sendto')
+                except OSError as e:
+                    yield event(ERROR, 'SWEEP', host, seq=seq, message=f"发送失败: {e}")
+                    continue
+                in_flight[key] = (host, probe, seq)
+                wheel.add(key, timeout)
+            if not rounds_left and position == len(targets) and not in_flight:
+                # 最后一轮全部发送失败，没有需要等待的回复
+                break
+
+            # 等待回复，最长等到下一个定时器 tick、下一个令牌或下一轮发送
+            timer = wheel.next_timeout()
+            if timer is not None:
+                wait = timer if wait is None else min(wait, timer)
+            if rounds_left and position == len(targets):
+                until_round = max(0.0, next_round - time.monotonic())
+                wait = until_round if wait is None else min(wait, until_round)
+            if ring is not None:
+                ring.poll_once(wait)
+            elif select.select([icmp_socket], [], [], wait)[0]:
+                while True:
+                    try:
+                        length, _, recv_ns = recv_with_timestamp(icmp_socket, buffer)
+                    except BlockingIOError:
+                        break
+                    handle(buffer, length, recv_ns)
+            yield from replies
+            replies.clear()
+
+            for key in wheel.advance():
+                probe = in_flight.pop(key, None)
+                if probe is not None:
+                    yield event(TIMEOUT, 'SWEEP', probe[0], seq=probe[2])
+    finally:
+        icmp_socket.close()
+        if ring is not None:
+            ring.close()
+
+    for host_stats in stats.values():
+        yield _sweep_summary(host_stats)
+
+
+def ping_sweep(targets, count=4, timeout=2, interval=0.2, use_ring=False, rate=None, burst=None):
+    """同 ping_sweep_events，只返回 {目标地址: PingStats}"""
+    return {e.target: e.info['stats']
+            for e in ping_sweep_events(targets, count, timeout, interval, use_ring, rate, burst) if e.kind == SUMMARY}
+
+
+def format_sweep_result(stats):
+    """把 ping_sweep 的结果格式化为文本，每个目标一行"""
+    sink = TextSink()
+    lines = [sink.format(_sweep_summary(host_stats)) for host_stats in stats.values()]
+    alive = sum(1 for host_stats in stats.values() if host_stats.rtts)
+    lines.append(f"共 {len(stats)} 个目标, {alive} 个有回复")
+    return '\n'.join(lines)
@@ -2,53 +2,68 @@ import random
 import socket
 import struct
 
+import pcap
+import profiling
 from checksum import calculate_checksum
+from events import ERROR, SENT, event, to_text
 
 
-def build_ip_header(src_ip, dst_ip, protocol, len_data):
+# IP头部格式，预编译避免每次解析格式串
+IP_HEADER = struct.Struct('!BBHHHBBH4s4s')
+IP_CHECKSUM = struct.Struct('!H')  # 校验和字段，位于偏移10
+
+
+def ip_to_int(ip):
+    """把点分十进制地址转换为32位整数，已经是整数时原样返回"""
+    if isinstance(ip, int):
+        return ip
+    return int.from_bytes(socket.inet_aton(ip), 'big')
+
+
+def build_ip_header(src_ip, dst_ip, protocol, len_data, ttl=64, ip_id=None):
     """
     构建IP头部并计算校验和
+    ip_id 为 None 时随机生成；为0时内核会自行填写（IP_HDRINCL）
     """
     ip_version = 4  # IPv4
     ip_ihl = 5  # 头部长度，5 * 4 = 20字节
     ip_ver_ihl = (ip_version << 4) + ip_ihl
     ip_tos = 0  # 服务类型
     ip_total_len = 20+len_data  # IP头部的长度
-    ip_id = random.randint(1, 65535)  # 随机生成标识符
+    if ip_id is None:
+        ip_id = random.randint(1, 65535)  # 随机生成标识符
     ip_frag_off = 0  # 分段偏移
-    ip_ttl = 64  # 生存时间
+    ip_ttl = ttl  # 生存时间
     ip_proto = protocol  # 协议类型
     ip_check = 0  # 校验和初始值为0
-    ip_saddr = struct.unpack("!L", socket.inet_aton(src_ip))[0]  # 源IP地址
-    ip_daddr = struct.unpack("!L", socket.inet_aton(dst_ip))[0]  # 目标IP地址
-
-    # 打包IP头部
-    ip_header = struct.pack('!BBHHHBBHLL',
-                            ip_ver_ihl,  # 版本和头部长度
-                            ip_tos,  # 服务类型
-                            ip_total_len,  # 总长度
-                            ip_id,  # 标识
-                            ip_frag_off,  # 标志和片偏移
-                            ip_ttl,  # 生存时间
-                            ip_proto,  # 协议
-                            ip_check,  # 校验和
-                            ip_saddr,  # 源IP地址
-                            ip_daddr  # 目标IP地址
-                            )
-
-    # 计算校验和
-    ip_check = calculate_checksum(ip_header)
+    ip_saddr = socket.inet_aton(src_ip)  # 源IP地址
+    ip_daddr = socket.inet_aton(dst_ip)  # 目标IP地址
 
-    # 重新打包IP头部（包含校验和）
-    ip_header = struct.pack('!BBHHHBBHLL',
-                            ip_ver_ihl, ip_tos, ip_total_len,
-                            ip_id, ip_frag_off, ip_ttl, ip_proto,
-                            ip_check, ip_saddr, ip_daddr)
+    # 打包IP头部（校验和先为0）
+    ip_header = bytearray(IP_HEADER.size)
+    IP_HEADER.pack_into(ip_header, 0,
+                        ip_ver_ihl,  # 版本和头部长度
+                        ip_tos,  # 服务类型
+                        ip_total_len,  # 总长度
+                        ip_id,  # 标识
+                        ip_frag_off,  # 标志和片偏移
+                        ip_ttl,  # 生存时间
+                        ip_proto,  # 协议
+                        ip_check,  # 校验和
+                        ip_saddr,  # 源IP地址
+                        ip_daddr  # 目标IP地址
+                        )
 
-    return ip_header
+    # 计算校验和并原地写回，不再重新打包整个头部
+    ip_check = calculate_checksum(ip_header)
+    IP_CHECKSUM.pack_into(ip_header, 10, ip_check)
 
+    return bytes(ip_header)
 
-def send_ip_packet(src_ip, dst_ip, data=b'Hello, Raw IP!'):
+
+def ip_events(src_ip, dst_ip, data=b'Hello, Raw IP!'):
+    """发送原始IP包，产生 已发送 或 错误 事件"""
+    trace = profiling.sample('IP')
     # 创建原始套接字
     try:
         # IPPROTO_RAW 表示我们将提供IP头部
@@ -56,18 +71,35 @@ def send_ip_packet(src_ip, dst_ip, data=b'Hello, Raw IP!'):
         # 设置 IP_HDRINCL 选项，告诉内核我们将自己构建IP头
         s.setsockopt(socket.IPPROTO_IP, socket.IP_HDRINCL, 1)
     except socket.error as e:
-        print(f'Socket 创建失败: {e}')
+        yield event(ERROR, 'IP', dst_ip, message=f'Socket 创建失败: {e}')
         return
+    if trace:
+        trace.mark('socket')
 
-    ip_header = build_ip_header(src_ip, dst_ip, socket.IPPROTO_RAW, len(data));
-
-    # 发送数据包
-    packet = ip_header + data
     try:
+        # IP头的打包和校验和在 build_ip_header 里一起完成
+        try:
+            ip_header = build_ip_header(src_ip, dst_ip, socket.IPPROTO_RAW, len(data))
+        except (socket.error, struct.error) as e:
+            yield event(ERROR, 'IP', dst_ip, message=f'构建报文失败: {e}')
+            return
+
+        # 发送数据包
+        packet = ip_header + data
+        if trace:
+            trace.mark('build')
         s.sendto(packet, (dst_ip, 80))
-        return f'成功发送IP包到 {dst_ip}'
+        if trace:
+            trace.mark('sendto')
+        pcap.record(packet)
+        yield event(SENT, 'IP', dst_ip, length=len(packet))
     except socket.error as e:
-        return f'发送失败: {e}'
+        yield event(ERROR, 'IP', dst_ip, message=f'发送失败: {e}')
     finally:
         s.close()
 
+
+def send_ip_packet(src_ip, dst_ip, data=b'Hello, Raw IP!'):
+    """发送原始IP包，返回格式化的文本"""
+    return to_text(ip_events(src_ip, dst_ip, data))
+
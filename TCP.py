@@ -1,10 +1,13 @@
-import random
 import socket
 import struct
 import time
 
-from checksum import calculate_checksum
-from IP import build_ip_header
+import pcap
+import profiling
+from checksum import transport_checksum
+from events import ERROR, SENT, event, to_text
+from IP import build_ip_header, ip_to_int
+from syn_cookie import default_cookie
 
 
 # TCP选项常量定义
@@ -45,35 +48,65 @@ def build_tcp_options():
     return mss_option, window_scale_option, sack_option
 
 
+def parse_tcp_options(data):
+    """
+    解析TCP选项字段（与 build_tcp_options 相同的类型-长度-值格式，NOP 用于对齐）
+    返回 {'mss': 值, 'window_scale': 移位数, 'sack_permitted': True, 'timestamp': (TSval, TSecr)}，
+    只包含出现的选项；长度字段不合法时停止解析
+    """
+    result = {}
+    offset = 0
+    end = len(data)
+    while offset < end:
+        kind = data[offset]
+        if kind == TCPOption.KIND_END:
+            break
+        if kind == TCPOption.KIND_NOP:
+            offset += 1
+            continue
+        if offset + 2 > end:
+            break
+        length = data[offset + 1]
+        if length < 2 or offset + length > end:
+            break
+        if kind == TCPOption.KIND_MSS and length == 4:
+            result['mss'] = int.from_bytes(data[offset + 2:offset + 4], 'big')
+        elif kind == TCPOption.KIND_WINDOW and length == 3:
+            result['window_scale'] = data[offset + 2]
+        elif kind == TCPOption.KIND_SACK_PERMITTED and length == 2:
+            result['sack_permitted'] = True
+        elif kind == TCPOption.KIND_TIMESTAMP and length == 10:
+            result['timestamp'] = (int.from_bytes(data[offset + 2:offset + 6], 'big'),
+                                   int.from_bytes(data[offset + 6:offset + 10], 'big'))
+        offset += length
+    return result
+
+
+# TCP头部格式（不含选项），预编译避免每次解析格式串
+TCP_HEADER = struct.Struct('!HHLLHHHH')
+TCP_CHECKSUM = struct.Struct('!H')  # 校验和字段，位于TCP头偏移16
+# 选项字段是固定的，模块加载时打包一次即可
+TCP_OPTIONS = struct.pack('!LLL', *build_tcp_options())
+TCP_WINDOW = socket.htons(5840)  # 标准窗口大小
+TCP_FLAG_SYN = 0x002
+
+
 def calculate_tcp_checksum(src_ip, dst_ip, tcp_header, data=b''):
     """
     计算TCP校验和，包含TCP伪头部
     伪头部包含: 源IP、目标IP、协议号、TCP长度
     """
-    # 创建伪头部
-    protocol = socket.IPPROTO_TCP
-    tcp_length = len(tcp_header) + len(data)
-
     # 将IP地址转换为二进制
     src_ip = socket.inet_aton(src_ip)
     dst_ip = socket.inet_aton(dst_ip)
 
-    # 构建伪头部
-    pseudo_header = struct.pack('!4s4sBBH',
-                                src_ip,  # 源IP
-                                dst_ip,  # 目标IP
-                                0,  # 占位符
-                                protocol,  # 协议号
-                                tcp_length  # TCP长度
-                                )
-
-    # 使用通用的calculate_checksum函数来计算伪头部和TCP数据的校验和
-    checksum_data = pseudo_header + tcp_header + data
-    return calculate_checksum(checksum_data)
+    # 伪头部的求和由通用的校验和引擎完成
+    return transport_checksum(src_ip, dst_ip, socket.IPPROTO_TCP, tcp_header + data)
 
 
-def send_tcp_syn(src_ip, src_port, dst_ip, dst_port):
-    """发送TCP SYN包并接收SYN-ACK响应"""
+def tcp_syn_events(src_ip, src_port, dst_ip, dst_port):
+    """发送TCP SYN包，产生 已发送 或 错误 事件"""
+    trace = profiling.sample('TCP')
     try:
         # IPPROTO_RAW 表示我们将提供IP头部
         s = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_RAW)
@@ -81,63 +114,71 @@ def send_tcp_syn(src_ip, src_port, dst_ip, dst_port):
         s.setsockopt(socket.IPPROTO_IP, socket.IP_HDRINCL, 1)
         s.settimeout(5)
     except socket.error as e:
-        print(f'Socket 创建失败: {e}')
+        yield event(ERROR, 'TCP', dst_ip, message=f'Socket 创建失败: {e}')
         return
+    if trace:
+        trace.mark('socket')
 
-    ip_header = build_ip_header(src_ip, dst_ip, socket.IPPROTO_TCP, 32)
-
-    # TCP头部字段
-    seq_num = random.randint(0, 2 ** 32 - 1)  # 随机序列号
-    ack_num = 0  # SYN包中ACK为0
-
-    # 数据偏移（4位）
-    tcp_offset = 8
-    flags = 0x002
-
-    # 窗口大小和紧急指针
-    tcp_window = socket.htons(5840)  # 标准窗口大小
-    tcp_urgent = 0
-    # tcp选项
-    tcp_options = build_tcp_options()
-    
-    # 构建TCP头部（不含校验和）
-    tcp_header = struct.pack('!HHLLHHHHLLL',
-                           int(src_port),    # 源端口
-                           int(dst_port),    # 目标端口
-                           seq_num,          # 序列号
-                           ack_num,          # 确认号
-                           0x8002,           # 数据偏移和标志位
-                           tcp_window,       # 窗口大小
-                           0,                # 校验和（先设为0）
-                           tcp_urgent,       # 紧急指针
-                           *tcp_options      # TCP选项
-                           )
-    # 计算TCP校验和
-    tcp_checksum = calculate_tcp_checksum(src_ip, dst_ip, tcp_header)
-
-    tcp_header = struct.pack('!HHLLHHHHLLL',
-                           int(src_port),    # 源端口
-                           int(dst_port),    # 目标端口
-                           seq_num,          # 序列号
-                           ack_num,          # 确认号
-                           0x8002,           # 数据偏移和标志位
-                           tcp_window,       # 窗口大小
-                           tcp_checksum,     # 校验和（先设为0）
-                           tcp_urgent,       # 紧急指针
-                           *tcp_options      # TCP选项
-                           )
-
-    # 修改：发送完整的IP+TCP数据包
-    packet = ip_header + tcp_header
     try:
+        try:
+            # TCP头部字段
+            # 序列号由源/目标地址和目标端口的带密钥哈希算出，回复可以用 default_cookie().check 校验
+            seq_num = default_cookie().seq(ip_to_int(src_ip), ip_to_int(dst_ip), int(dst_port))
+            ack_num = 0  # SYN包中ACK为0
+
+            # 数据偏移（4位，单位为4字节）和标志位
+            tcp_offset = (TCP_HEADER.size + len(TCP_OPTIONS)) // 4
+            flags = TCP_FLAG_SYN
+
+            # 紧急指针
+            tcp_urgent = 0
+
+            # 构建TCP头部（校验和先为0），选项直接使用预先打包好的字节
+            tcp_header = bytearray(TCP_HEADER.size + len(TCP_OPTIONS))
+            TCP_HEADER.pack_into(tcp_header, 0,
+                                 int(src_port),    # 源端口
+                                 int(dst_port),    # 目标端口
+                                 seq_num,          # 序列号
+                                 ack_num,          # 确认号
+                                 (tcp_offset << 12) | flags,  # 数据偏移和标志位
+                                 TCP_WINDOW,       # 窗口大小
+                                 0,                # 校验和（先设为0）
+                                 tcp_urgent        # 紧急指针
+                                 )
+            tcp_header[TCP_HEADER.size:] = TCP_OPTIONS
+            if trace:
+                trace.mark('build')
+
+            # 计算TCP校验和并原地写回
+            tcp_checksum = calculate_tcp_checksum(src_ip, dst_ip, tcp_header)
+            TCP_CHECKSUM.pack_into(tcp_header, 16, tcp_checksum)
+            if trace:
+                trace.mark('checksum')
+
+            ip_header = build_ip_header(src_ip, dst_ip, socket.IPPROTO_TCP, len(tcp_header))
+
+            # 修改：发送完整的IP+TCP数据包
+            packet = ip_header + tcp_header
+            if trace:
+                trace.mark('ip_header')
+        except (socket.error, struct.error, ValueError) as e:
+            yield event(ERROR, 'TCP', dst_ip, message=f'构建报文失败: {e}')
+            return
         s.sendto(packet, (dst_ip, int(dst_port)))
-        # 由于不需要发送第三次握手报文，这里可以直接关闭socket
-        s.close()
-        return f'成功发送TCP SYN包到 {dst_ip}:{dst_port}\n  源端口: {src_port}\n  序列号: {seq_num}'
-
+        if trace:
+            trace.mark('sendto')
+        pcap.record(packet)
+        yield event(SENT, 'TCP', dst_ip, src_port=src_port, dst_port=dst_port, seq=seq_num)
     except socket.error as e:
+        yield event(ERROR, 'TCP', dst_ip, message=f'发送失败: {e}')
+    finally:
+        # 由于不需要发送第三次握手报文，这里可以直接关闭socket（完整的握手探测见 handshake.py）
         s.close()
-        return f'发送失败: {e}'
+
+
+def send_tcp_syn(src_ip, src_port, dst_ip, dst_port):
+    """发送TCP SYN包，返回格式化的文本"""
+    return to_text(tcp_syn_events(src_ip, src_port, dst_ip, dst_port))
 
 
 if __name__ == "__main__":
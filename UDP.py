@@ -1,37 +1,82 @@
 import socket
 import struct
 
+import pcap
+import profiling
+from checksum import transport_checksum
+from events import ERROR, SENT, event, to_text
 
-def send_udp_packet(src_port, dst_ip, dst_port, data=b'Hello UDP!'):
+# UDP头部格式，预编译避免每次解析格式串
+UDP_HEADER = struct.Struct('!HHHH')
+UDP_CHECKSUM = struct.Struct('!H')  # 校验和字段，位于UDP头偏移6
+
+
+def calculate_udp_checksum(src_ip, dst_ip, segment):
+    """
+    计算UDP校验和，包含伪头部
+    结果为0时按RFC 768写成0xFFFF（0表示发送方没有计算校验和）
+    """
+    checksum = transport_checksum(socket.inet_aton(src_ip), socket.inet_aton(dst_ip), socket.IPPROTO_UDP, segment)
+    return checksum or 0xFFFF
+
+
+def udp_events(src_port, dst_ip, dst_port, data=b'Hello UDP!'):
+    """发送UDP包，产生 已发送 或 错误 事件"""
+    trace = profiling.sample('UDP')
     try:
         # 创建原始套接字
         s = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_UDP)
     except socket.error as e:
-        return f'Socket 创建失败: {e}'
+        yield event(ERROR, 'UDP', dst_ip, message=f'Socket 创建失败: {e}')
+        return
+    if trace:
+        trace.mark('socket')
 
-    # UDP 头部字段
-    src_port = int(src_port)  # 源端口
-    dst_port = int(dst_port)  # 目标端口
-    udp_length = 8 + len(data)  # UDP头部长度(8) + 数据长度
-    udp_checksum = 0  # 校验和初始值为0
+    try:
+        try:
+            # UDP 头部字段
+            src_port = int(src_port)  # 源端口
+            dst_port = int(dst_port)  # 目标端口
+            udp_length = 8 + len(data)  # UDP头部长度(8) + 数据长度
+            udp_checksum = 0  # 校验和初始值为0
 
-    # 打包UDP头部（不含校验和）
-    udp_header = struct.pack('!HHHH',
-                             src_port,  # 源端口
-                             dst_port,  # 目标端口
-                             udp_length,  # UDP总长度
-                             udp_checksum  # 校验和
-                             )
+            # 打包UDP头部（校验和先为0）和数据
+            packet = bytearray(udp_length)
+            UDP_HEADER.pack_into(packet, 0,
+                                 src_port,  # 源端口
+                                 dst_port,  # 目标端口
+                                 udp_length,  # UDP总长度
+                                 udp_checksum  # 校验和
+                                 )
+            packet[UDP_HEADER.size:] = data
+            if trace:
+                trace.mark('build')
+        except (struct.error, ValueError) as e:
+            yield event(ERROR, 'UDP', dst_ip, message=f'构建报文失败: {e}')
+            return
 
-    # 完整的UDP数据包
-    packet = udp_header + data
+        # IP头由内核构建，connect 后从 getsockname 得到内核将使用的源地址，用于伪头部
+        s.connect((dst_ip, 0))
+        src_ip = s.getsockname()[0]
+        if trace:
+            trace.mark('connect')
+        udp_checksum = calculate_udp_checksum(src_ip, dst_ip, packet)
+        UDP_CHECKSUM.pack_into(packet, 6, udp_checksum)
+        if trace:
+            trace.mark('checksum')
 
-    try:
         # 发送数据包
-        s.sendto(packet, (dst_ip, 0))
-        return (f'成功发送UDP包到 {dst_ip}:{dst_port}\n  源端口: {src_port}\n  目标端口: {dst_port}\n  数据长度: {len(data)} 字节'
-                f'\n  数据: {data}')
+        s.send(packet)
+        if trace:
+            trace.mark('sendto')
+        pcap.record(packet, dst_ip, socket.IPPROTO_UDP, src_ip)
+        yield event(SENT, 'UDP', dst_ip, src_port=src_port, dst_port=dst_port, data=data, checksum=udp_checksum)
     except socket.error as e:
-        return f'发送失败: {e}'
+        yield event(ERROR, 'UDP', dst_ip, message=f'发送失败: {e}')
     finally:
         s.close()
+
+
+def send_udp_packet(src_port, dst_ip, dst_port, data=b'Hello UDP!'):
+    """发送UDP包，返回格式化的文本"""
+    return to_text(udp_events(src_port, dst_ip, dst_port, data))
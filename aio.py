@@ -0,0 +1,306 @@
+"""
+asyncio 版本的各协议发送接口
+
+所有套接字都是非阻塞的：发送用 loop.sock_sendto，接收通过 loop.add_reader 注册回调，
+回调按报文中的标识（ICMP 的 (id, seq)、DNS 的事务ID）把回复分发给等待中的 Future。
+这样一个事件循环里可以同时进行成千上万个探测和查询，不需要线程。
+"""
+import asyncio
+import socket
+from dataclasses import dataclass, field
+
+from bpf import attach_filter, icmp_echo_reply_filter
+from DNS import build_dns_query, parse_dns_response
+from ICMP import ICMP_ECHO_REPLY, ICMP_HEADER, PingStats, next_icmp_id
+from IP import build_ip_header
+from syn_cookie import default_cookie
+from template import ICMPEchoTemplate, TCPSynTemplate, UDPTemplate
+from timing import enable_kernel_timestamps, now_ns, recv_with_timestamp
+
+
+@dataclass
+class SendResult:
+    """单个报文的发送结果"""
+    protocol: str
+    dst_ip: str
+    dst_port: int = 0
+    ok: bool = True
+    error: str = None
+    info: dict = field(default_factory=dict)
+
+
+@dataclass
+class DNSResult:
+    """一次DNS查询的结果"""
+    domain: str
+    server: str
+    answers: list = field(default_factory=list)
+    error: str = None
+
+
+def _raw_socket(protocol, hdrincl=False):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, protocol)
+    if hdrincl:
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_HDRINCL, 1)
+    sock.setblocking(False)
+    return sock
+
+
+async def _send(protocol, sock, packet, dst_ip, dst_port, info):
+    """在给定套接字上异步发送，失败时返回 ok=False 的结果而不是抛出异常"""
+    loop = asyncio.get_running_loop()
+    try:
+        await loop.sock_sendto(sock, packet, (dst_ip, 0))
+    except OSError as e:
+        return SendResult(protocol, dst_ip, dst_port, ok=False, error=str(e))
+    return SendResult(protocol, dst_ip, dst_port, info=info)
+
+
+async def send_ip_packet_async(src_ip, dst_ip, data=b'Hello, Raw IP!', sock=None):
+    """异步发送原始IP报文，可传入共享的 IP_HDRINCL 套接字"""
+    own = sock is None
+    try:
+        if own:
+            sock = _raw_socket(socket.IPPROTO_RAW, hdrincl=True)
+    except OSError as e:
+        return SendResult('IP', dst_ip, ok=False, error=str(e))
+    try:
+        packet = build_ip_header(src_ip, dst_ip, socket.IPPROTO_RAW, len(data)) + data
+        return await _send('IP', sock, packet, dst_ip, 0, {'length': len(packet)})
+    finally:
+        if own:
+            sock.close()
+
+
+async def send_tcp_syn_async(src_ip, src_port, dst_ip, dst_port, sock=None, seq=None):
+    """异步发送TCP SYN，可传入共享的 IP_HDRINCL 套接字"""
+    own = sock is None
+    try:
+        if own:
+            sock = _raw_socket(socket.IPPROTO_RAW, hdrincl=True)
+    except OSError as e:
+        return SendResult('TCP', dst_ip, int(dst_port), ok=False, error=str(e))
+    try:
+        template = TCPSynTemplate(src_ip, dst_ip, src_port, dst_port)
+        if seq is None:
+            seq = default_cookie().seq(template.saddr, template.daddr, int(dst_port))
+        packet = template.build(seq)
+        return await _send('TCP', sock, packet, dst_ip, int(dst_port), {'src_port': int(src_port), 'seq': seq})
+    finally:
+        if own:
+            sock.close()
+
+
+async def send_udp_packet_async(src_ip, src_port, dst_ip, dst_port, data=b'Hello UDP!', sock=None):
+    """异步发送UDP报文（带伪头部校验和），可传入共享的 IP_HDRINCL 套接字"""
+    own = sock is None
+    try:
+        if own:
+            sock = _raw_socket(socket.IPPROTO_RAW, hdrincl=True)
+    except OSError as e:
+        return SendResult('UDP', dst_ip, int(dst_port), ok=False, error=str(e))
+    try:
+        packet = UDPTemplate(src_ip, dst_ip, src_port, dst_port, data).build()
+        return await _send('UDP', sock, packet, dst_ip, int(dst_port), {'src_port': int(src_port), 'length': len(data)})
+    finally:
+        if own:
+            sock.close()
+
+
+class _Demux:
+    """
+    一个非阻塞套接字 + 在途请求表
+    add_reader 回调读出所有可读报文，用 match(报文, 地址) 得到的 key 找到对应的 Future，
+    Future 的结果为 (报文, 地址, 接收时间ns)，接收时间优先取内核时间戳
+    """
+
+    def __init__(self, sock, match, bufsize=4096):
+        self.sock = sock
+        self._match = match
+        self._waiters = {}
+        self._buffer = bytearray(bufsize)
+        self._loop = asyncio.get_running_loop()
+        enable_kernel_timestamps(sock)
+        self._loop.add_reader(sock.fileno(), self._on_readable)
+
+    def _on_readable(self):
+        buffer = self._buffer
+        while True:
+            try:
+                length, addr, recv_ns = recv_with_timestamp(self.sock, buffer)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                return
+            data = bytes(buffer[:length])
+            key = self._match(data, addr)
+            waiter = self._waiters.pop(key, None)
+            if waiter is not None and not waiter.done():
+                waiter.set_result((data, addr, recv_ns))
+
+    def expect(self, key):
+        waiter = self._loop.create_future()
+        self._waiters[key] = waiter
+        return waiter
+
+    def discard(self, key):
+        self._waiters.pop(key, None)
+
+    def __contains__(self, key):
+        return key in self._waiters
+
+    def close(self):
+        self._loop.remove_reader(self.sock.fileno())
+        for waiter in self._waiters.values():
+            if not waiter.done():
+                waiter.cancel()
+        self._waiters.clear()
+        self.sock.close()
+
+
+def _match_echo_reply(data, addr):
+    ihl = (data[0] & 0x0F) * 4
+    if len(data) < ihl + ICMP_HEADER.size:
+        return None
+    icmp_type, _, _, icmp_id, seq = ICMP_HEADER.unpack_from(data, ihl)
+    if icmp_type != ICMP_ECHO_REPLY:
+        return None
+    return addr[0], icmp_id, seq
+
+
+class AsyncPinger:
+    """
+    共享一个ICMP套接字的异步Ping，必须在事件循环中创建
+    用法: async with AsyncPinger() as pinger: stats = await pinger.ping('1.1.1.1')
+    标识符由 ICMP.next_icmp_id 分配，同一进程中的多个 AsyncPinger 和 ping_events 不会互相抢回复
+    """
+
+    def __init__(self):
+        sock = _raw_socket(socket.IPPROTO_ICMP)
+        attach_filter(sock, icmp_echo_reply_filter())
+        self._demux = _Demux(sock, _match_echo_reply)
+        self._icmp_id = next_icmp_id()
+        self._seq = 0
+        self._template = ICMPEchoTemplate('0.0.0.0', '0.0.0.0', self._icmp_id)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._demux.close()
+
+    async def _echo(self, address, timeout):
+        """向地址 address 发送一个Echo Request，返回RTT（毫秒），超时返回 None"""
+        loop = asyncio.get_running_loop()
+        icmp_id, seq = self._icmp_id, self._seq
+        self._seq = (seq + 1) & 0xFFFF
+        if not self._seq:
+            # 序列号用完一圈后换一个新分配的标识符，保证在途探测的 (id, seq) 唯一
+            self._icmp_id = next_icmp_id()
+        key = (address, icmp_id, seq)
+        waiter = self._demux.expect(key)
+        # 模板缓冲区会被下一次 build 覆盖，这里复制一份交给事件循环
+        self._template.build(seq, icmp_id=icmp_id)
+        packet = bytes(self._template.transport)
+        send_ns = now_ns()
+        try:
+            await loop.sock_sendto(self._demux.sock, packet, (address, 0))
+            _, _, recv_ns = await asyncio.wait_for(waiter, timeout)
+        except (asyncio.TimeoutError, OSError):
+            return None
+        finally:
+            self._demux.discard(key)
+        return max(0, recv_ns - send_ns) / 1e6
+
+    async def ping(self, host, count=4, timeout=2, interval=1):
+        """
+        对一个目标Ping count次，返回 PingStats（host 为传入的目标）
+        域名先解析为地址（回复按源地址匹配），解析失败时抛出 socket.gaierror
+        """
+        loop = asyncio.get_running_loop()
+        infos = await loop.getaddrinfo(host, None, family=socket.AF_INET, type=socket.SOCK_RAW)
+        address = infos[0][4][0]
+        stats = PingStats(host)
+        for i in range(count):
+            if i:
+                await asyncio.sleep(interval)
+            stats.sent += 1
+            rtt = await self._echo(address, timeout)
+            if rtt is not None:
+                stats.received += 1
+                stats.rtts.append(rtt)
+        return stats
+
+    async def ping_many(self, hosts, count=4, timeout=2, interval=1):
+        """并发Ping多个目标，返回 {目标地址: PingStats}"""
+        results = await asyncio.gather(*(self.ping(host, count, timeout, interval) for host in hosts))
+        return {stats.host: stats for stats in results}
+
+
+async def icmp_ping_async(dest_addr, count=4, timeout=2, interval=1):
+    """异步Ping单个目标，返回 PingStats"""
+    async with AsyncPinger() as pinger:
+        return await pinger.ping(dest_addr, count, timeout, interval)
+
+
+def _match_dns_reply(data, addr):
+    if len(data) < 12:
+        return None
+    return addr[0], int.from_bytes(data[:2], 'big')
+
+
+class AsyncDNSClient:
+    """
+    共享一个UDP套接字的异步DNS查询，按 (服务器, 事务ID) 匹配回复，必须在事件循环中创建
+    """
+
+    def __init__(self, dns_server="8.8.8.8"):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setblocking(False)
+        self.dns_server = dns_server
+        self._demux = _Demux(sock, _match_dns_reply)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._demux.close()
+
+    async def query(self, domain, timeout=5):
+        loop = asyncio.get_running_loop()
+        query_packet, transaction_id = build_dns_query(domain)
+        key = (self.dns_server, transaction_id)
+        # 事务ID冲突时重新生成
+        while key in self._demux:
+            query_packet, transaction_id = build_dns_query(domain)
+            key = (self.dns_server, transaction_id)
+        waiter = self._demux.expect(key)
+        try:
+            await loop.sock_sendto(self._demux.sock, query_packet, (self.dns_server, 53))
+            response, _, _ = await asyncio.wait_for(waiter, timeout)
+        except asyncio.TimeoutError:
+            return DNSResult(domain, self.dns_server, error="查询超时")
+        except OSError as e:
+            return DNSResult(domain, self.dns_server, error=str(e))
+        finally:
+            self._demux.discard(key)
+
+        answers = parse_dns_response(response, transaction_id)
+        if not isinstance(answers, list):
+            return DNSResult(domain, self.dns_server, error=answers)
+        return DNSResult(domain, self.dns_server, answers)
+
+    async def query_many(self, domains, timeout=5):
+        return await asyncio.gather(*(self.query(domain, timeout) for domain in domains))
+
+
+async def dns_query_async(domain, dns_server="8.8.8.8", timeout=5):
+    """异步查询单个域名，返回 DNSResult"""
+    async with AsyncDNSClient(dns_server) as client:
+        return await client.query(domain, timeout)
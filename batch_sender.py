@@ -0,0 +1,225 @@
+"""
+批量发送原始IP报文
+
+复用一个 IP_HDRINCL 套接字，报文先复制进预先分配好的槽位（每个槽位一个 iovec），
+凑满一批后通过 ctypes 调用 sendmmsg 一次系统调用发出；没有 sendmmsg 的平台退化为逐个 sendto。
+目的地址直接取自报文IP头（偏移16），所以既可以发送 build_ip_header 拼出的报文，
+也可以发送 template.py 中模板反复改写的同一个缓冲区。
+"""
+import ctypes
+import ctypes.util
+import errno
+import socket
+import time
+
+import profiling
+from IP import IP_HEADER
+
+
+class _IOVec(ctypes.Structure):
+    _fields_ = [('iov_base', ctypes.c_void_p), ('iov_len', ctypes.c_size_t)]
+
+
+class _SockAddrIn(ctypes.Structure):
+    _fields_ = [('sin_family', ctypes.c_ushort),
+                ('sin_port', ctypes.c_uint16),
+                ('sin_addr', ctypes.c_uint8 * 4),
+                ('sin_zero', ctypes.c_uint8 * 8)]
+
+
+class _MsgHdr(ctypes.Structure):
+    _fields_ = [('msg_name', ctypes.c_void_p),
+                ('msg_namelen', ctypes.c_uint32),
+                ('msg_iov', ctypes.POINTER(_IOVec)),
+                ('msg_iovlen', ctypes.c_size_t),
+                ('msg_control', ctypes.c_void_p),
+                ('msg_controllen', ctypes.c_size_t),
+                ('msg_flags', ctypes.c_int)]
+
+
+class _MMsgHdr(ctypes.Structure):
+    _fields_ = [('msg_hdr', _MsgHdr), ('msg_len', ctypes.c_uint)]
+
+
+def _load_sendmmsg():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        sendmmsg = libc.sendmmsg
+    except (OSError, AttributeError, TypeError):
+        return None
+    sendmmsg.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int]
+    sendmmsg.restype = ctypes.c_int
+    return sendmmsg
+
+
+_sendmmsg = _load_sendmmsg()
+
+
+class BatchStats:
+    """发送统计"""
+
+    def __init__(self):
+        self.packets = 0
+        self.bytes = 0
+        self.batches = 0
+        self.errors = 0
+        self.elapsed = 0.0
+
+    @property
+    def pps(self):
+        return self.packets / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def bps(self):
+        """比特/秒"""
+        return self.bytes * 8 / self.elapsed if self.elapsed else 0.0
+
+
+class BatchSender:
+    """
+    批量发送器
+    batch_size 为每次系统调用发送的报文数，slot_size 为单个报文的最大长度
+    on_batch(已发送数, 耗时秒) 在每批发出后调用，可用于实时统计
+    """
+
+    def __init__(self, batch_size=64, slot_size=2048, sock=None, on_batch=None, use_sendmmsg=True):
+        if sock is None:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_RAW)
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_HDRINCL, 1)
+        self.sock = sock
+        self.batch_size = batch_size
+        self.slot_size = slot_size
+        self.on_batch = on_batch
+        self.stats = BatchStats()
+        self._buffer = bytearray(batch_size * slot_size)
+        self._view = memoryview(self._buffer)
+        self._lengths = [0] * batch_size
+        self._count = 0
+        self._sendmmsg = _sendmmsg if use_sendmmsg else None
+        if self._sendmmsg is not None:
+            self._setup_mmsg()
+
+    def _setup_mmsg(self):
+        """一次性建好 mmsghdr/iovec/sockaddr 数组，iovec 固定指向各自的槽位"""
+        self._c_buffer = (ctypes.c_char * len(self._buffer)).from_buffer(self._buffer)
+        base = ctypes.addressof(self._c_buffer)
+        self._iovecs = (_IOVec * self.batch_size)()
+        self._addrs = (_SockAddrIn * self.batch_size)()
+        self._msgs = (_MMsgHdr * self.batch_size)()
+        for i in range(self.batch_size):
+            self._iovecs[i].iov_base = base + i * self.slot_size
+            self._addrs[i].sin_family = socket.AF_INET
+            hdr = self._msgs[i].msg_hdr
+            hdr.msg_name = ctypes.addressof(self._addrs[i])
+            hdr.msg_namelen = ctypes.sizeof(_SockAddrIn)
+            hdr.msg_iov = ctypes.pointer(self._iovecs[i])
+            hdr.msg_iovlen = 1
+        self._addr_base = ctypes.addressof(self._addrs)
+        self._base = base
+
+    def close(self):
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.flush()
+        self.close()
+
+    def add(self, packet):
+        """把一个完整IP报文放入当前批次，批次满时自动发送"""
+        length = len(packet)
+        if length > self.slot_size or length < IP_HEADER.size:
+            self.stats.errors += 1
+            return
+        i = self._count
+        offset = i * self.slot_size
+        self._view[offset:offset + length] = packet
+        self._lengths[i] = length
+        self._count = i + 1
+        if self._count == self.batch_size:
+            self.flush()
+
+    def send(self, packets):
+        """发送一个报文序列（可以是生成器），返回累计的 BatchStats"""
+        start = time.perf_counter()
+        add = self.add
+        for packet in packets:
+            add(packet)
+        self.flush()
+        self.stats.elapsed += time.perf_counter() - start
+        return self.stats
+
+    def flush(self):
+        """立即发出当前批次中的报文"""
+        count = self._count
+        if not count:
+            return
+        self._count = 0
+        # 按批抽样：一次记录的是整批报文的系统调用耗时
+        trace = profiling.sample('BATCH')
+        start = time.perf_counter()
+        if self._sendmmsg is not None:
+            sent, sent_bytes = self._flush_mmsg(count)
+            if trace:
+                trace.mark('sendmmsg')
+        else:
+            sent, sent_bytes = self._flush_loop(count)
+            if trace:
+                trace.mark('sendto')
+        self.stats.packets += sent
+        self.stats.bytes += sent_bytes
+        self.stats.batches += 1
+        if self.on_batch is not None:
+            self.on_batch(sent, time.perf_counter() - start)
+
+    def _flush_mmsg(self, count):
+        iovecs = self._iovecs
+        lengths = self._lengths
+        slot_size = self.slot_size
+        memmove = ctypes.memmove
+        addr = self._addr_base + _SockAddrIn.sin_addr.offset
+        addr_size = ctypes.sizeof(_SockAddrIn)
+        for i in range(count):
+            iovecs[i].iov_len = lengths[i]
+            # 目的地址取自IP头
+            memmove(addr + i * addr_size, self._base + i * slot_size + 16, 4)
+
+        fd = self.sock.fileno()
+        msgs = ctypes.addressof(self._msgs)
+        msg_size = ctypes.sizeof(_MMsgHdr)
+        offset = 0
+        sent = 0
+        sent_bytes = 0
+        while offset < count:
+            result = self._sendmmsg(fd, msgs + offset * msg_size, count - offset, 0)
+            if result < 0:
+                err = ctypes.get_errno()
+                if err == errno.EINTR:
+                    continue
+                # 跳过发送失败的报文（如目的不可达），继续发送其余报文
+                self.stats.errors += 1
+                offset += 1
+                continue
+            sent += result
+            sent_bytes += sum(lengths[offset:offset + result])
+            offset += result
+        return sent, sent_bytes
+
+    def _flush_loop(self, count):
+        view = self._view
+        slot_size = self.slot_size
+        sendto = self.sock.sendto
+        sent = 0
+        sent_bytes = 0
+        for i in range(count):
+            offset = i * slot_size
+            packet = view[offset:offset + self._lengths[i]]
+            try:
+                sendto(packet, (socket.inet_ntoa(packet[16:20]), 0))
+                sent += 1
+                sent_bytes += len(packet)
+            except OSError:
+                self.stats.errors += 1
+        return sent, sent_bytes
@@ -0,0 +1,345 @@
+"""
+基准测试套件（不需要外网）
+
+覆盖校验和、IP/TCP头部构建、DNS查询构建和响应解析，以及发往环回地址的发送循环。
+每项记录 ns/op、包/秒、每个报文的内存分配（tracemalloc 测得的单次操作峰值字节数）
+和每次操作后仍未释放的内存块数，结果可保存为基线文件（JSON），之后的运行与基线比较并标出退化。
+
+运行:
+    python bench.py                 运行全部并与 bench_baseline.json 比较，有退化时退出码为1
+    python bench.py --save          运行并把结果写为新的基线
+    python bench.py -k dns --json   只运行名字包含 dns 的项，结果以 JSON 输出
+发送路径只发往 127.0.0.1，原始套接字的几项需要 root，没有权限时跳过。
+基线与机器和 Python 版本有关，换机器后先 --save 重新生成。
+"""
+import argparse
+import json
+import os
+import platform
+import socket
+import sys
+import time
+import timeit
+import tracemalloc
+
+from batch_sender import BatchSender
+from checksum import calculate_checksum
+from DNS import DNSMessage, build_dns_query, parse_dns_response
+from IP import build_ip_header
+from TCP import TCP_CHECKSUM, TCP_HEADER, TCP_OPTIONS, TCP_WINDOW, build_tcp_options, calculate_tcp_checksum
+from template import TCPSynTemplate, UDPTemplate
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_baseline.json')
+DEFAULT_THRESHOLD = 0.25  # ns/op 比基线慢 25% 以上记为退化
+REPEAT = 5  # 每项重复的轮数，取最快一轮
+CONFIRM_RUNS = 2  # 疑似退化的项重新测量的次数，排除偶发的调度干扰
+SAVE_RUNS = 3  # 保存基线时整套运行的次数，每项取中位数，避免把偶然偏快的一次当作基线
+ALLOC_SLACK = 64  # 内存分配的绝对容差（字节）
+
+# 录制的DNS响应：CNAME 链 + 2个A记录、6个A记录、带SOA的NXDOMAIN（均使用名字压缩）
+DNS_RESPONSES = {
+    'cname': (0x1234, bytes.fromhex(
+        '12348180000100030000000003777777076578616d706c6503636f6d0000010001c00c000500010000012c00180565313233'
+        '3401610a616b616d616965646765036e657400c02d0001000100000014000417d70088c02d0001000100000014000417d70089')),
+    'a6': (0xBEEF, bytes.fromhex(
+        'beef8180000100060000000006676f6f676c6503636f6d0000010001c00c000100010000012c00048efa0064c00c00010001'
+        '0000012c00048efa0065c00c000100010000012c00048efa0066c00c000100010000012c00048efa0067c00c000100010000'
+        '012c00048efa0068c00c000100010000012c00048efa0069')),
+    'nxdomain': (0x0042, bytes.fromhex(
+        '004281830001000000010000046e6f7065076578616d706c6503636f6d0000010001c0110006000100000e10003e01610c69'
+        '616e612d73657276657273036e6574000a686f73746d6173746572056963616e6e036f72670078a3f17500001c2000000e10'
+        '0012750000000e10')),
+}
+
+_BENCHMARKS = []
+
+
+class Skip(Exception):
+    """当前环境无法运行该项（如没有 root 权限）"""
+
+
+def benchmark(name, number, packets=1):
+    """
+    注册一个基准：被装饰的函数做准备工作并返回无参数的操作函数，
+    number 为每轮调用次数，packets 为每次操作处理的报文数
+    """
+    def register(factory):
+        _BENCHMARKS.append((name, factory, number, packets))
+        return factory
+    return register
+
+
+@benchmark('checksum_20', 200000)
+def _checksum_20():
+    data = os.urandom(20)
+    return lambda: calculate_checksum(data)
+
+
+@benchmark('checksum_1500', 50000)
+def _checksum_1500():
+    data = os.urandom(1500)
+    return lambda: calculate_checksum(data)
+
+
+@benchmark('build_ip_header', 50000)
+def _build_ip_header():
+    return lambda: build_ip_header('10.0.0.1', '10.0.0.2', socket.IPPROTO_TCP, 32)
+
+
+@benchmark('tcp_options', 100000)
+def _tcp_options():
+    return build_tcp_options
+
+
+@benchmark('tcp_header', 30000)
+def _tcp_header():
+    """与 tcp_syn_events 相同的路径：打包头部、拷入选项、计算含伪头部的校验和"""
+    def build():
+        header = bytearray(TCP_HEADER.size + len(TCP_OPTIONS))
+        TCP_HEADER.pack_into(header, 0, 40000, 80, 12345, 0, (8 << 12) | 0x02, TCP_WINDOW, 0, 0)
+        header[TCP_HEADER.size:] = TCP_OPTIONS
+        TCP_CHECKSUM.pack_into(header, 16, calculate_tcp_checksum('10.0.0.1', '10.0.0.2', header))
+        return header
+    return build
+
+
+@benchmark('tcp_syn_template', 100000)
+def _tcp_syn_template():
+    template = TCPSynTemplate('10.0.0.1', '10.0.0.2', 40000, 80)
+    return lambda: template.build(12345, dst_port=443, daddr=0x0A000003)
+
+
+@benchmark('build_dns_query', 50000)
+def _build_dns_query():
+    return lambda: build_dns_query('www.example.com', transaction_id=0x1234)
+
+
+def _dns_parse(kind):
+    transaction_id, data = DNS_RESPONSES[kind]
+    return lambda: parse_dns_response(data, transaction_id)
+
+
+for _kind in DNS_RESPONSES:
+    benchmark(f'parse_dns_{_kind}', 20000)(lambda kind=_kind: _dns_parse(kind))
+
+
+@benchmark('dns_message_records', 20000)
+def _dns_message_records():
+    """完整解析：问题、回答、授权三部分"""
+    _, data = DNS_RESPONSES['nxdomain']
+
+    def parse():
+        message = DNSMessage(data)
+        return message.questions, message.answers, message.authority
+    return parse
+
+
+def _loopback_receiver():
+    """接收端只用来占住端口，队列满后内核直接丢弃，不影响发送端"""
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(('127.0.0.1', 0))
+    return receiver
+
+
+def _raw_sender():
+    try:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_RAW)
+    except PermissionError:
+        raise Skip("需要 root 权限")
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_HDRINCL, 1)
+    return sock
+
+
+@benchmark('send_udp_socket', 20000)
+def _send_udp_socket():
+    receiver = _loopback_receiver()
+    address = receiver.getsockname()
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    payload = bytes(64)
+    return lambda: sock.sendto(payload, address)
+
+
+@benchmark('send_raw_sendto', 20000)
+def _send_raw_sendto():
+    receiver = _loopback_receiver()
+    sock = _raw_sender()
+    template = UDPTemplate('127.0.0.1', '127.0.0.1', 40000, receiver.getsockname()[1], bytes(64))
+    packet = bytes(template.build())
+    return lambda: sock.sendto(packet, ('127.0.0.1', 0))
+
+
+@benchmark('send_batch_sendmmsg', 300, packets=64)
+def _send_batch_sendmmsg():
+    receiver = _loopback_receiver()
+    sender = BatchSender(batch_size=64, sock=_raw_sender())
+    template = UDPTemplate('127.0.0.1', '127.0.0.1', 40000, receiver.getsockname()[1], bytes(64))
+    build = template.build
+    add = sender.add
+
+    def send_batch():
+        for port in range(40000, 40064):
+            add(build(src_port=port))
+        sender.flush()
+    return send_batch
+
+
+def _allocations(op):
+    """单次操作的峰值新增内存（字节），以及每次操作后仍未释放的内存块数"""
+    op()
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        op()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    blocks = sys.getallocatedblocks()
+    for _ in range(1000):
+        op()
+    retained = (sys.getallocatedblocks() - blocks) / 1000
+    return max(0, peak - before), max(0.0, retained)
+
+
+def run(pattern=None, names=None):
+    """
+    运行名字包含 pattern（或在 names 中）的基准，返回 {名字: 结果字典}；
+    无法运行的项结果为 {'skipped': 原因}
+    """
+    results = {}
+    for name, factory, number, packets in _BENCHMARKS:
+        if (pattern and pattern not in name) or (names is not None and name not in names):
+            continue
+        try:
+            op = factory()
+        except Skip as e:
+            results[name] = {'skipped': str(e)}
+            continue
+        ns_op = min(timeit.repeat(op, number=number, repeat=REPEAT)) / number * 1e9
+        alloc_bytes, retained = _allocations(op)
+        results[name] = {
+            'ns_op': round(ns_op, 1),
+            'pps': round(packets * 1e9 / ns_op),
+            'alloc_bytes': round(alloc_bytes / packets, 1),
+            'retained_blocks': round(retained / packets, 3),
+        }
+    return results
+
+
+def _median_results(runs):
+    """多次 run() 的结果按 ns/op 取中位数的那一次"""
+    merged = {}
+    for name, result in runs[0].items():
+        if 'skipped' in result:
+            merged[name] = result
+            continue
+        samples = sorted((r[name] for r in runs if 'ns_op' in r.get(name, {})), key=lambda r: r['ns_op'])
+        merged[name] = samples[len(samples) // 2]
+    return merged
+
+
+def environment():
+    return {'python': platform.python_version(), 'implementation': platform.python_implementation(),
+            'machine': platform.machine(), 'system': platform.system(), 'cpus': os.cpu_count()}
+
+
+def load_baseline(path=BASELINE):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def save_baseline(results, path=BASELINE):
+    data = {'environment': environment(), 'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'results': results}
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    与基线比较，返回 {名字: 状态}：'ok'、'slower'（慢于阈值）、'faster'、'more_alloc'（分配变多）、
+    'new'（基线中没有）、'skipped'
+    """
+    reference = baseline.get('results', {}) if baseline else {}
+    verdicts = {}
+    for name, result in results.items():
+        base = reference.get(name)
+        if 'skipped' in result:
+            verdicts[name] = 'skipped'
+        elif base is None or 'ns_op' not in base:
+            verdicts[name] = 'new'
+        elif result['ns_op'] > base['ns_op'] * (1 + threshold):
+            verdicts[name] = 'slower'
+        elif result['alloc_bytes'] > base['alloc_bytes'] * (1 + threshold) + ALLOC_SLACK:
+            verdicts[name] = 'more_alloc'
+        elif result['ns_op'] < base['ns_op'] * (1 - threshold):
+            verdicts[name] = 'faster'
+        else:
+            verdicts[name] = 'ok'
+    return verdicts
+
+
+REGRESSIONS = ('slower', 'more_alloc')
+_VERDICT_TEXT = {'ok': '', 'slower': '退化', 'faster': '变快', 'more_alloc': '分配变多', 'new': '新增', 'skipped': '跳过'}
+
+
+def format_results(results, verdicts, baseline):
+    reference = baseline.get('results', {}) if baseline else {}
+    lines = [f"{'基准':<22} {'ns/op':>10} {'包/秒':>12} {'分配B/包':>10} {'基线ns/op':>10} {'变化':>8}  结论"]
+    for name, result in results.items():
+        if 'skipped' in result:
+            lines.append(f"{name:<22} {'-':>10} {'-':>12} {'-':>10} {'-':>10} {'-':>8}  跳过: {result['skipped']}")
+            continue
+        base = reference.get(name, {}).get('ns_op')
+        change = f"{(result['ns_op'] / base - 1) * 100:+.1f}%" if base else '-'
+        lines.append(f"{name:<22} {result['ns_op']:>10.1f} {result['pps']:>12} {result['alloc_bytes']:>10.1f} "
+                     f"{base if base else '-':>10} {change:>8}  {_VERDICT_TEXT[verdicts[name]]}")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='报文构建、解析和发送路径的基准测试')
+    parser.add_argument('-k', dest='pattern', help='只运行名字包含该字符串的基准')
+    parser.add_argument('--baseline', default=BASELINE, help='基线文件路径')
+    parser.add_argument('--save', action='store_true', help='把本次结果写为基线')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='判定退化的相对阈值')
+    parser.add_argument('--json', action='store_true', help='以 JSON 输出结果和结论')
+    args = parser.parse_args(argv)
+
+    results = run(args.pattern)
+    if args.save:
+        results = _median_results([results] + [run(args.pattern) for _ in range(SAVE_RUNS - 1)])
+    baseline = load_baseline(args.baseline)
+    verdicts = compare(results, baseline, args.threshold)
+    for _ in range(CONFIRM_RUNS):
+        suspects = [name for name, verdict in verdicts.items() if verdict == 'slower']
+        if not suspects:
+            break
+        for name, result in run(names=suspects).items():
+            if result['ns_op'] < results[name]['ns_op']:
+                results[name] = result
+        verdicts = compare(results, baseline, args.threshold)
+    if args.json:
+        print(json.dumps({'environment': environment(), 'results': results, 'verdicts': verdicts},
+                         ensure_ascii=False, indent=2))
+    else:
+        if baseline and baseline.get('environment') != environment():
+            print(f"注意: 基线生成环境 {baseline.get('environment')} 与当前环境不同，比较结果仅供参考")
+        print(format_results(results, verdicts, baseline))
+
+    if args.save:
+        if baseline and args.pattern:
+            # 只运行了部分基准时保留基线中的其余项
+            merged = dict(baseline.get('results', {}))
+            merged.update(results)
+            results = merged
+        save_baseline(results, args.baseline)
+        return 0
+    return 1 if any(verdict in REGRESSIONS for verdict in verdicts.values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
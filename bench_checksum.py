@@ -0,0 +1,80 @@
+"""
+校验和基准测试：对比原逐字节循环实现与新的整段求和实现
+运行: python bench_checksum.py
+"""
+import os
+import timeit
+
+from checksum import calculate_checksum, calculate_checksums, update_checksum
+
+
+def legacy_checksum(data):
+    """原 checksum.calculate_checksum 实现，作为对照"""
+    checksum = 0
+    for i in range(0, len(data), 2):
+        if i + 1 < len(data):
+            word = (data[i] << 8) + data[i + 1]
+        else:
+            word = data[i] << 8
+
+        checksum += word
+        while checksum > 0xFFFF:
+            checksum = (checksum & 0xFFFF) + (checksum >> 16)
+
+    return ~checksum & 0xFFFF
+
+
+def _time_per_call(func, number):
+    """返回单次调用耗时（纳秒），取3轮中的最好成绩"""
+    best = min(timeit.repeat(func, number=number, repeat=3))
+    return best / number * 1e9
+
+
+def bench_sizes(sizes=(20, 1500, 65536)):
+    rows = []
+    for size in sizes:
+        data = os.urandom(size)
+        assert legacy_checksum(data) == calculate_checksum(data)
+        number = max(1, 200000 // size)
+        legacy_ns = _time_per_call(lambda: legacy_checksum(data), number)
+        fast_ns = _time_per_call(lambda: calculate_checksum(data), number * 10)
+        rows.append((size, legacy_ns, fast_ns))
+    return rows
+
+
+def bench_batch(count=10000, size=40):
+    packets = [os.urandom(size) for _ in range(count)]
+    assert calculate_checksums(packets) == [legacy_checksum(p) for p in packets]
+    loop_ns = _time_per_call(lambda: [calculate_checksum(p) for p in packets], 5) / count
+    batch_ns = _time_per_call(lambda: calculate_checksums(packets), 5) / count
+    return loop_ns, batch_ns
+
+
+def bench_incremental(size=1500):
+    data = bytearray(os.urandom(size))
+    checksum = calculate_checksum(data)
+    old_word = int.from_bytes(data[4:6], 'big')
+
+    def full():
+        data[4:6] = b'\x12\x34'
+        return calculate_checksum(data)
+
+    incremental_ns = _time_per_call(lambda: update_checksum(checksum, old_word, 0x1234), 100000)
+    full_ns = _time_per_call(full, 10000)
+    return full_ns, incremental_ns
+
+
+def main():
+    print(f"{'大小':>8} {'原实现(ns)':>14} {'新实现(ns)':>14} {'加速比':>8}")
+    for size, legacy_ns, fast_ns in bench_sizes():
+        print(f"{size:>8} {legacy_ns:>14.0f} {fast_ns:>14.0f} {legacy_ns / fast_ns:>7.1f}x")
+
+    loop_ns, batch_ns = bench_batch()
+    print(f"\n批量(40字节 x 10000): 逐个调用 {loop_ns:.0f} ns/包, 批量接口 {batch_ns:.0f} ns/包")
+
+    full_ns, incremental_ns = bench_incremental()
+    print(f"改动一个字段(1500字节): 全量重算 {full_ns:.0f} ns, RFC 1624 增量 {incremental_ns:.0f} ns")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+经典BPF套接字过滤器
+
+原始套接字会收到本机该协议的所有报文，在Python里再丢弃不需要的报文代价很高。
+这里把常见的匹配条件编译成经典BPF程序，通过 SO_ATTACH_FILTER 挂到套接字上，
+让内核在报文进入Python之前就把无关流量丢掉。
+
+程序看到的数据从IP头开始（AF_INET原始套接字）；用于 AF_PACKET 套接字时把 link_offset 设为链路层头部长度（以太网为14）。
+"""
+import ctypes
+import socket
+import struct
+
+SO_ATTACH_FILTER = 26
+SO_DETACH_FILTER = 27
+
+# 指令类别
+BPF_LD = 0x00
+BPF_LDX = 0x01
+BPF_JMP = 0x05
+BPF_RET = 0x06
+# 数据宽度
+BPF_W = 0x00
+BPF_H = 0x08
+BPF_B = 0x10
+# 寻址方式
+BPF_ABS = 0x20
+BPF_IND = 0x40
+BPF_MSH = 0xa0
+# 跳转条件
+BPF_JEQ = 0x10
+BPF_JGT = 0x20
+BPF_JGE = 0x30
+BPF_JSET = 0x40
+BPF_K = 0x00
+
+_SIZES = {1: BPF_B, 2: BPF_H, 4: BPF_W}
+_SOCK_FILTER = struct.Struct('HBBI')
+
+# 条件作用的位置：IP头内的偏移，或者传输层头（IP头之后）内的偏移
+IP = 'ip'
+L4 = 'l4'
+
+
+def _jump(op, value, fail):
+    """条件成立时继续执行下一条，不成立时跳到 fail（返回0的指令）"""
+    if op == 'eq':
+        return [('jmp', BPF_JMP | BPF_JEQ | BPF_K, None, fail, value)]
+    if op == 'ge':
+        return [('jmp', BPF_JMP | BPF_JGE | BPF_K, None, fail, value)]
+    if op == 'le':
+        return [('jmp', BPF_JMP | BPF_JGT | BPF_K, fail, None, value)]
+    if op == 'clear':
+        # value 中的位必须全部为0
+        return [('jmp', BPF_JMP | BPF_JSET | BPF_K, fail, None, value)]
+    raise ValueError(f"不支持的条件: {op}")
+
+
+def compile_filter(conditions, link_offset=0, accept=0xFFFF):
+    """
+    把条件列表编译为BPF指令列表 [(code, jt, jf, k)]，所有条件都成立才接收报文
+    每个条件为 (位置, 字节数, 偏移, 运算, 值)，位置为 IP 或 L4，运算为 eq/ge/le/clear
+    例如 (L4, 2, 0, 'eq', 53) 表示传输层源端口等于53
+    """
+    program = []
+    x_loaded = False
+    for where, size, offset, op, value in conditions:
+        if where == L4:
+            if not x_loaded:
+                # X = 4 * (IP头第一个字节 & 0x0F)，即IP头长度
+                program.append(('ins', BPF_LDX | BPF_B | BPF_MSH, 0, 0, link_offset))
+                x_loaded = True
+            program.append(('ins', BPF_LD | _SIZES[size] | BPF_IND, 0, 0, link_offset + offset))
+        else:
+            program.append(('ins', BPF_LD | _SIZES[size] | BPF_ABS, 0, 0, link_offset + offset))
+        program.extend(_jump(op, value, 'drop'))
+    program.append(('ins', BPF_RET | BPF_K, 0, 0, accept))
+    program.append(('ins', BPF_RET | BPF_K, 0, 0, 0))
+
+    # 把跳转目标换算成相对偏移（相对于下一条指令）
+    drop = len(program) - 1
+    instructions = []
+    for index, (_, code, jt, jf, k) in enumerate(program):
+        jt = drop - index - 1 if jt == 'drop' else (jt or 0)
+        jf = drop - index - 1 if jf == 'drop' else (jf or 0)
+        if jt > 255 or jf > 255:
+            raise ValueError("BPF程序过长，跳转距离超过255")
+        instructions.append((code, jt, jf, k))
+    return instructions
+
+
+# IP头中的协议号和分片字段；只匹配未分片（或第一个分片）的报文，后续分片里没有传输层头
+def _ip_protocol(protocol):
+    return [(IP, 1, 9, 'eq', protocol), (IP, 2, 6, 'clear', 0x1FFF)]
+
+
+def icmp_echo_reply_filter(icmp_id=None, id_range=None, link_offset=0):
+    """ICMP Echo Reply，可限定标识符（icmp_id 或闭区间 id_range）"""
+    conditions = _ip_protocol(socket.IPPROTO_ICMP) + [(L4, 1, 0, 'eq', 0)]
+    if icmp_id is not None:
+        conditions.append((L4, 2, 4, 'eq', icmp_id))
+    elif id_range is not None:
+        conditions += [(L4, 2, 4, 'ge', id_range[0]), (L4, 2, 4, 'le', id_range[1])]
+    return compile_filter(conditions, link_offset)
+
+
+def tcp_reply_filter(dst_ports, src_port=None, link_offset=0):
+    """
+    TCP回复：目的端口（我们的源端口）落在 dst_ports 闭区间内，可限定对方的源端口
+    dst_ports 可以是单个端口或 (最小, 最大)
+    """
+    if isinstance(dst_ports, int):
+        dst_ports = (dst_ports, dst_ports)
+    conditions = _ip_protocol(socket.IPPROTO_TCP)
+    if src_port is not None:
+        conditions.append((L4, 2, 0, 'eq', src_port))
+    if dst_ports[0] == dst_ports[1]:
+        conditions.append((L4, 2, 2, 'eq', dst_ports[0]))
+    else:
+        conditions += [(L4, 2, 2, 'ge', dst_ports[0]), (L4, 2, 2, 'le', dst_ports[1])]
+    return compile_filter(conditions, link_offset)
+
+
+def udp_from_port_filter(src_port=53, dst_port=None, link_offset=0):
+    """来自指定源端口的UDP报文（默认DNS），可限定目的端口（我们的源端口）"""
+    conditions = _ip_protocol(socket.IPPROTO_UDP) + [(L4, 2, 0, 'eq', src_port)]
+    if dst_port is not None:
+        conditions.append((L4, 2, 2, 'eq', dst_port))
+    return compile_filter(conditions, link_offset)
+
+
+def icmp_error_filter(protocol, src_port, link_offset=0):
+    """
+    引用了我们报文的ICMP差错报文（超时、不可达）：内层IP头的协议为 protocol，内层传输层源端口为 src_port
+    ICMP头8字节之后是原报文的IP头，按20字节（不带选项）计算内层传输层头的位置
+    """
+    conditions = _ip_protocol(socket.IPPROTO_ICMP) + [(L4, 1, 8 + 9, 'eq', protocol), (L4, 2, 8 + 20, 'eq', src_port)]
+    return compile_filter(conditions, link_offset)
+
+
+def drop_all_filter():
+    """丢弃所有报文：回复改由抓包环接收时，挂到只用于发送的套接字上，避免接收队列被填满"""
+    return [(BPF_RET | BPF_K, 0, 0, 0)]
+
+
+def attach_filter(sock, instructions):
+    """把编译好的BPF程序挂到套接字上，内核会复制程序，调用返回后缓冲区即可释放"""
+    code = b''.join(_SOCK_FILTER.pack(*ins) for ins in instructions)
+    buffer = ctypes.create_string_buffer(code, len(code))
+    # struct sock_fprog { unsigned short len; struct sock_filter *filter; }
+    fprog = struct.pack('HP', len(instructions), ctypes.addressof(buffer))
+    sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER, fprog)
+
+
+def detach_filter(sock):
+    sock.setsockopt(socket.SOL_SOCKET, SO_DETACH_FILTER, 0)
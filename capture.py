@@ -0,0 +1,163 @@
+"""
+基于 AF_PACKET + PACKET_RX_RING（TPACKET_V3）的回复抓包
+
+内核把收到的帧直接写进与用户态共享的 mmap 环形缓冲区，按块（block）交给用户态，
+一个块里有多个帧，处理完整个块后再把它还给内核。帧以 memoryview 的形式按IP协议交给处理函数，
+不经过 recvfrom，也不复制成新的 bytes 对象。SynScanner、ping_sweep_events 和 DNSResolver
+在 use_ring=True 时把各自的回复匹配函数注册到环上。
+
+环只接收IPv4帧（ETH_P_IP），调用方再传入自己回复的BPF过滤器（按以太网头 link_offset=LINK_OFFSET 编译），
+过滤器在建环之前挂上，无关的流量在内核里就被丢掉，不占用环的空间。
+
+注意：交给处理函数的 memoryview 只在回调期间有效，块还给内核后内容会被覆盖，
+需要保留数据时请自行 bytes(view)。
+"""
+import mmap
+import select
+import socket
+import struct
+import time
+
+from bpf import attach_filter
+from timing import now_ns
+
+SOL_PACKET = 263
+PACKET_RX_RING = 5
+PACKET_VERSION = 10
+TPACKET_V3 = 2
+ETH_P_IP = 0x0800
+LINK_OFFSET = 14  # 以太网头长度，环上的BPF过滤器按它编译
+
+TP_STATUS_KERNEL = 0
+TP_STATUS_USER = 1
+
+# struct tpacket_req3
+_TPACKET_REQ3 = struct.Struct('IIIIIII')
+# struct tpacket_block_desc: version, offset_to_priv, 然后是 tpacket_hdr_v1 的
+# block_status, num_pkts, offset_to_first_pkt
+_BLOCK_DESC = struct.Struct('IIIII')
+_BLOCK_STATUS_OFFSET = 8
+_U32 = struct.Struct('I')
+# struct tpacket3_hdr: tp_next_offset, tp_sec, tp_nsec, tp_snaplen, tp_len, tp_status, tp_mac, tp_net
+_TPACKET3_HDR = struct.Struct('IIIIIIHH')
+
+
+class CaptureStats:
+    def __init__(self):
+        self.frames = 0
+        self.blocks = 0
+        self.dispatched = 0
+
+
+class PacketRing:
+    """
+    TPACKET_V3 接收环
+    block_size * block_nr 为共享内存的总大小，默认 1MB x 64；
+    retire_ms 为块未满时内核最晚把它交给用户态的时间；
+    bpf_filter 为 bpf 模块编译的过滤器（link_offset=LINK_OFFSET），None 表示接收所有IPv4帧
+    """
+
+    def __init__(self, interface=None, block_size=1 << 20, block_nr=64, frame_size=2048, retire_ms=10,
+                 bpf_filter=None):
+        # 指定接口时先以协议0创建（不接收任何帧），挂好过滤器、建好环之后再绑定接口和协议
+        self.sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, 0 if interface else socket.htons(ETH_P_IP))
+        try:
+            if bpf_filter is not None:
+                attach_filter(self.sock, bpf_filter)
+            self.sock.setsockopt(SOL_PACKET, PACKET_VERSION, TPACKET_V3)
+            req = _TPACKET_REQ3.pack(block_size, block_nr, frame_size,
+                                     (block_size // frame_size) * block_nr, retire_ms, 0, 0)
+            self.sock.setsockopt(SOL_PACKET, PACKET_RX_RING, req)
+            if interface:
+                self.sock.bind((interface, ETH_P_IP))
+            self.ring = mmap.mmap(self.sock.fileno(), block_size * block_nr,
+                                  mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+        except OSError:
+            self.sock.close()
+            raise
+        self.block_size = block_size
+        self.block_nr = block_nr
+        self.stats = CaptureStats()
+        self._view = memoryview(self.ring)
+        self._block = 0
+        self._handlers = {}  # IP协议号 -> 处理函数(view, 长度, 接收时间ns)
+        self._poll = select.poll()
+        self._poll.register(self.sock.fileno(), select.POLLIN | select.POLLERR)
+
+    def add_handler(self, protocol, handler):
+        """
+        注册IP协议（如 socket.IPPROTO_TCP）的处理函数 handler(ip_view, length, recv_ns)
+        recv_ns 为内核收到帧的时间，已换算到 timing.now_ns 的时钟
+        """
+        self._handlers[protocol] = handler
+
+    def close(self):
+        self._view.release()
+        self.ring.close()
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _dispatch(self, frame, recv_ns):
+        """把IPv4报文交给对应协议的处理函数"""
+        if len(frame) < 20 or frame[0] >> 4 != 4:
+            return
+        handler = self._handlers.get(frame[9])
+        if handler is not None:
+            self.stats.dispatched += 1
+            handler(frame, len(frame), recv_ns)
+
+    def frames(self, block_offset):
+        """生成一个块中所有帧的 (网络层视图（从IP头开始）, 内核时间戳ns)，时间戳为 CLOCK_REALTIME"""
+        view = self._view
+        _, _, _, num_pkts, offset = _BLOCK_DESC.unpack_from(view, block_offset)
+        offset += block_offset
+        for _ in range(num_pkts):
+            next_offset, sec, nsec, snaplen, _, _, mac, net = _TPACKET3_HDR.unpack_from(view, offset)
+            start = offset + net
+            yield view[start:start + snaplen - (net - mac)], sec * 1_000_000_000 + nsec
+            offset += next_offset
+
+    def poll_once(self, timeout=0.1):
+        """处理所有已就绪的块，没有就绪块时最多等待 timeout 秒，返回处理的帧数"""
+        handled = 0
+        waited = False
+        view = self._view
+        while True:
+            block_offset = self._block * self.block_size
+            status = _U32.unpack_from(view, block_offset + _BLOCK_STATUS_OFFSET)[0]
+            if not status & TP_STATUS_USER:
+                if handled or waited:
+                    return handled
+                waited = True
+                if not self._poll.poll(timeout * 1000):
+                    return 0
+                continue
+
+            count = 0
+            # 帧时间戳是系统时间，用同一时刻两个时钟的差值换算到单调时钟（同 timing.recv_with_timestamp）
+            clock_offset = now_ns() - time.time_ns()
+            for frame, ts_ns in self.frames(block_offset):
+                self._dispatch(frame, ts_ns + clock_offset)
+                frame.release()
+                count += 1
+            handled += count
+            self.stats.frames += count
+            self.stats.blocks += 1
+            # 块处理完毕，交还给内核
+            _U32.pack_into(view, block_offset + _BLOCK_STATUS_OFFSET, TP_STATUS_KERNEL)
+            self._block = (self._block + 1) % self.block_nr
+
+    def run(self, stop, timeout=0.1):
+        """循环抓包直到 stop（threading.Event）被设置"""
+        while not stop.is_set():
+            self.poll_once(timeout)
+
+    def run_for(self, seconds):
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            self.poll_once(min(0.1, max(0.0, deadline - time.monotonic())))
@@ -1,17 +1,102 @@
-def calculate_checksum(data):
-    checksum = 0
-    # 每2个字节处理一次数据
-    for i in range(0, len(data), 2):
-        if i + 1 < len(data):
-            word = (data[i] << 8) + data[i + 1]
-        else:
-            word = data[i] << 8
-
-        checksum += word
-        # 处理进位
-        while checksum > 0xFFFF:
-            checksum = (checksum & 0xFFFF) + (checksum >> 16)
+"""
+Internet校验和（RFC 1071）计算引擎
+
+思路：16位反码求和与字节序列所表示的大整数模 0xFFFF 同余（2^16 ≡ 1 mod 0xFFFF），
+因此整段数据只需一次 int.from_bytes 加一次取模，循环全部在C层完成，最后只折叠一次。
+"""
+
+_MOD = 0xFFFF
+
+
+def _fold(total):
+    """把任意长度的非负和折叠成16位反码和（0..0xFFFF）"""
+    if total <= 0xFFFF:
+        return total
+    total %= _MOD
+    # 非零数据的反码和不会是+0，而是-0（0xFFFF）
+    return total or 0xFFFF
+
 
+def ones_complement_sum(data, initial=0):
+    """
+    计算数据的16位反码和（未取反），可用 initial 累加之前算好的部分和
+    奇数长度的数据在末尾补一个0字节
+    """
+    if len(data) & 1:
+        data = bytes(data) + b'\x00'
+    return _fold(int.from_bytes(data, 'big') + initial)
+
+
+def finish_checksum(total):
+    """把累加好的部分和折叠并取反，得到最终写入报文的校验和"""
+    return ~_fold(total) & 0xFFFF
+
+
+def calculate_checksum(data):
+    # 整段数据一次求和，最后只折叠一次
+    if len(data) & 1:
+        data = bytes(data) + b'\x00'
+    total = int.from_bytes(data, 'big')
+    if total > 0xFFFF:
+        total = total % _MOD or 0xFFFF
     # 返回校验和的反码
-    return ~checksum & 0xFFFF
+    return ~total & 0xFFFF
+
+
+def calculate_checksums(packets, stride=None):
+    """
+    批量计算校验和
+    packets 为报文序列时逐个计算；为连续缓冲区且给定 stride 时，
+    按固定步长切分（memoryview 切片，不复制）后计算
+    """
+    if stride is not None:
+        view = memoryview(packets)
+        packets = [view[i:i + stride] for i in range(0, len(view), stride)]
+
+    from_bytes = int.from_bytes
+    results = []
+    append = results.append
+    for data in packets:
+        if len(data) & 1:
+            data = bytes(data) + b'\x00'
+        total = from_bytes(data, 'big')
+        if total > 0xFFFF:
+            total = total % _MOD or 0xFFFF
+        append(~total & 0xFFFF)
+    return results
+
+
+def update_checksum(checksum, old_word, new_word):
+    """
+    RFC 1624 增量更新：报文中一个16位字从 old_word 改为 new_word 后的新校验和
+    HC' = ~(~HC + ~m + m')
+    """
+    total = (~checksum & 0xFFFF) + (~old_word & 0xFFFF) + new_word
+    total = (total & 0xFFFF) + (total >> 16)
+    total = (total & 0xFFFF) + (total >> 16)
+    return ~total & 0xFFFF
+
+
+def update_checksum32(checksum, old_value, new_value):
+    """32位字段（序列号、IP地址）的增量更新，按高低两个16位字分别处理"""
+    checksum = update_checksum(checksum, old_value >> 16, new_value >> 16)
+    return update_checksum(checksum, old_value & 0xFFFF, new_value & 0xFFFF)
+
+
+def update_checksum_bytes(checksum, old_data, new_data):
+    """
+    任意长度字段的增量更新，old_data 与 new_data 等长且位于报文的偶数偏移处
+    """
+    old_sum = ones_complement_sum(old_data)
+    new_sum = ones_complement_sum(new_data)
+    return finish_checksum((~checksum & 0xFFFF) + (0xFFFF - old_sum) + new_sum)
+
 
+def transport_checksum(src_addr, dst_addr, protocol, segment):
+    """
+    计算TCP/UDP校验和（含伪头部）
+    src_addr/dst_addr 为4字节网络序地址，segment 为传输层头部+数据
+    """
+    # 伪头部: 源IP、目标IP、占位符+协议号、传输层长度
+    total = ones_complement_sum(src_addr + dst_addr) + protocol + len(segment)
+    return finish_checksum(ones_complement_sum(segment, total))
@@ -0,0 +1,339 @@
+"""
+命令行模式（不导入 tkinter）
+
+    sudo python main.py icmp 10.0.0.1 10.0.0.2
+    sudo python main.py scan 10.0.0.0/24 --ports 22,80,443 --rate 5000
+    sudo python main.py connect -f fleet.txt -p 443 -n 3 -c 2000 --close fin
+    sudo python main.py trace -f targets.txt -r 10000 --hop-cache hops.json
+    python main.py dns -f domains.txt --concurrency 50
+    cat hosts.txt | sudo python main.py sweep -
+    sudo python main.py udpload 10.0.0.2 -p 9000 -r 100000 --duration 30 --payload pattern --size 512
+    python main.py udprecv -p 9000
+    sudo python main.py tcp 10.0.0.0/24 -p 80 --pcap syn.pcapng
+    sudo python main.py replay prod.pcap --speed 10
+
+结果以 JSON Lines 写到标准输出，每个事件一行（格式见 events.JSONSink）；
+有错误事件时退出码为1。协议模块在真正用到时才导入，启动时只加载标准库和 events。
+"""
+import argparse
+import functools
+import importlib
+import ipaddress
+import os
+import random
+import socket
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from events import ERROR, JSONSink, event
+
+PROTOCOLS = ('ip', 'icmp', 'tcp', 'udp', 'dns', 'sweep', 'scan', 'connect', 'trace', 'udpload', 'udprecv', 'replay')
+
+
+def _load(module, name):
+    """延迟导入协议模块中的函数"""
+    return getattr(importlib.import_module(module), name)
+
+
+def read_targets(args):
+    """
+    依次生成目标：命令行参数（可逗号分隔）、-f 文件、"-" 表示标准输入
+    文件和标准输入每行一个目标，# 之后为注释
+    """
+    sources = []
+    for target in args.targets:
+        if target == '-':
+            sources.append(sys.stdin)
+        else:
+            sources.append(target.split(','))
+    for path in args.file or ():
+        sources.append(sys.stdin if path == '-' else open(path, encoding='utf-8'))
+    for source in sources:
+        try:
+            for line in source:
+                target = line.split('#', 1)[0].strip()
+                if target:
+                    yield target
+        finally:
+            if source is not sys.stdin and hasattr(source, 'close'):
+                source.close()
+
+
+def expand_addresses(targets):
+    """把 CIDR 网段展开为主机地址，单个地址原样返回"""
+    for target in targets:
+        if '/' not in target:
+            yield target
+            continue
+        network = ipaddress.ip_network(target, strict=False)
+        for host in (network.hosts() if network.num_addresses > 1 else [network.network_address]):
+            yield str(host)
+
+
+def source_ip_for(target):
+    """通过未发包的UDP connect 让内核选出去往 target 的源地址"""
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        s.connect((target, 9))
+        return s.getsockname()[0]
+    except OSError:
+        return '0.0.0.0'
+    finally:
+        s.close()
+
+
+def _per_target_events(args):
+    """返回 (目标, 端口) -> 事件生成器 的函数，端口为 None 表示该协议不使用端口"""
+    src_port = args.src_port or random.randint(32768, 60999)
+    if args.protocol == 'ip':
+        ip_events = _load('IP', 'ip_events')
+        return lambda target, port: ip_events(args.src_ip or source_ip_for(target), target)
+    if args.protocol == 'icmp':
+        ping_events = _load('ICMP', 'ping_events')
+        return lambda target, port: ping_events(target, args.count, args.timeout, args.interval)
+    if args.protocol == 'tcp':
+        tcp_syn_events = _load('TCP', 'tcp_syn_events')
+        return lambda target, port: tcp_syn_events(args.src_ip or source_ip_for(target), src_port, target, port)
+    if args.protocol == 'udp':
+        udp_events = _load('UDP', 'udp_events')
+        return lambda target, port: udp_events(src_port, target, port)
+    dns_query_events = _load('DNS', 'dns_query_events')
+    return lambda target, port: dns_query_events(target, args.dns_server, args.timeout)
+
+
+class _Output:
+    """多个线程共用的输出，每行写完立即刷新，方便管道下游实时读取"""
+
+    def __init__(self, stream, sink):
+        self.stream = stream
+        self.sink = sink
+        self.errors = 0
+        self.metrics = None  # --metrics-port 时为 metrics.EventMetrics
+        self._lock = threading.Lock()
+
+    def consume(self, events):
+        for e in events:
+            if self.metrics is not None:
+                self.metrics.record(e)
+            line = self.sink.format(e)
+            with self._lock:
+                if e.kind == ERROR:
+                    self.errors += 1
+                self.stream.write(line + '\n')
+                self.stream.flush()
+
+
+def _run_per_target(args, output):
+    make_events = _per_target_events(args)
+    ports = [None]
+    if args.protocol in ('tcp', 'udp'):
+        ports = _load('scanner', 'parse_ports')(args.ports or '80')
+    targets = read_targets(args) if args.protocol == 'dns' else expand_addresses(read_targets(args))
+    pacer = _load('pacing', 'Pacer')(args.rate, args.burst)
+
+    def probe(target, port):
+        # 生成器在工作线程里创建，source_ip_for 等出错也落到 future 上
+        output.consume(make_events(target, port))
+
+    def finished(future, target):
+        slots.release()
+        error = future.exception()
+        if error is not None:
+            output.consume([event(ERROR, args.protocol.upper(), target, message=f'探测失败: {error}')])
+
+    # 同时在途的任务数限制为并发数的两倍，目标文件再大内存占用也不变
+    slots = threading.BoundedSemaphore(args.concurrency * 2)
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        for target in targets:
+            for port in ports:
+                pacer.wait()
+                slots.acquire()
+                future = executor.submit(probe, target, port)
+                future.add_done_callback(functools.partial(finished, target=target))
+
+
+def _run_sweep(args, output):
+    if args.workers:
+        # 多进程模式直接按网段分片，不展开成地址列表
+        sharded_sweep_events = _load('sharded', 'sharded_sweep_events')
+        output.consume(sharded_sweep_events(list(read_targets(args)), args.count, args.workers, args.rate,
+                                            args.timeout, args.interval))
+        return
+    ping_sweep_events = _load('ICMP', 'ping_sweep_events')
+    targets = list(expand_addresses(read_targets(args)))
+    output.consume(ping_sweep_events(targets, args.count, args.timeout, args.interval, rate=args.rate,
+                                     burst=args.burst))
+
+
+def _run_scan(args, output):
+    scan_events = _load('scanner', 'scan_events')
+    targets = list(read_targets(args))
+    src_ip = args.src_ip
+    if src_ip is None and targets:
+        src_ip = source_ip_for(targets[0].split('/')[0])
+    states = ('open', 'closed', 'filtered') if args.all_states else ('open',)
+    if args.workers:
+        sharded_scan_events = _load('sharded', 'sharded_scan_events')
+        output.consume(sharded_scan_events(src_ip, targets, args.ports or '1-1024', workers=args.workers,
+                                           rate=args.rate, timeout=args.timeout, states=states))
+        return
+    output.consume(scan_events(src_ip, targets, args.ports or '1-1024', rate=args.rate,
+                               timeout=args.timeout, states=states, burst=args.burst))
+
+
+def _run_connect(args, output):
+    handshake_events = _load('handshake', 'handshake_events')
+    targets = list(read_targets(args))
+    src_ip = args.src_ip
+    if src_ip is None and targets:
+        src_ip = source_ip_for(targets[0].split('/')[0])
+    output.consume(handshake_events(src_ip, targets, args.ports or '80', count=args.count, close=args.close,
+                                    timeout=args.timeout, window=args.concurrency, rate=args.rate,
+                                    burst=args.burst))
+
+
+def _run_trace(args, output):
+    traceroute = importlib.import_module('traceroute')
+    targets = [socket.gethostbyname(target) for target in expand_addresses(read_targets(args))]
+    src_ip = args.src_ip
+    if src_ip is None and targets:
+        src_ip = source_ip_for(targets[0])
+    cache = traceroute.HopCache.load(args.hop_cache) if args.hop_cache else traceroute.HopCache()
+    try:
+        output.consume(traceroute.trace_events(src_ip, targets, max_ttl=args.max_ttl, timeout=args.timeout,
+                                               rate=args.rate, burst=args.burst, cache=cache,
+                                               dst_port=int(args.ports or traceroute.TRACE_PORT)))
+    finally:
+        if args.hop_cache:
+            cache.save(args.hop_cache)
+
+
+def _run_udpload(args, output):
+    udp_load = importlib.import_module('udp_load')
+    payload = udp_load.make_payload(args.payload, args.size)
+    for target in expand_addresses(read_targets(args)):
+        output.consume(udp_load.load_events(args.src_ip or source_ip_for(target), target, args.ports or 9000,
+                                            src_port=args.src_port, payload=payload, rate=args.rate, burst=args.burst,
+                                            count=args.total, duration=args.duration))
+
+
+def _run_udprecv(args, output):
+    receive_events = _load('udp_load', 'receive_events')
+    bind = args.targets[0] if args.targets else '0.0.0.0'
+    output.consume(receive_events(args.ports or 9000, bind, duration=args.duration, idle=args.timeout))
+
+
+def _run_replay(args, output):
+    replay_events = _load('pcap', 'replay_events')
+    output.consume(replay_events(list(read_targets(args)), speed=args.speed, loops=args.loops))
+
+
+def _start_recording(args):
+    """--pcap：记录 ip/icmp/tcp/udp 发出的报文，扩展名为 .pcapng 时写 pcapng 格式"""
+    pcap = importlib.import_module('pcap')
+    rotate = int(args.rotate * 1024 * 1024) if args.rotate else None
+    file_format = 'pcapng' if args.pcap.endswith('.pcapng') else 'pcap'
+    writer = pcap.PcapWriter(args.pcap, format=file_format, rotate_bytes=rotate)
+    pcap.start_recording(writer)
+    return writer
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='main.py', description='原始套接字测试工具的命令行模式，结果以 JSON Lines 输出；不带参数运行时启动图形界面')
+    parser.add_argument('protocol', choices=PROTOCOLS,
+                        help='协议：ip/icmp/tcp/udp/dns，sweep 为批量Ping，scan 为SYN扫描，connect 为TCP握手时延探测，trace 为并行路由追踪，'
+                             'udpload/udprecv 为UDP负载发送/接收，replay 回放抓包文件')
+    parser.add_argument('targets', nargs='*', help='目标地址、CIDR 网段或域名（replay 为抓包文件），可逗号分隔；"-" 表示从标准输入读取')
+    parser.add_argument('-f', '--file', action='append', help='目标文件，每行一个目标，可重复指定')
+    parser.add_argument('-p', '--ports', help='端口，如 22,80,8000-8100（tcp/udp/scan/connect），trace 为探测的目的端口')
+    parser.add_argument('-r', '--rate', type=float, help='每秒发起的探测数上限')
+    parser.add_argument('--burst', type=int, help='限速时最多连续发送的报文数（令牌桶容量），默认约为5毫秒的量')
+    parser.add_argument('-c', '--concurrency', type=int, default=16, help='同时进行的探测数（ip/icmp/tcp/udp/dns），connect 为同时进行的连接数')
+    parser.add_argument('-w', '--workers', type=int, help='scan/sweep 使用的发送进程数，0 为CPU核数；默认单进程')
+    parser.add_argument('-n', '--count', type=int, default=4, help='每个目标的Ping次数（icmp/sweep）/ 握手次数（connect）')
+    parser.add_argument('-t', '--timeout', type=float, default=2, help='等待回复的超时时间（秒）')
+    parser.add_argument('-i', '--interval', type=float, help='两次Ping之间的间隔（秒）')
+    parser.add_argument('--src-ip', help='源地址，默认由路由选择（ip/tcp/scan/connect）')
+    parser.add_argument('--src-port', type=int, help='源端口，默认随机（tcp/udp）')
+    parser.add_argument('--dns-server', default='8.8.8.8', help='DNS服务器（dns）')
+    parser.add_argument('--all-states', action='store_true', help='scan 时输出关闭和过滤的端口，默认只输出开放端口')
+    parser.add_argument('--close', choices=('rst', 'fin'), default='rst',
+                        help='connect 握手后的关闭方式：rst 立即重置，fin 正常关闭并测量关闭往返时间')
+    parser.add_argument('--max-ttl', type=int, default=30, help='trace 的最大跳数')
+    parser.add_argument('--hop-cache', help='trace 按网段缓存路径的文件，运行前读取、结束后写回')
+    parser.add_argument('--payload', choices=('fixed', 'random', 'pattern'), default='pattern',
+                        help='udpload 的负载类型；udprecv 只能统计 pattern 负载')
+    parser.add_argument('--size', type=int, default=64, help='udpload 每个报文的负载字节数')
+    parser.add_argument('--total', type=int, help='udpload 发送的报文总数')
+    parser.add_argument('--duration', type=float, help='udpload 发送时长 / udprecv 接收时长（秒）')
+    parser.add_argument('--pcap', help='把发出的报文写进抓包文件（ip/icmp/tcp/udp），扩展名 .pcapng 时为 pcapng 格式')
+    parser.add_argument('--rotate', type=float, help='抓包文件超过该大小（MB）后换到下一个文件')
+    parser.add_argument('--speed', type=float, default=1.0, help='replay 的速度倍数，0 为全速发送')
+    parser.add_argument('--loops', type=int, default=1, help='replay 的回放次数')
+    parser.add_argument('--profile', help='按阶段剖析 ip/icmp/tcp/udp/dns 的发送路径并写入该文件：.json 为 Chrome Trace，其它为火焰图折叠栈')
+    parser.add_argument('--profile-rate', type=float, default=1.0, help='剖析的报文抽样比例（0~1）')
+    parser.add_argument('--metrics-port', type=int,
+                        help='在 127.0.0.1 的该端口提供运行指标：/metrics 为 Prometheus 格式，/snapshot 为 JSON')
+    return parser
+
+
+def run(argv=None):
+    args = build_parser().parse_args(argv)
+    if not args.targets and not args.file and args.protocol != 'udprecv':
+        args.targets = ['-']
+    if args.protocol == 'udpload' and args.duration is None and args.total is None:
+        args.duration = 10
+    if args.interval is None:
+        args.interval = 0.2 if args.protocol == 'sweep' else 1
+    args.concurrency = max(1, args.concurrency)
+    if args.workers == 0:
+        args.workers = os.cpu_count() or 1
+
+    output = _Output(sys.stdout, JSONSink())
+    writer = None
+    tracer = None
+    try:
+        if args.metrics_port is not None:
+            metrics = importlib.import_module('metrics')
+            metrics.serve(args.metrics_port)
+            output.metrics = metrics.EventMetrics()
+        if args.profile:
+            profiling = importlib.import_module('profiling')
+            tracer = profiling.Tracer(args.profile_rate)
+            profiling.start_tracing(tracer)
+        if args.pcap:
+            writer = _start_recording(args)
+        if args.protocol == 'sweep':
+            _run_sweep(args, output)
+        elif args.protocol == 'scan':
+            _run_scan(args, output)
+        elif args.protocol == 'connect':
+            _run_connect(args, output)
+        elif args.protocol == 'trace':
+            _run_trace(args, output)
+        elif args.protocol == 'udpload':
+            _run_udpload(args, output)
+        elif args.protocol == 'udprecv':
+            _run_udprecv(args, output)
+        elif args.protocol == 'replay':
+            _run_replay(args, output)
+        else:
+            _run_per_target(args, output)
+    except (OSError, ValueError) as e:
+        print(f"错误: {e}", file=sys.stderr)
+        return 2
+    except KeyboardInterrupt:
+        return 130
+    finally:
+        if writer is not None:
+            pcap = importlib.import_module('pcap')
+            pcap.stop_recording()
+            writer.close()
+            if pcap.record_errors:
+                print(f"警告: {pcap.record_errors} 个报文没能写入 {args.pcap}", file=sys.stderr)
+        if tracer is not None:
+            importlib.import_module('profiling').stop_tracing()
+            tracer.write(args.profile)
+    return 1 if output.errors else 0
@@ -0,0 +1,246 @@
+"""
+结构化的结果事件
+
+各协议的发送/探测函数以生成器的形式逐个产生事件（开始、已发送、回复、超时、错误、汇总），
+调用方可以边收边显示，不需要等整个操作结束，内存占用也不随探测数增长。
+文本只是其中一种输出方式：TextSink 按 (协议, 事件类型) 查找格式化函数，
+可以替换或增加格式化函数，也可以直接消费事件做别的处理（如写JSON）。
+"""
+import json
+from collections import namedtuple
+
+from timing import format_summary
+
+# 事件类型
+START = 'start'
+SENT = 'sent'
+REPLY = 'reply'
+TIMEOUT = 'timeout'
+ERROR = 'error'
+PROGRESS = 'progress'
+SUMMARY = 'summary'
+
+# kind: 事件类型；protocol: 'IP'/'ICMP'/'TCP'/'UDP'/'DNS'/'SCAN'/'CONNECT'/'TRACE' 等；target: 目标地址或域名
+# seq: 探测序号；rtt: 往返时间（毫秒）；info: 其余字段
+Event = namedtuple('Event', 'kind protocol target seq rtt info', defaults=(None, None, None))
+
+
+def event(kind, protocol, target, seq=None, rtt=None, **info):
+    return Event(kind, protocol, target, seq, rtt, info)
+
+
+def _ping_summary(e):
+    info = e.info
+    lines = [f"{e.target} 的 Ping 统计信息:",
+             f"    数据包: 已发送 = {info['sent']}, 已接收 = {info['received']}, "
+             f"丢失 = {info['lost']} ({int(info['loss_rate'])}% 丢失)"]
+    if info['received']:
+        lines.append("往返行程的估计时间(以毫秒为单位):")
+        lines.append(f"    {format_summary(info['timings'])}")
+    return '\n'.join(lines)
+
+
+def _sweep_summary(e):
+    info = e.info
+    if not info['received']:
+        return f"{e.target}: 已发送 = {info['sent']}, 已接收 = 0, 丢失 = 100%"
+    timings = info['timings']
+    return (f"{e.target}: 已发送 = {info['sent']}, 已接收 = {info['received']}, "
+            f"丢失 = {int(info['loss_rate'])}%, 最短 = {timings['min']:.3f}ms, "
+            f"最长 = {timings['max']:.3f}ms, 平均 = {timings['avg']:.3f}ms, p90 = {timings['p90']:.3f}ms")
+
+
+def _dns_reply(e):
+    lines = ["查询结果:", f"域名: {e.target}", "IP地址:"]
+    lines += [f"  {ip}" for ip in e.info['answers']]
+    return '\n'.join(lines)
+
+
+def _target_rate(info):
+    """限速发送时在实际速率后面附上目标速率"""
+    return f" (目标 {info['target_pps']:.0f})" if info.get('target_pps') else ""
+
+
+def _load_stats(e):
+    info = e.info
+    return (f"已发送 = {info['packets']}, 发送失败 = {info['errors']}, "
+            f"速率 = {info['pps']:.0f} 包/秒{_target_rate(info)}, "
+            f"{info['bps'] / 1e6:.2f} Mbit/s, 耗时 = {info['elapsed']:.2f} 秒")
+
+
+def _recv_stats(e):
+    info = e.info
+    return (f"会话 {info['session']:08x}: 已接收 = {info['received']}, 丢失 = {info['lost']} "
+            f"({info['loss_rate']:.2f}% 丢失), 乱序 = {info['reordered']}, 重复 = {info['duplicates']}\n"
+            f"    单向时延: {format_summary(info['latency'])}")
+
+
+_SCAN_STATES = {'open': '开放', 'closed': '关闭', 'filtered': '过滤'}
+
+
+def _scan_summary(e):
+    info = e.info
+    lines = [f"开放: {info['open']}, 关闭: {info['closed']}, 过滤: {info['filtered']}",
+             f"已发送 = {info['sent']}, 已接收 = {info['received']}, 发送失败 = {info['send_errors']}"]
+    # 多进程无状态扫描不记录每个探测的发送时间，没有响应时间
+    if info['timings']:
+        lines.append(f"响应时间: {format_summary(info['timings'])}")
+    lines.append(f"发送速率: {info['pps']:.0f} 包/秒{_target_rate(info)}, 总耗时: {info['elapsed']:.2f} 秒")
+    return '\n'.join(lines)
+
+
+_CLOSED_BY = {'rst': 'RST', 'reset': '被对端重置', 'timeout': 'FIN 未确认'}
+_CLOSE_NAMES = dict(_CLOSED_BY, fin='FIN')
+
+
+def _connect_reply(e):
+    info = e.info
+    if info['state'] == 'closed':
+        return f"  {e.target}:{info['port']} 拒绝连接 (RST {e.rtt:.3f}ms)"
+    closed_by = f"FIN {info['close']:.3f}ms" if info['closed_by'] == 'fin' else _CLOSED_BY[info['closed_by']]
+    return (f"  {e.target}:{info['port']} SYN-ACK = {e.rtt:.3f}ms, 握手 = {info['handshake']:.3f}ms, "
+            f"MSS = {info['mss']}, 窗口扩大 = {info['window_scale']}, "
+            f"SACK = {'是' if info['sack_permitted'] else '否'}, 关闭: {closed_by}")
+
+
+def _connect_summary(e):
+    info = e.info
+    return '\n'.join([
+        f"已连接: {info['open']}, 拒绝: {info['closed']}, 超时: {info['timeouts']}",
+        "关闭: " + ", ".join(f"{_CLOSE_NAMES[how]} {count}" for how, count in info['closed_by'].items()),
+        f"SYN-ACK 时间: {format_summary(info['syn_ack'])}",
+        f"握手时间: {format_summary(info['handshake'])}",
+        f"总耗时: {info['elapsed']:.2f} 秒"])
+
+
+def _trace_summary(e):
+    info = e.info
+    result = f"{info['distance']} 跳" if info['reached'] else "未到达"
+    lines = [f"到 {e.target} 的路由: {result}, 复用缓存 {info['cached']} 跳, "
+             f"探测 {info['probes']} 个, 耗时 {info['elapsed']:.2f} 秒"]
+    for ttl, hop, rtt in info['hops']:
+        if hop is None:
+            lines.append(f"  {ttl:>2}  *")
+        else:
+            lines.append(f"  {ttl:>2}  {hop}  " + (f"{rtt:.3f}ms" if rtt is not None else "(缓存)"))
+    return '\n'.join(lines)
+
+
+# 默认的中文文本格式，键为 (协议, 事件类型) 或只有事件类型；值返回 None 表示该事件不输出
+TEXT_FORMATS = {
+    ('IP', SENT): lambda e: f"成功发送IP包到 {e.target}",
+    ('ICMP', START): lambda e: f"正在 Ping {e.target} 具有 {e.info['size']} 字节的数据:",
+    ('ICMP', SENT): lambda e: None,
+    ('ICMP', REPLY): lambda e: (f"来自 {e.info['addr']} 的回复: 字节={e.info['size']} "
+                                f"时间={e.rtt:.3f}ms TTL={e.info['ttl']}"),
+    ('ICMP', TIMEOUT): lambda e: "请求超时",
+    ('ICMP', SUMMARY): _ping_summary,
+    ('SWEEP', REPLY): lambda e: f"来自 {e.target} 的回复: icmp_seq={e.seq} 时间={e.rtt:.3f}ms",
+    ('SWEEP', TIMEOUT): lambda e: f"{e.target}: icmp_seq={e.seq} 请求超时",
+    ('SWEEP', SUMMARY): _sweep_summary,
+    ('TCP', SENT): lambda e: (f"成功发送TCP SYN包到 {e.target}:{e.info['dst_port']}\n"
+                              f"  源端口: {e.info['src_port']}\n  序列号: {e.seq}"),
+    ('UDP', SENT): lambda e: (f"成功发送UDP包到 {e.target}:{e.info['dst_port']}\n"
+                              f"  源端口: {e.info['src_port']}\n  目标端口: {e.info['dst_port']}\n"
+                              f"  数据长度: {len(e.info['data'])} 字节\n  数据: {e.info['data']}"),
+    ('DNS', SENT): lambda e: f"已发送DNS查询到 {e.info['server']} 查询域名: {e.target}",
+    ('DNS', REPLY): _dns_reply,
+    ('DNS', TIMEOUT): lambda e: "查询超时",
+    ('SCAN', REPLY): lambda e: (f"  {e.target}:{e.info['port']} {_SCAN_STATES[e.info['state']]}"
+                                + (f" ({e.rtt:.3f}ms)" if e.rtt is not None else "")),
+    ('SCAN', PROGRESS): _load_stats,
+    ('SWEEP', PROGRESS): _load_stats,
+    ('SCAN', SUMMARY): _scan_summary,
+    ('CONNECT', REPLY): _connect_reply,
+    ('CONNECT', TIMEOUT): lambda e: f"  {e.target}:{e.info['port']} 连接超时",
+    ('CONNECT', SUMMARY): _connect_summary,
+    ('TRACE', REPLY): lambda e: None,
+    ('TRACE', SUMMARY): _trace_summary,
+    ('UDPLOAD', START): lambda e: (f"向 {e.target}:{e.info['dst_port']} 发送UDP负载，"
+                                   f"每包 {e.info['size']} 字节，负载 {e.info['payload']}"),
+    ('UDPLOAD', PROGRESS): _load_stats,
+    ('UDPLOAD', SUMMARY): lambda e: "发送完成: " + _load_stats(e),
+    ('REPLAY', START): lambda e: f"回放 {e.target}，" + (f"{e.info['speed']:g} 倍速" if e.info['speed'] else "全速"),
+    ('REPLAY', PROGRESS): _load_stats,
+    ('REPLAY', SUMMARY): lambda e: (f"回放完成: {_load_stats(e)}\n"
+                                    f"    跳过非IPv4报文 = {e.info['skipped']}, 跳过截断报文 = {e.info['truncated']}"),
+    ('UDPRECV', START): lambda e: f"在 {e.target}:{e.info['port']} 等待UDP负载",
+    ('UDPRECV', PROGRESS): _recv_stats,
+    ('UDPRECV', SUMMARY): _recv_stats,
+    ERROR: lambda e: e.info['message'],
+}
+
+
+class TextSink:
+    """
+    把事件格式化为文本行
+    formats 会覆盖默认格式中的同名键；找不到格式的事件不输出
+    """
+
+    def __init__(self, formats=None):
+        self.formats = dict(TEXT_FORMATS)
+        if formats:
+            self.formats.update(formats)
+
+    def format(self, e):
+        formatter = self.formats.get((e.protocol, e.kind)) or self.formats.get(e.kind)
+        return formatter(e) if formatter is not None else None
+
+    def lines(self, events):
+        """边消费事件边产生文本行；提前关闭时也会关闭事件生成器，释放其中的套接字"""
+        try:
+            for e in events:
+                text = self.format(e)
+                if text is not None:
+                    yield text
+        finally:
+            close = getattr(events, 'close', None)
+            if close is not None:
+                close()
+
+
+def _has_text(value):
+    """对象是否有自己的文本形式（str/repr 不是 object 默认的 <... object at 0x...>）"""
+    cls = type(value)
+    return cls.__str__ is not object.__str__ or cls.__repr__ is not object.__repr__
+
+
+def _json_default(value):
+    """json.dumps 不能直接序列化的值（包括嵌套在列表、字典中的）：bytes 按 latin-1 转为字符串，集合转为列表，其他取 str()"""
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return bytes(value).decode('latin-1')
+    if isinstance(value, (set, frozenset)):
+        return sorted(value, key=str)
+    return str(value) if _has_text(value) else None
+
+
+class JSONSink:
+    """
+    把事件格式化为 JSON Lines，每个事件一行
+    info 中没有文本形式的结果对象（如 PingStats、ScanResult）被省略，
+    其他不能直接序列化的值（如 IPv4Address，包括嵌套的）转为字符串，bytes 按 latin-1 转换
+    """
+
+    def format(self, e):
+        record = {'kind': e.kind, 'protocol': e.protocol, 'target': e.target}
+        if e.seq is not None:
+            record['seq'] = e.seq
+        if e.rtt is not None:
+            record['rtt'] = round(e.rtt, 6)
+        for key, value in (e.info or {}).items():
+            if not _has_text(value):
+                continue
+            record[key] = value
+        return json.dumps(record, ensure_ascii=False, separators=(',', ':'), default=_json_default)
+
+    lines = TextSink.lines
+
+
+def text_stream(events, sink=None):
+    """事件 -> 文本行的生成器，GUI 的后台任务直接逐行显示"""
+    return (sink or TextSink()).lines(events)
+
+
+def to_text(events, sink=None):
+    """消费全部事件，返回完整文本（兼容原来返回字符串的接口）"""
+    return '\n'.join(text_stream(events, sink))
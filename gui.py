@@ -1,7 +1,11 @@
+import re
 import tkinter as tk
 from tkinter import ttk, messagebox
 
+from events import text_stream
 from get_localhost import get_localhost
+from interfaces import inventory
+from jobs import DONE, JobRunner
 
 
 def check_ip(ip: str) -> bool:
@@ -53,12 +57,18 @@ class App:
         # 配置网格布局权重
         self.root.grid_columnconfigure(1, weight=1)
 
+        # 后台任务：发送在线程池中执行，输出经队列交回主线程
+        self.runner = JobRunner(max_workers=4)
+
         # 创建和布局组件
         self._create_ip_port_section()
         self._create_protocol_section()
         self._create_buttons()
         self._create_text_area()
 
+        self.root.protocol("WM_DELETE_WINDOW", self._on_close)
+        self._poll_output()
+
     def _create_ip_port_section(self):
         """创建IP和端口相关的输入区域"""
         # 标签统一样式
@@ -73,7 +83,7 @@ class App:
 
         self.local_ip_combobox = ttk.Combobox(
             self.root,
-            values=get_localhost()[1],
+            values=inventory().addresses(),
             state="readonly",
             width=50  # 增加宽度
         )
@@ -132,6 +142,7 @@ class App:
         button_frame.grid(row=5, column=0, columnspan=2, pady=10)
         button_frame.grid_columnconfigure(0, weight=1)
         button_frame.grid_columnconfigure(1, weight=1)
+        button_frame.grid_columnconfigure(2, weight=1)
 
         # 统一按钮样式
         button_width = 15
@@ -153,6 +164,14 @@ class App:
         )
         self.info_button.grid(row=0, column=1, padx=button_padx)
 
+        self.cancel_button = tk.Button(
+            button_frame,
+            text="取消任务",
+            command=self.cancel_jobs,
+            width=button_width
+        )
+        self.cancel_button.grid(row=0, column=2, padx=button_padx)
+
     def _create_text_area(self):
         """创建文本显示区域"""
         # 创建Frame来容纳文本区域和滚动条
@@ -214,34 +233,66 @@ class App:
             messagebox.showerror(title="error", message="目标ip地址不正确！")
             return
 
-        # 清空文本区域并插入新信息
-        self.text_area.delete(1.0, tk.END)
-        # 根据获取的协议来判断执行什么文件
+        # 没有正在运行的任务时清空文本区域
+        if not self.runner.running_jobs():
+            self.text_area.delete(1.0, tk.END)
+        # 根据获取的协议来判断执行什么文件，事件流在后台线程中逐行格式化并显示
         if selected == 'IP':
-            from IP import send_ip_packet
-            self.text_area.insert(tk.END, send_ip_packet(local_ip, destination_ip))
+            from IP import ip_events
+            self.runner.submit(selected, text_stream, ip_events(local_ip, destination_ip))
         elif selected == 'ICMP':
-            from ICMP import send_icmp_ping
-            self.text_area.insert(tk.END, send_icmp_ping(destination_ip))
+            from ICMP import ping_events
+            self.runner.submit(selected, text_stream, ping_events(destination_ip))
         elif selected == 'TCP':
-            from TCP import send_tcp_syn
-            self.text_area.insert(tk.END, send_tcp_syn(local_ip, local_port, destination_ip, destination_port))
+            from TCP import tcp_syn_events
+            self.runner.submit(selected, text_stream,
+                               tcp_syn_events(local_ip, local_port, destination_ip, destination_port))
         elif selected == 'UDP':
-            from UDP import send_udp_packet
-            self.text_area.insert(tk.END, send_udp_packet(local_port, destination_ip, destination_port))
+            from UDP import udp_events
+            self.runner.submit(selected, text_stream, udp_events(local_port, destination_ip, destination_port))
         else:
-            from DNS import dns_query
-            self.text_area.insert(tk.END, str(dns_query(destination_ip)))
+            from DNS import dns_query_events
+            self.runner.submit(selected, text_stream, dns_query_events(destination_ip))
+
+    def _poll_output(self):
+        """定时取出后台任务的输出并追加到文本区域"""
+        items = self.runner.drain()
+        if items:
+            several = len(self.runner.running_jobs()) > 1 or len({job.id for job, _, _ in items}) > 1
+            for job, kind, text in items:
+                if kind == DONE:
+                    continue
+                # 多个任务同时运行时用任务编号区分输出
+                prefix = f"[{job.id} {job.name}] " if several else ""
+                self.text_area.insert(tk.END, f"{prefix}{text}\n")
+            self.text_area.see(tk.END)
+        self.root.after(50, self._poll_output)
+
+    def cancel_jobs(self):
+        """取消所有正在运行的任务"""
+        self.runner.cancel_all()
+
+    def _on_close(self):
+        self.runner.shutdown()
+        self.root.destroy()
 
     def show_local_info(self):
         # 显示本机信息的逻辑
         localhost = get_localhost()
-        # 接下来更改combobox
-        self.local_ip_combobox['values'] = localhost[1]
-        self.local_ip_combobox.current(0)
+        # 接下来更改combobox：列出所有本机IPv4地址，尽量保留当前选择
+        selected = self.local_ip_combobox.get()
+        addresses = inventory().addresses()
+        self.local_ip_combobox['values'] = addresses
+        self.local_ip_combobox.current(addresses.index(selected) if selected in addresses else 0)
         # 接下来实现更新text
         # 格式化信息为字符串
-        info_str = f"本机主机号：{localhost[0]}\n本机ip地址：{localhost[1]}\n本机mac地址：{localhost[2]}"
+        lines = [f"本机主机号：{localhost[0]}", f"本机ip地址：{localhost[1]}", f"本机mac地址：{localhost[2]}", "", "网络接口："]
+        for iface in inventory().interfaces():
+            state = "启用" if iface.is_up else "停用"
+            lines.append(f"{iface.name}（{state}，MTU {iface.mtu}，MAC {iface.mac}）")
+            lines += [f"    IPv4 {address}/{prefix}" for address, prefix in iface.ipv4]
+            lines += [f"    IPv6 {address}/{prefix}" for address, prefix in iface.ipv6]
+        info_str = '\n'.join(lines)
         # 清空文本区域并插入新信息
         self.text_area.delete(1.0, tk.END)
         self.text_area.insert(tk.END, info_str)
@@ -0,0 +1,317 @@
+"""
+用户态TCP握手探测
+
+在原始套接字上自己完成三次握手：SYN -> SYN-ACK -> ACK，然后按 close 发送 RST（立即释放对端资源）
+或 FIN（再测一次关闭的往返时间，同时确认对端接受了我们的 ACK）。
+测量 SYN 到 SYN-ACK 的时间、从发出 SYN 到发出 ACK 的握手时间（即 connect() 的耗时），
+并解析对端在 SYN-ACK 中协商的 MSS、窗口扩大和 SACK 选项。
+
+所有连接共用一个发送套接字和一个接收套接字，在一个 select 循环里推进，
+每个连接只是字典中的一个小对象，超时由时间轮处理，同时可以有数千个半开连接。
+
+注意：内核不知道这些连接，收到 SYN-ACK 时会自己回一个 RST（不带ACK标志），可能抢在我们的 ACK 之前，
+这时握手时间仍然有效，但 FIN 关闭会被对端重置（closed_by 为 'reset'）。需要真正建立连接时可以让防火墙丢弃内核的这个 RST，
+我们自己发的 RST 带ACK标志，不受影响：
+    iptables -A OUTPUT -p tcp --sport 32768:60999 --tcp-flags RST,ACK RST -j DROP
+"""
+import random
+import select
+import socket
+import time
+
+from bpf import attach_filter, tcp_reply_filter
+from events import PROGRESS, REPLY, SUMMARY, TIMEOUT, event
+from IP import build_ip_header
+from pacing import Pacer
+from scanner import CLOSED, OPEN, TCP_REPLY, parse_ports, parse_targets
+from syn_cookie import PORT_RANGE
+from TCP import TCP_CHECKSUM, TCP_HEADER, TCP_OPTIONS, TCP_WINDOW, calculate_tcp_checksum, parse_tcp_options
+from timer_wheel import TimerWheel
+from timing import ProbeTimings, enable_kernel_timestamps, now_ns, recv_with_timestamp
+
+TCP_FLAG_FIN = 0x01
+TCP_FLAG_SYN = 0x02
+TCP_FLAG_RST = 0x04
+TCP_FLAG_ACK = 0x10
+
+# 连接状态
+SYN_SENT = 'syn_sent'
+FIN_WAIT = 'fin_wait'
+
+# 关闭方式
+CLOSE_RST = 'rst'
+CLOSE_FIN = 'fin'
+
+
+def build_segment(src_ip, dst_ip, src_port, dst_port, seq, ack, flags, options=b''):
+    """构建完整的IP+TCP报文（不带数据）"""
+    tcp_header = bytearray(TCP_HEADER.size + len(options))
+    TCP_HEADER.pack_into(tcp_header, 0, src_port, dst_port, seq, ack,
+                         ((len(tcp_header) // 4) << 12) | flags, TCP_WINDOW, 0, 0)
+    tcp_header[TCP_HEADER.size:] = options
+    TCP_CHECKSUM.pack_into(tcp_header, 16, calculate_tcp_checksum(src_ip, dst_ip, tcp_header))
+    return build_ip_header(src_ip, dst_ip, socket.IPPROTO_TCP, len(tcp_header)) + tcp_header
+
+
+class Connection:
+    """一个探测中的连接"""
+    __slots__ = ('target', 'port', 'src_port', 'attempt', 'iss', 'state', 'probe', 'peer_seq', 'options',
+                 'handshake_ns', 'fin_ns')
+
+    def __init__(self, target, port, src_port, attempt, iss, probe):
+        self.target = target
+        self.port = port
+        self.src_port = src_port
+        self.attempt = attempt
+        self.iss = iss  # 我们的初始序列号
+        self.state = SYN_SENT
+        self.probe = probe  # ProbeTimings 中的探测序号
+        self.peer_seq = 0
+        self.options = {}
+        self.handshake_ns = None
+        self.fin_ns = None
+
+
+class HandshakeProber:
+    """
+    握手探测器
+    close 为 'rst' 或 'fin'；window 为同时进行的连接数上限；rate 为每秒发起的连接数上限（None 不限速），burst 为令牌桶容量
+    """
+
+    def __init__(self, src_ip, close=CLOSE_RST, timeout=2, window=1000, rate=None, port_range=PORT_RANGE,
+                 burst=None):
+        if close not in (CLOSE_RST, CLOSE_FIN):
+            raise ValueError(f"未知的关闭方式: {close}")
+        self.src_ip = src_ip
+        self.close = close
+        self.timeout = timeout
+        self.window = window
+        self.rate = rate
+        self.pacer = Pacer(rate, burst)
+        self.port_range = port_range
+        self.syn_ack = ProbeTimings()  # SYN -> SYN-ACK
+        self.handshake = ProbeTimings()  # SYN -> 发出 ACK
+        self.counts = {OPEN: 0, CLOSED: 0, TIMEOUT: 0}
+        # 开放连接的关闭结果 -> 次数，被对端重置的连接握手已经完成，仍计为开放
+        self.closes = {CLOSE_RST: 0, CLOSE_FIN: 0, 'reset': 0, 'timeout': 0}
+        self.sent = 0  # 发出的报文数（SYN、ACK、FIN、RST）
+        self.send_errors = 0
+        self._connections = {}  # (对端地址, 对端端口, 本地端口) -> Connection
+        self._next_port = random.randint(*port_range)
+        self._wheel = TimerWheel(tick=0.01)
+        self._send_sock = None
+
+    def _open_sockets(self):
+        send_sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_RAW)
+        send_sock.setsockopt(socket.IPPROTO_IP, socket.IP_HDRINCL, 1)
+        recv_sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_TCP)
+        recv_sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        attach_filter(recv_sock, tcp_reply_filter(self.port_range))
+        enable_kernel_timestamps(recv_sock)
+        recv_sock.setblocking(False)
+        return send_sock, recv_sock
+
+    def _allocate_port(self, daddr, dport):
+        """在端口范围内轮流分配本地端口，跳过同一目标上仍在使用的端口"""
+        low, high = self.port_range
+        while True:
+            port = self._next_port
+            self._next_port = low if port >= high else port + 1
+            if (daddr, dport, port) not in self._connections:
+                return port
+
+    def _send(self, conn, seq, ack, flags, options=b''):
+        packet = build_segment(self.src_ip, conn.target, conn.src_port, conn.port, seq, ack, flags, options)
+        try:
+            self._send_sock.sendto(packet, (conn.target, 0))
+            self.sent += 1
+        except OSError:
+            self.send_errors += 1
+
+    def _connect(self, daddr, target, port, attempt):
+        src_port = self._allocate_port(daddr, port)
+        conn = Connection(target, port, src_port, attempt, random.getrandbits(32), None)
+        key = (daddr, port, src_port)
+        self._connections[key] = conn
+        # 选项与 send_tcp_syn 相同：MSS、窗口扩大、SACK许可
+        packet = build_segment(self.src_ip, target, src_port, port, conn.iss, 0, TCP_FLAG_SYN, TCP_OPTIONS)
+        sent_ns = now_ns()
+        conn.probe = self.syn_ack.start(sent_ns)
+        self.handshake.start(sent_ns)
+        try:
+            self._send_sock.sendto(packet, (target, 0))
+            self.sent += 1
+        except OSError:
+            self.send_errors += 1
+        self._wheel.add(key, self.timeout)
+
+    def _result(self, conn, state, closed_by=None, close_ms=None):
+        self.counts[state] += 1
+        if closed_by is not None:
+            self.closes[closed_by] += 1
+        rtt_ns = self.syn_ack.rtt_ns[conn.probe]
+        options = conn.options
+        return event(REPLY, 'CONNECT', conn.target, seq=conn.attempt, rtt=rtt_ns / 1e6, port=conn.port,
+                     state=state, src_port=conn.src_port,
+                     handshake=conn.handshake_ns / 1e6 if conn.handshake_ns is not None else None,
+                     close=close_ms, closed_by=closed_by, mss=options.get('mss'),
+                     window_scale=options.get('window_scale'), sack_permitted=options.get('sack_permitted', False))
+
+    def _finish(self, key):
+        del self._connections[key]
+        self._wheel.cancel(key)
+
+    def _handle(self, view, length, recv_ns):
+        """推进一个连接的状态机，连接结束时返回结果事件"""
+        ihl = (view[0] & 0x0F) * 4
+        if length < ihl + TCP_HEADER.size:
+            return None
+        sport, dport, seq, ack, offset, flags = TCP_REPLY.unpack_from(view, ihl)
+        key = (int.from_bytes(view[12:16], 'big'), sport, dport)
+        conn = self._connections.get(key)
+        if conn is None:
+            return None
+
+        if conn.state == SYN_SENT:
+            if ack != (conn.iss + 1) & 0xFFFFFFFF:
+                return None
+            if flags & TCP_FLAG_RST:
+                self.syn_ack.finish(conn.probe, recv_ns)
+                self._finish(key)
+                return self._result(conn, CLOSED)
+            if flags & (TCP_FLAG_SYN | TCP_FLAG_ACK) != TCP_FLAG_SYN | TCP_FLAG_ACK:
+                return None
+            self.syn_ack.finish(conn.probe, recv_ns)
+            header_length = (offset >> 4) * 4
+            if length >= ihl + header_length > ihl + TCP_HEADER.size:
+                conn.options = parse_tcp_options(view[ihl + TCP_HEADER.size:ihl + header_length])
+            conn.peer_seq = (seq + 1) & 0xFFFFFFFF
+            seq = (conn.iss + 1) & 0xFFFFFFFF
+            self._send(conn, seq, conn.peer_seq, TCP_FLAG_ACK)
+            conn.handshake_ns = self.handshake.finish(conn.probe)
+            if self.close == CLOSE_RST:
+                self._send(conn, seq, conn.peer_seq, TCP_FLAG_RST | TCP_FLAG_ACK)
+                self._finish(key)
+                return self._result(conn, OPEN, 'rst')
+            self._send(conn, seq, conn.peer_seq, TCP_FLAG_FIN | TCP_FLAG_ACK)
+            conn.fin_ns = now_ns()
+            conn.state = FIN_WAIT
+            self._wheel.add(key, self.timeout)
+            return None
+
+        # FIN_WAIT：等待对端确认我们的 FIN
+        if flags & TCP_FLAG_RST:
+            self._finish(key)
+            return self._result(conn, OPEN, 'reset')
+        if not flags & TCP_FLAG_ACK or ack != (conn.iss + 2) & 0xFFFFFFFF:
+            return None
+        close_ms = max(0, recv_ns - conn.fin_ns) / 1e6
+        seq = (conn.iss + 2) & 0xFFFFFFFF
+        if flags & TCP_FLAG_FIN:
+            # 对端同时关闭：确认它的 FIN
+            self._send(conn, seq, (conn.peer_seq + 1) & 0xFFFFFFFF, TCP_FLAG_ACK)
+        else:
+            # 不等对端应用关闭，直接重置以释放对端资源
+            self._send(conn, seq, conn.peer_seq, TCP_FLAG_RST | TCP_FLAG_ACK)
+        self._finish(key)
+        return self._result(conn, OPEN, 'fin', close_ms)
+
+    def _expire(self, key):
+        conn = self._connections.pop(key)
+        if conn.state == SYN_SENT:
+            self.counts[TIMEOUT] += 1
+            return event(TIMEOUT, 'CONNECT', conn.target, seq=conn.attempt, port=conn.port)
+        # 握手已完成，但 FIN 没有被确认
+        self._send(conn, (conn.iss + 2) & 0xFFFFFFFF, conn.peer_seq, TCP_FLAG_RST | TCP_FLAG_ACK)
+        return self._result(conn, OPEN, 'timeout')
+
+    def _progress(self, label, elapsed):
+        counts = self.counts
+        return event(PROGRESS, 'CONNECT', label, sent=self.sent, errors=self.send_errors, open=counts[OPEN],
+                     closed=counts[CLOSED], closed_by=dict(self.closes), in_progress=len(self._connections),
+                     elapsed=elapsed)
+
+    def run(self, probes, label=None, report_interval=1.0):
+        """
+        probes 为 (32位地址, 地址字符串, 端口, 轮次) 的可迭代对象
+        逐个产生每个连接的结果事件（回复或超时）；给出 label 时每 report_interval 秒产生一个进度事件（累计发送数）
+        """
+        self._send_sock, recv_sock = self._open_sockets()
+        probes = iter(probes)
+        pending = next(probes, None)
+        connections = self._connections
+        wheel = self._wheel
+        buffer = bytearray(65535)
+        view = memoryview(buffer)
+        pacer = self.pacer
+        start = time.perf_counter()
+        next_report = start + report_interval if label is not None else None
+        try:
+            while pending is not None or connections:
+                # 填满连接窗口
+                wait = None
+                while pending is not None and len(connections) < self.window:
+                    delay = pacer.delay()
+                    if delay:
+                        wait = delay
+                        break
+                    pacer.take()
+                    self._connect(*pending)
+                    pending = next(probes, None)
+
+                timeout = wheel.next_timeout()
+                if wait is not None:
+                    timeout = wait if timeout is None else min(timeout, wait)
+                if next_report is not None:
+                    report_wait = max(0.0, next_report - time.perf_counter())
+                    timeout = report_wait if timeout is None else min(timeout, report_wait)
+                readable, _, _ = select.select([recv_sock], [], [], timeout)
+                if readable:
+                    while True:
+                        try:
+                            length, _, recv_ns = recv_with_timestamp(recv_sock, buffer)
+                        except BlockingIOError:
+                            break
+                        result = self._handle(view, length, recv_ns)
+                        if result is not None:
+                            yield result
+
+                for key in wheel.advance():
+                    yield self._expire(key)
+                if next_report is not None:
+                    now = time.perf_counter()
+                    if now >= next_report:
+                        next_report = now + report_interval
+                        yield self._progress(label, now - start)
+        finally:
+            self._send_sock.close()
+            recv_sock.close()
+            connections.clear()
+
+
+def _probes(targets, ports, count):
+    ports = parse_ports(ports)
+    targets = list(parse_targets(targets))
+    for attempt in range(count):
+        for daddr in targets:
+            target = socket.inet_ntoa(daddr.to_bytes(4, 'big'))
+            for port in ports:
+                yield daddr, target, port, attempt
+
+
+def handshake_events(src_ip, targets, ports, count=1, close=CLOSE_RST, timeout=2, window=1000, rate=None,
+                     burst=None, report_interval=1.0):
+    """
+    对每个 (目标, 端口) 做 count 次握手探测
+    产生每个连接的回复/超时事件和每 report_interval 秒的进度事件，最后产生汇总事件（SYN-ACK 时间和握手时间的统计）
+    """
+    prober = HandshakeProber(src_ip, close, timeout, window, rate, burst=burst)
+    start = time.perf_counter()
+    label = targets if isinstance(targets, str) else ','.join(targets)
+    yield from prober.run(_probes(targets, ports, count), label, report_interval)
+    counts = prober.counts
+    yield event(SUMMARY, 'CONNECT', label, attempts=len(prober.syn_ack), open=counts[OPEN],
+                closed=counts[CLOSED], closed_by=dict(prober.closes), timeouts=counts[TIMEOUT],
+                sent=prober.sent, send_errors=prober.send_errors,
+                syn_ack=prober.syn_ack.summary(), handshake=prober.handshake.summary(),
+                elapsed=time.perf_counter() - start)
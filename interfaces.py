@@ -0,0 +1,320 @@
+"""
+本机网络接口清单
+
+通过 AF_NETLINK 的 RTM_GETLINK / RTM_GETADDR 转储一次性读出所有接口、MAC 和 IPv4/IPv6 地址，
+不启动子进程，也不需要连接外部地址；没有 netlink 时退化为读取 /sys/class/net 和 /proc/net/if_inet6。
+结果缓存在 InterfaceInventory 中，同时订阅 netlink 的链路/地址变化组播，
+收到变化通知后下次读取时才重新转储，平时读取只是一次非阻塞的 recv。
+"""
+import fcntl
+import os
+import socket
+import struct
+import threading
+import time
+
+NETLINK_ROUTE = 0
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+RTM_NEWLINK = 16
+RTM_GETLINK = 18
+RTM_NEWADDR = 20
+RTM_GETADDR = 22
+NLM_F_REQUEST = 0x1
+NLM_F_DUMP = 0x300
+RTMGRP_LINK = 0x1
+RTMGRP_IPV4_IFADDR = 0x10
+RTMGRP_IPV6_IFADDR = 0x100
+
+IFLA_ADDRESS = 1
+IFLA_IFNAME = 3
+IFLA_MTU = 4
+IFA_ADDRESS = 1
+IFA_LOCAL = 2
+IFF_UP = 0x1
+IFF_LOOPBACK = 0x8
+SIOCGIFADDR = 0x8915
+SIOCGIFNETMASK = 0x891B
+
+_NLMSGHDR = struct.Struct('=IHHII')
+_RTGENMSG = struct.Struct('=Bxxx')
+_IFINFOMSG = struct.Struct('=BxHiII')
+_IFADDRMSG = struct.Struct('=BBBBI')
+_RTATTR = struct.Struct('=HH')
+_U32 = struct.Struct('=I')
+
+
+class Interface:
+    """一个网络接口；ipv4/ipv6 为 [(地址, 前缀长度)]"""
+    __slots__ = ('index', 'name', 'mac', 'mtu', 'flags', 'ipv4', 'ipv6')
+
+    def __init__(self, index, name, mac=None, mtu=0, flags=0):
+        self.index = index
+        self.name = name
+        self.mac = mac
+        self.mtu = mtu
+        self.flags = flags
+        self.ipv4 = []
+        self.ipv6 = []
+
+    @property
+    def is_up(self):
+        return bool(self.flags & IFF_UP)
+
+    @property
+    def is_loopback(self):
+        return bool(self.flags & IFF_LOOPBACK)
+
+    def __repr__(self):
+        return f"Interface({self.name!r}, mac={self.mac!r}, ipv4={self.ipv4!r}, ipv6={self.ipv6!r})"
+
+
+def _format_mac(data):
+    return '-'.join(f'{b:02X}' for b in data)
+
+
+def _attributes(view, offset, end):
+    """逐个生成 rtattr 的 (类型, 值视图)"""
+    while offset + _RTATTR.size <= end:
+        length, kind = _RTATTR.unpack_from(view, offset)
+        if length < _RTATTR.size:
+            break
+        yield kind, view[offset + _RTATTR.size:offset + length]
+        offset += (length + 3) & ~3
+
+
+def _netlink_dump(sock, msg_type, seq, buffer):
+    """发送一个转储请求，逐个生成回复消息的 (类型, 视图, 正文偏移, 消息结束)"""
+    request = _NLMSGHDR.pack(_NLMSGHDR.size + _RTGENMSG.size, msg_type, NLM_F_REQUEST | NLM_F_DUMP, seq, 0)
+    sock.send(request + _RTGENMSG.pack(socket.AF_UNSPEC))
+    view = memoryview(buffer)
+    while True:
+        received = sock.recv_into(buffer)
+        offset = 0
+        while offset + _NLMSGHDR.size <= received:
+            length, kind, _, reply_seq, _ = _NLMSGHDR.unpack_from(view, offset)
+            if length < _NLMSGHDR.size:
+                return
+            if reply_seq == seq:
+                if kind == NLMSG_DONE:
+                    return
+                if kind == NLMSG_ERROR:
+                    raise OSError("netlink 转储失败")
+                yield kind, view, offset + _NLMSGHDR.size, offset + length
+            offset += (length + 3) & ~3
+
+
+def _parse_link(view, offset, end):
+    """解析 RTM_NEWLINK 的正文（ifinfomsg + 属性），返回 Interface"""
+    _, _, index, flags, _ = _IFINFOMSG.unpack_from(view, offset)
+    iface = Interface(index, '', flags=flags)
+    for attr, value in _attributes(view, offset + _IFINFOMSG.size, end):
+        if attr == IFLA_IFNAME:
+            iface.name = bytes(value).rstrip(b'\0').decode()
+        elif attr == IFLA_ADDRESS:
+            iface.mac = _format_mac(value)
+        elif attr == IFLA_MTU:
+            # netlink 属性是主机字节序
+            iface.mtu = _U32.unpack_from(value)[0]
+    return iface
+
+
+def _parse_address(view, offset, end):
+    """解析 RTM_NEWADDR 的正文（ifaddrmsg + 属性），返回 (接口索引, 地址族, 地址, 前缀长度)，没有地址时返回 None"""
+    family, prefixlen, _, _, index = _IFADDRMSG.unpack_from(view, offset)
+    attrs = dict((attr, bytes(value)) for attr, value in _attributes(view, offset + _IFADDRMSG.size, end))
+    # 点对点接口上 IFA_ADDRESS 是对端地址，本机地址在 IFA_LOCAL
+    address = attrs.get(IFA_LOCAL) or attrs.get(IFA_ADDRESS)
+    if address is None or family not in (socket.AF_INET, socket.AF_INET6):
+        return None
+    return index, family, socket.inet_ntop(family, address), prefixlen
+
+
+def read_netlink():
+    """一次 netlink 往返读出所有接口，返回 {索引: Interface}"""
+    result = {}
+    buffer = bytearray(1 << 16)
+    with socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE) as sock:
+        sock.bind((0, 0))
+        for kind, view, offset, end in _netlink_dump(sock, RTM_GETLINK, 1, buffer):
+            if kind == RTM_NEWLINK:
+                iface = _parse_link(view, offset, end)
+                result[iface.index] = iface
+
+        for kind, view, offset, end in _netlink_dump(sock, RTM_GETADDR, 2, buffer):
+            if kind != RTM_NEWADDR:
+                continue
+            parsed = _parse_address(view, offset, end)
+            if parsed is None or parsed[0] not in result:
+                continue
+            index, family, address, prefixlen = parsed
+            iface = result[index]
+            (iface.ipv4 if family == socket.AF_INET else iface.ipv6).append((address, prefixlen))
+    return result
+
+
+def _read_sys_file(path, default=None):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return default
+
+
+def read_sysfs(root='/sys/class/net'):
+    """没有 netlink 时的退化实现：/sys/class/net 读链路，ioctl 读IPv4地址和掩码，/proc/net/if_inet6 读IPv6地址"""
+    result = {}
+    by_name = {}
+    probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        for name in os.listdir(root):
+            path = os.path.join(root, name)
+            index = int(_read_sys_file(os.path.join(path, 'ifindex'), '0'))
+            flags = int(_read_sys_file(os.path.join(path, 'flags'), '0'), 16)
+            mac = _read_sys_file(os.path.join(path, 'address'))
+            iface = Interface(index, name, mac.replace(':', '-').upper() if mac else None,
+                              int(_read_sys_file(os.path.join(path, 'mtu'), '0')), flags)
+            try:
+                request = struct.pack('256s', name.encode()[:15])
+                address = fcntl.ioctl(probe.fileno(), SIOCGIFADDR, request)[20:24]
+                netmask = fcntl.ioctl(probe.fileno(), SIOCGIFNETMASK, request)[20:24]
+                iface.ipv4.append((socket.inet_ntoa(address), bin(int.from_bytes(netmask, 'big')).count('1')))
+            except OSError:
+                pass
+            result[index] = by_name[name] = iface
+    finally:
+        probe.close()
+    try:
+        with open('/proc/net/if_inet6') as f:
+            for line in f:
+                fields = line.split()
+                iface = by_name.get(fields[5])
+                if iface is not None:
+                    address = socket.inet_ntop(socket.AF_INET6, bytes.fromhex(fields[0]))
+                    iface.ipv6.append((address, int(fields[2], 16)))
+    except OSError:
+        pass
+    return result
+
+
+def default_route_interface():
+    """/proc/net/route 中默认路由所在的接口名，没有时返回 None"""
+    try:
+        with open('/proc/net/route') as f:
+            next(f)
+            for line in f:
+                fields = line.split()
+                if len(fields) > 7 and fields[1] == '00000000' and fields[7] == '00000000':
+                    return fields[0]
+    except (OSError, StopIteration):
+        pass
+    return None
+
+
+class InterfaceInventory:
+    """
+    缓存的接口清单
+    使用 netlink 时订阅链路和地址变化的组播，有变化才重新读取；
+    退化为 /sys/class/net 时缓存 max_age 秒
+    """
+
+    def __init__(self, max_age=5.0):
+        self.max_age = max_age
+        self._interfaces = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        self._monitor = self._open_monitor()
+
+    @staticmethod
+    def _open_monitor():
+        try:
+            sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE)
+        except (OSError, AttributeError):
+            return None
+        try:
+            sock.bind((0, RTMGRP_LINK | RTMGRP_IPV4_IFADDR | RTMGRP_IPV6_IFADDR))
+            sock.setblocking(False)
+        except OSError:
+            sock.close()
+            return None
+        return sock
+
+    def _changed(self):
+        """读空变化通知队列，有通知（或队列溢出）时返回 True"""
+        changed = False
+        while True:
+            try:
+                if not self._monitor.recv(65536):
+                    return changed
+                changed = True
+            except BlockingIOError:
+                return changed
+            except OSError:
+                # ENOBUFS：通知太多被内核丢弃，也按有变化处理
+                return True
+
+    def _stale(self):
+        if self._interfaces is None:
+            return True
+        if self._monitor is not None:
+            return self._changed()
+        return time.monotonic() - self._loaded_at > self.max_age
+
+    def interfaces(self, refresh=False):
+        """返回按索引排序的 Interface 列表"""
+        with self._lock:
+            if refresh or self._stale():
+                try:
+                    interfaces = read_netlink() if self._monitor is not None else read_sysfs()
+                except OSError:
+                    interfaces = read_sysfs()
+                self._interfaces = [interfaces[index] for index in sorted(interfaces)]
+                self._loaded_at = time.monotonic()
+            return self._interfaces
+
+    def addresses(self, family=socket.AF_INET, include_loopback=True):
+        """
+        所有本机地址；默认路由所在接口的地址排在最前，环回地址排在最后
+        """
+        primary = default_route_interface()
+        result = []
+        for iface in self.interfaces():
+            if iface.is_loopback and not include_loopback:
+                continue
+            entries = iface.ipv4 if family == socket.AF_INET else iface.ipv6
+            rank = 0 if iface.name == primary else (2 if iface.is_loopback else 1)
+            result += [(rank, address) for address, _ in entries]
+        return [address for _, address in sorted(result, key=lambda item: item[0])]
+
+    def primary(self):
+        """默认路由所在（或第一个已启用的非环回）接口"""
+        name = default_route_interface()
+        fallback = None
+        for iface in self.interfaces():
+            if iface.name == name:
+                return iface
+            if fallback is None and iface.is_up and not iface.is_loopback and iface.ipv4:
+                fallback = iface
+        return fallback
+
+    def close(self):
+        if self._monitor is not None:
+            self._monitor.close()
+            self._monitor = None
+
+
+_inventory = None
+_inventory_lock = threading.Lock()
+
+
+def inventory():
+    """进程内共享的接口清单"""
+    global _inventory
+    with _inventory_lock:
+        if _inventory is None:
+            _inventory = InterfaceInventory()
+        return _inventory
+
+
+def local_addresses(family=socket.AF_INET, include_loopback=True):
+    return inventory().addresses(family, include_loopback)
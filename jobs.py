@@ -0,0 +1,102 @@
+"""
+GUI 后台任务执行层
+
+任务在线程池中运行，输出通过线程安全的队列交回主线程；Tk 主线程用 root.after 定时取出并显示，
+所以发送、等待回复期间界面不会卡住，多个任务也可以同时运行。
+
+任务函数可以直接返回字符串，也可以返回生成器（如 events.text_stream）——每产生一项就立即显示一行，
+取消在两项之间生效（已经阻塞在系统调用里的步骤会等它返回后再停止）。
+"""
+import itertools
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+LINE = 'line'
+DONE = 'done'
+ERROR = 'error'
+
+
+class Job:
+    """一个提交给 JobRunner 的任务"""
+
+    def __init__(self, job_id, name):
+        self.id = job_id
+        self.name = name
+        self.cancelled = threading.Event()
+        self.future = None
+
+    def cancel(self):
+        self.cancelled.set()
+        if self.future is not None:
+            # 还没开始运行的任务直接取消
+            self.future.cancel()
+
+    @property
+    def running(self):
+        return self.future is not None and not self.future.done()
+
+
+class JobRunner:
+    def __init__(self, max_workers=4):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._ids = itertools.count(1)
+        self._jobs = {}
+        self.output = queue.SimpleQueue()  # (Job, 类型, 文本)
+
+    def submit(self, name, func, *args, **kwargs):
+        """提交任务，返回 Job；输出按 (Job, LINE/DONE/ERROR, 文本) 放入 output 队列"""
+        job = Job(next(self._ids), name)
+        self._jobs[job.id] = job
+        job.future = self._executor.submit(self._run, job, func, args, kwargs)
+        # 排队中被取消的任务不会执行 _run，这里补上结束通知
+        job.future.add_done_callback(lambda future: future.cancelled() and self.output.put((job, DONE, None)))
+        return job
+
+    def _run(self, job, func, args, kwargs):
+        put = self.output.put
+        try:
+            if job.cancelled.is_set():
+                return
+            result = func(*args, **kwargs)
+            if result is None:
+                pass
+            elif isinstance(result, str):
+                put((job, LINE, result))
+            else:
+                for item in result:
+                    if job.cancelled.is_set():
+                        put((job, LINE, "已取消"))
+                        close = getattr(result, 'close', None)
+                        if close is not None:
+                            close()
+                        break
+                    put((job, LINE, str(item)))
+        except Exception as e:
+            put((job, ERROR, f"发生错误: {e}"))
+        finally:
+            put((job, DONE, None))
+
+    def drain(self, limit=500):
+        """取出最多 limit 条待显示的输出（在主线程中调用，不阻塞）"""
+        items = []
+        for _ in range(limit):
+            try:
+                item = self.output.get_nowait()
+            except queue.Empty:
+                break
+            if item[1] == DONE:
+                self._jobs.pop(item[0].id, None)
+            items.append(item)
+        return items
+
+    def running_jobs(self):
+        return [job for job in self._jobs.values() if not job.cancelled.is_set()]
+
+    def cancel_all(self):
+        for job in list(self._jobs.values()):
+            job.cancel()
+
+    def shutdown(self):
+        self.cancel_all()
+        self._executor.shutdown(wait=False, cancel_futures=True)
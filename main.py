@@ -1,13 +1,21 @@
-import tkinter as tk
+import sys
 
-from gui import App
 
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv:
+        # 带参数时为命令行模式，不导入 tkinter 和图形界面
+        from cli import run
+        return run(argv)
+
+    import tkinter as tk
+
+    from gui import App
 
-def main():
     root = tk.Tk()
     app = App(root)
     app.run()
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,329 @@
+"""
+运行指标：计数器和RTT直方图
+
+计数器和直方图在每个线程中各有一个单元，热路径上的 inc()/observe() 只改本线程的单元，不加锁；
+读取时把所有线程的单元加起来。直方图按对数分桶（每档翻倍，10微秒到约40秒），记录时用 bisect 找桶。
+
+指标可以通过 snapshot() 读取（字典），也可以用 prometheus_text() 生成 Prometheus 文本格式，
+serve() 在后台线程里起一个小HTTP服务：/metrics 为 Prometheus 格式，/snapshot 为 JSON。
+
+各协议的收发计数和RTT由 EventMetrics 从事件流得到（见 events），不需要改动各协议的发送循环：
+    metrics = EventMetrics()
+    for e in metrics.observe(ping_events('10.0.0.1')):
+        ...
+"""
+import json
+import threading
+from bisect import bisect_left
+
+# RTT直方图的桶上界（秒）：10微秒起每档翻倍
+RTT_BUCKETS = tuple(1e-5 * 2 ** i for i in range(23))
+
+COUNTER = 'counter'
+HISTOGRAM = 'histogram'
+
+
+class _Cells:
+    """每个线程一个单元，只有线程第一次使用时加锁登记；线程结束后单元保留，计数不会丢"""
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._local = threading.local()
+        self._cells = []
+        self._lock = threading.Lock()
+
+    def cell(self):
+        try:
+            return self._local.cell
+        except AttributeError:
+            cell = self._factory()
+            with self._lock:
+                self._cells.append(cell)
+            self._local.cell = cell
+            return cell
+
+    def all(self):
+        with self._lock:
+            return list(self._cells)
+
+
+class Counter:
+    """只增不减的计数器"""
+    kind = COUNTER
+
+    def __init__(self, name, help_text='', labels=None):
+        self.name = name
+        self.help = help_text
+        self.labels = labels or {}
+        self._cells = _Cells(lambda: [0])
+
+    def inc(self, n=1):
+        self._cells.cell()[0] += n
+
+    @property
+    def value(self):
+        return sum(cell[0] for cell in self._cells.all())
+
+
+class Histogram:
+    """对数分桶的直方图，buckets 为升序的桶上界，超过最后一个上界的落在 +Inf 桶"""
+    kind = HISTOGRAM
+
+    def __init__(self, name, help_text='', labels=None, buckets=RTT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = labels or {}
+        self.buckets = tuple(buckets)
+        size = len(self.buckets) + 1
+        # 单元为 [各桶计数, 总和]
+        self._cells = _Cells(lambda: [[0] * size, 0.0])
+
+    def observe(self, value):
+        cell = self._cells.cell()
+        cell[0][bisect_left(self.buckets, value)] += 1
+        cell[1] += value
+
+    def counts(self):
+        """各桶（不累计）的计数，最后一项为 +Inf 桶"""
+        totals = [0] * (len(self.buckets) + 1)
+        for cell in self._cells.all():
+            for index, count in enumerate(cell[0]):
+                totals[index] += count
+        return totals
+
+    @property
+    def sum(self):
+        return sum(cell[1] for cell in self._cells.all())
+
+    @property
+    def count(self):
+        return sum(self.counts())
+
+    def quantile(self, q):
+        """按桶估计分位数（返回所在桶的上界），没有观测值时返回 None"""
+        counts = self.counts()
+        total = sum(counts)
+        if not total:
+            return None
+        rank = q * total
+        running = 0
+        for index, count in enumerate(counts):
+            running += count
+            if running >= rank:
+                return self.buckets[index] if index < len(self.buckets) else float('inf')
+        return float('inf')
+
+
+class Registry:
+    """按 (名字, 标签) 保存指标，同名同标签只创建一次"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, help_text, labels, **kwargs):
+        key = (name, tuple(sorted(labels.items())))
+        metric = self._metrics.get(key)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.get(key)
+                if metric is None:
+                    metric = self._metrics[key] = cls(name, help_text, labels, **kwargs)
+        if not isinstance(metric, cls):
+            raise ValueError(f"指标 {name} 已注册为 {metric.kind}")
+        return metric
+
+    def counter(self, name, help_text='', **labels):
+        return self._get(Counter, name, help_text, labels)
+
+    def histogram(self, name, help_text='', buckets=RTT_BUCKETS, **labels):
+        return self._get(Histogram, name, help_text, labels, buckets=buckets)
+
+    def metrics(self):
+        with self._lock:
+            return list(self._metrics.values())
+
+    def snapshot(self):
+        """
+        当前所有指标的值：{名字: [{'labels': {...}, 'value': 值}]}，
+        直方图的值为 {'buckets': {上界: 累计计数}, 'sum': 总和, 'count': 总数}
+        """
+        result = {}
+        for metric in self.metrics():
+            if metric.kind == COUNTER:
+                value = metric.value
+            else:
+                counts = metric.counts()
+                cumulative, running = {}, 0
+                for bound, count in zip(metric.buckets + ('+Inf',), counts):
+                    running += count
+                    cumulative[_format_value(bound)] = running
+                value = {'buckets': cumulative, 'sum': metric.sum, 'count': running}
+            result.setdefault(metric.name, []).append({'labels': dict(metric.labels), 'value': value})
+        return result
+
+    def prometheus_text(self):
+        """Prometheus 文本格式（0.0.4）"""
+        lines = []
+        families = {}
+        for metric in self.metrics():
+            families.setdefault(metric.name, []).append(metric)
+        for name in sorted(families):
+            metrics = families[name]
+            lines.append(f"# HELP {name} {_escape_help(metrics[0].help)}")
+            lines.append(f"# TYPE {name} {metrics[0].kind}")
+            for metric in metrics:
+                if metric.kind == COUNTER:
+                    lines.append(f"{name}{_format_labels(metric.labels)} {_format_value(metric.value)}")
+                    continue
+                running = 0
+                for bound, count in zip(metric.buckets + (float('inf'),), metric.counts()):
+                    running += count
+                    labels = dict(metric.labels, le=_format_value(bound))
+                    lines.append(f"{name}_bucket{_format_labels(labels)} {running}")
+                lines.append(f"{name}_sum{_format_labels(metric.labels)} {_format_value(metric.sum)}")
+                lines.append(f"{name}_count{_format_labels(metric.labels)} {running}")
+        return '\n'.join(lines) + '\n'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def _escape_help(text):
+    return text.replace('\\', '\\\\').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    parts = []
+    for key, value in sorted(labels.items()):
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{key}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+
+# 进程内默认的指标表
+REGISTRY = Registry()
+
+
+def counter(name, help_text='', **labels):
+    return REGISTRY.counter(name, help_text, **labels)
+
+
+def histogram(name, help_text='', buckets=RTT_BUCKETS, **labels):
+    return REGISTRY.histogram(name, help_text, buckets, **labels)
+
+
+def snapshot():
+    return REGISTRY.snapshot()
+
+
+def prometheus_text():
+    return REGISTRY.prometheus_text()
+
+
+class EventMetrics:
+    """
+    从事件流统计各协议的指标：
+    已发送事件计发送数，回复计接收数并记录RTT，超时事件计超时数；
+    错误计入 rawsock_errors_total，kind="event" 为错误事件（套接字创建、解析、发送等各类失败），
+    kind="send" 为批量发送路径在进度/汇总事件中报告的发送失败数；
+    批量发送的路径（scan/sweep/connect/trace/udpload/replay）没有逐包的已发送事件，发送数取进度/汇总事件中的累计值的增量，
+    trace 的探测超时没有逐个的事件，超时数同样取累计值
+    """
+
+    def __init__(self, registry=None):
+        self.registry = REGISTRY if registry is None else registry
+        self._per_packet = set()  # 产生过逐包已发送事件的协议
+        self._per_timeout = set()  # 产生过逐个超时事件的协议
+        self._totals = {}  # (协议, 目标, 指标) -> 上次看到的累计值
+        self._lock = threading.Lock()
+
+    def _counter(self, name, help_text, protocol, **labels):
+        return self.registry.counter(name, help_text, protocol=protocol, **labels)
+
+    def _cumulative(self, e, field, metric, help_text, **labels):
+        value = e.info.get(field)
+        if not isinstance(value, int):
+            return
+        # 进度和汇总事件的字段名可能不同（packets/sent），按指标累计才不会重复计数
+        key = (e.protocol, e.target, metric)
+        with self._lock:
+            delta = value - self._totals.get(key, 0)
+            self._totals[key] = value
+        if delta > 0:
+            self._counter(metric, help_text, e.protocol, **labels).inc(delta)
+
+    def record(self, e):
+        protocol = e.protocol
+        kind = e.kind
+        if kind == 'sent':
+            self._per_packet.add(protocol)
+            self._counter('rawsock_packets_sent_total', '已发送的报文数', protocol).inc()
+        elif kind == 'reply':
+            self._counter('rawsock_packets_received_total', '收到的回复数', protocol).inc()
+            if e.rtt is not None:
+                self.registry.histogram('rawsock_rtt_seconds', '往返时间（秒）', protocol=protocol).observe(e.rtt / 1e3)
+        elif kind == 'timeout':
+            self._per_timeout.add(protocol)
+            self._counter('rawsock_timeouts_total', '超时的探测数', protocol).inc()
+        elif kind == 'error':
+            self._counter('rawsock_errors_total', '错误数', protocol, kind='event').inc()
+        elif kind in ('progress', 'summary'):
+            if protocol not in self._per_packet:
+                field = 'packets' if 'packets' in e.info else 'sent'
+                self._cumulative(e, field, 'rawsock_packets_sent_total', '已发送的报文数')
+                self._cumulative(e, 'errors' if 'errors' in e.info else 'send_errors', 'rawsock_errors_total',
+                                 '错误数', kind='send')
+            if protocol not in self._per_timeout:
+                self._cumulative(e, 'timeouts', 'rawsock_timeouts_total', '超时的探测数')
+
+    def observe(self, events):
+        """边统计边原样产生事件"""
+        for e in events:
+            self.record(e)
+            yield e
+
+
+def serve(port=9464, host='127.0.0.1', registry=None):
+    """
+    在后台线程中启动指标HTTP服务，返回服务器对象（server.server_address 为实际地址，shutdown() 停止）
+    GET /metrics 为 Prometheus 文本格式，GET /snapshot 为 JSON
+    """
+    # 只有启动服务时才需要 http.server
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    registry = REGISTRY if registry is None else registry
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            path = self.path.split('?', 1)[0]
+            if path in ('/', '/metrics'):
+                body = registry.prometheus_text().encode('utf-8')
+                content_type = 'text/plain; version=0.0.4; charset=utf-8'
+            elif path == '/snapshot':
+                body = json.dumps(registry.snapshot(), ensure_ascii=False).encode('utf-8')
+                content_type = 'application/json; charset=utf-8'
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # 不在标准错误上打印每个请求
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    return server
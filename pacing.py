@@ -0,0 +1,94 @@
+"""
+发送节奏控制（令牌桶）
+
+所有按速率发送的路径共用同一个 Pacer：平均每秒放行 rate 个报文，桶里最多攒 burst 个令牌，
+空闲之后最多一次连续放行 burst 个，批量发送（sendmmsg）时每批取一次令牌。
+实现为等价的 GCRA（虚拟调度时间）：只记录下一个令牌的理论时间，不需要定时补充令牌。
+
+等待时先 time.sleep 到截止时间前 SPIN 秒，剩下的一小段忙等 perf_counter，
+避免 sleep 的定时器松弛（Linux 上约50微秒）让高速率下的间隔变长。
+"""
+import time
+
+SPIN = 0.0002  # 截止前忙等的秒数
+DEFAULT_BURST_TIME = 0.005  # 未指定 burst 时，允许连续放行约5毫秒的报文，足以补上一次调度延迟
+
+_clock = time.perf_counter
+
+
+def sleep_until(deadline, spin=SPIN):
+    """等到 perf_counter() 到达 deadline：先睡眠，最后 spin 秒忙等"""
+    remaining = deadline - _clock()
+    if remaining > spin:
+        time.sleep(remaining - spin)
+    while _clock() < deadline:
+        pass
+
+
+class Pacer:
+    """
+    令牌桶限速器
+    rate 为每秒报文数，None 或0表示不限速（wait 立即返回）；burst 为 None 时取 rate * DEFAULT_BURST_TIME（至少为1）
+    wait(n) 阻塞到可以发送 n 个报文；select 循环中用 delay(n) 得到需要等待的秒数，到时再 take(n)
+    """
+
+    def __init__(self, rate=None, burst=None, spin=SPIN):
+        self.rate = rate or None
+        self.interval = 1.0 / rate if rate else 0.0
+        if burst is None:
+            burst = int(rate * DEFAULT_BURST_TIME) if rate else 1
+        self.burst = max(1, int(burst))
+        self.spin = spin
+        self.sent = 0
+        self.start = None  # 第一次放行的时间
+        self._first = 0  # 第一次放行的报文数，不计入实际速率（它们在计时开始时就发出了）
+        self._tat = None  # 已放行报文按速率排下去的理论完成时间
+
+    def delay(self, n=1, now=None):
+        """
+        距离可以放行 n 个报文还需要的秒数，0 表示现在就可以
+        批量取令牌时第一个报文可以发送即放行整批，其余报文预支之后的令牌，下一批相应推迟
+        """
+        if not self.interval or self._tat is None:
+            return 0.0
+        now = _clock() if now is None else now
+        return max(0.0, self._tat - (self.burst - 1) * self.interval - now)
+
+    def take(self, n=1, now=None):
+        """记录放行了 n 个报文（不等待）"""
+        now = _clock() if now is None else now
+        if self.start is None:
+            self.start = now
+            self._first = n
+            # 桶从空开始，开头不会先冲出 burst 个报文；空闲之后才攒下令牌
+            self._tat = now + (self.burst - 1) * self.interval
+        self.sent += n
+        if self.interval:
+            # 空闲期间不累积超过 burst 个令牌：理论时间落后于现在时从现在算起
+            self._tat = max(self._tat, now) + n * self.interval
+
+    def wait(self, n=1):
+        """等到可以发送 n 个报文，并取走令牌"""
+        if self.interval:
+            now = _clock()
+            delay = self.delay(n, now)
+            if delay > 0:
+                # 按计划时间而不是醒来的时间记账，调度延迟不会累积成速率偏低
+                now += delay
+                sleep_until(now, self.spin)
+            self.take(n, now)
+        else:
+            self.take(n)
+
+    def achieved(self, now=None):
+        """从第一次放行到现在的实际速率（报文/秒），应在最后一次放行之后立即读取"""
+        if self.start is None:
+            return 0.0
+        elapsed = (_clock() if now is None else now) - self.start
+        return (self.sent - self._first) / elapsed if elapsed > 0 else 0.0
+
+    def stats(self, now=None):
+        """目标速率、实际速率和偏差（百分比，不限速时为 None）"""
+        achieved = self.achieved(now)
+        return {'target': self.rate, 'achieved': achieved,
+                'error': (achieved / self.rate - 1) * 100 if self.rate else None}
@@ -0,0 +1,392 @@
+"""
+pcap / pcapng 读写和回放
+
+PcapWriter 以流的方式写抓包文件：记录先追加到内存缓冲区，攒够 buffer_size 字节才写一次文件，
+可按文件大小轮转（out.pcap、out.1.pcap、out.2.pcap ...）。时间戳精度为纳秒，
+链路类型默认为 LINKTYPE_RAW（报文直接从IP头开始），Wireshark/tcpdump 可以直接打开。
+
+start_recording(writer) 之后，send_ip_packet、send_tcp_syn、send_udp_packet、send_icmp_ping
+发出的每个报文都会写进 writer；UDP/ICMP 的IP头由内核生成，记录时补上一个等价的IP头。
+
+read_capture 通过 mmap 读取 pcap 或 pcapng 文件，逐个生成报文视图，不把整个文件读进内存；
+replay_events 按原始时间间隔（或按 speed 加速/减速）用 BatchSender 批量重新发送其中的IPv4报文。
+"""
+import functools
+import mmap
+import os
+import socket
+import struct
+import threading
+import time
+
+import IP
+from events import PROGRESS, START, SUMMARY, event
+from pacing import sleep_until
+
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_LINUX_SLL2 = 276
+
+PCAP_MAGIC = 0xA1B2C3D4  # 微秒时间戳
+PCAP_MAGIC_NS = 0xA1B23C4D  # 纳秒时间戳
+PCAP_HEADER = struct.Struct('=IHHiIII')  # 魔数、版本号、时区、精度、快照长度、链路类型
+PCAP_RECORD = struct.Struct('=IIII')  # 秒、秒以下部分、保存长度、原始长度
+
+PCAPNG_SHB = 0x0A0D0D0A
+PCAPNG_IDB = 0x00000001
+PCAPNG_SPB = 0x00000003
+PCAPNG_EPB = 0x00000006
+PCAPNG_BYTE_ORDER = 0x1A2B3C4D
+PCAPNG_BLOCK = struct.Struct('=II')  # 块类型、块长度
+PCAPNG_EPB_HEADER = struct.Struct('=IIIII')  # 接口、时间戳高32位、低32位、保存长度、原始长度
+OPT_IF_TSRESOL = 9
+
+_ETHERTYPE_IPV4 = 0x0800
+_ETHERTYPE_VLAN = 0x8100
+
+
+def _pad4(length):
+    return (length + 3) & ~3
+
+
+class PcapWriter:
+    """
+    流式写入 pcap（format='pcap'）或 pcapng（format='pcapng'）文件，可在多个线程中共用
+    rotate_bytes 不为 None 时，当前文件超过该大小后换到下一个文件；paths 为已写过的文件列表
+    """
+
+    def __init__(self, path, format='pcap', linktype=LINKTYPE_RAW, snaplen=65535, buffer_size=1 << 20,
+                 rotate_bytes=None):
+        if format not in ('pcap', 'pcapng'):
+            raise ValueError(f"未知的抓包格式: {format}")
+        self.path = path
+        self.format = format
+        self.linktype = linktype
+        self.snaplen = snaplen
+        self.buffer_size = buffer_size
+        self.rotate_bytes = rotate_bytes
+        self.packets = 0
+        self.paths = []
+        self._buffer = bytearray()
+        self._file = None
+        self._file_bytes = 0
+        self._lock = threading.Lock()
+        self._open()
+
+    def _next_path(self):
+        if not self.paths:
+            return self.path
+        root, ext = os.path.splitext(self.path)
+        return f"{root}.{len(self.paths)}{ext}"
+
+    def _file_header(self):
+        if self.format == 'pcap':
+            return PCAP_HEADER.pack(PCAP_MAGIC_NS, 2, 4, 0, 0, self.snaplen, self.linktype)
+        shb_length = PCAPNG_BLOCK.size + 16 + 4
+        shb = (PCAPNG_BLOCK.pack(PCAPNG_SHB, shb_length)
+               + struct.pack('=IHHq', PCAPNG_BYTE_ORDER, 1, 0, -1) + struct.pack('=I', shb_length))
+        # 接口描述块带 if_tsresol=9（纳秒），然后是 opt_endofopt
+        options = struct.pack('=HHB3x', OPT_IF_TSRESOL, 1, 9) + struct.pack('=HH', 0, 0)
+        idb_length = PCAPNG_BLOCK.size + 8 + len(options) + 4
+        idb = (PCAPNG_BLOCK.pack(PCAPNG_IDB, idb_length) + struct.pack('=HHI', self.linktype, 0, self.snaplen)
+               + options + struct.pack('=I', idb_length))
+        return shb + idb
+
+    def _open(self):
+        path = self._next_path()
+        self._file = open(path, 'wb')
+        self.paths.append(path)
+        header = self._file_header()
+        self._buffer += header
+        self._file_bytes = len(header)
+
+    def _record(self, data, ts_ns):
+        caplen = min(len(data), self.snaplen)
+        if self.format == 'pcap':
+            return PCAP_RECORD.pack(ts_ns // 1_000_000_000, ts_ns % 1_000_000_000, caplen, len(data)) + data[:caplen]
+        block_length = PCAPNG_BLOCK.size + PCAPNG_EPB_HEADER.size + _pad4(caplen) + 4
+        return b''.join((PCAPNG_BLOCK.pack(PCAPNG_EPB, block_length),
+                         PCAPNG_EPB_HEADER.pack(0, ts_ns >> 32, ts_ns & 0xFFFFFFFF, caplen, len(data)),
+                         data[:caplen], bytes(_pad4(caplen) - caplen), struct.pack('=I', block_length)))
+
+    def write(self, data, ts_ns=None):
+        """写入一个报文，ts_ns 为系统时间（time.time_ns），默认取当前时间"""
+        record = self._record(bytes(data), time.time_ns() if ts_ns is None else ts_ns)
+        with self._lock:
+            if self._file is None:
+                raise ValueError("抓包文件已关闭")
+            if self.rotate_bytes and self._file_bytes + len(record) > self.rotate_bytes and self.packets:
+                self._rotate()
+            self._buffer += record
+            self._file_bytes += len(record)
+            self.packets += 1
+            if len(self._buffer) >= self.buffer_size:
+                self._write_buffer()
+
+    def _write_buffer(self):
+        self._file.write(self._buffer)
+        self._buffer.clear()
+
+    def _rotate(self):
+        self._write_buffer()
+        self._file.close()
+        self._open()
+
+    def flush(self):
+        with self._lock:
+            if self._file is not None:
+                self._write_buffer()
+                self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._write_buffer()
+                self._file.close()
+                self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+_recorder = None
+record_errors = 0  # 没能记录的报文数（地址解析或写文件出错），记录出错不影响发送
+
+
+def start_recording(writer):
+    """之后各协议发出的报文都写进 writer"""
+    global _recorder, record_errors
+    _recorder = writer
+    record_errors = 0
+
+
+def stop_recording():
+    """停止记录并返回原来的 writer（不关闭它）"""
+    global _recorder
+    writer, _recorder = _recorder, None
+    return writer
+
+
+@functools.lru_cache(maxsize=256)
+def _resolve(host):
+    """调用方传入的目标可能是主机名，补IP头前先解析成地址"""
+    return socket.gethostbyname(host)
+
+
+@functools.lru_cache(maxsize=256)
+def _source_ip(dst_ip):
+    """内核发往 dst_ip 时使用的源地址（UDP connect 不发包）"""
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        s.connect((dst_ip, 9))
+        return s.getsockname()[0]
+    except OSError:
+        return '0.0.0.0'
+    finally:
+        s.close()
+
+
+def record(packet, dst_ip=None, protocol=None, src_ip=None):
+    """
+    记录一个已发出的报文，没有开始记录时什么也不做
+    packet 为完整IP报文；IP头由内核生成时只传传输层部分，并给出 dst_ip 和 protocol，这里补上IP头
+    """
+    global record_errors
+    writer = _recorder
+    if writer is None:
+        return
+    try:
+        if protocol is not None:
+            dst_ip = _resolve(dst_ip)
+            packet = IP.build_ip_header(src_ip or _source_ip(dst_ip), dst_ip, protocol, len(packet)) + bytes(packet)
+        writer.write(packet)
+    except Exception:
+        # 报文已经发出去了，记录失败只计数，不能让发送路径报错
+        record_errors += 1
+
+
+def _ip_offset(linktype, data):
+    """IPv4 报文在链路层帧中的偏移，不是IPv4时返回 None"""
+    if linktype in (LINKTYPE_RAW, LINKTYPE_IPV4):
+        return 0 if len(data) and data[0] >> 4 == 4 else None
+    if linktype == LINKTYPE_ETHERNET:
+        if len(data) < 14:
+            return None
+        ethertype = int.from_bytes(data[12:14], 'big')
+        if ethertype == _ETHERTYPE_VLAN and len(data) >= 18:
+            return 18 if int.from_bytes(data[16:18], 'big') == _ETHERTYPE_IPV4 else None
+        return 14 if ethertype == _ETHERTYPE_IPV4 else None
+    if linktype == LINKTYPE_LINUX_SLL:
+        return 16 if len(data) >= 16 and int.from_bytes(data[14:16], 'big') == _ETHERTYPE_IPV4 else None
+    if linktype == LINKTYPE_LINUX_SLL2:
+        return 20 if len(data) >= 20 and int.from_bytes(data[0:2], 'big') == _ETHERTYPE_IPV4 else None
+    if linktype == LINKTYPE_NULL:
+        # BSD 环回：4字节的地址族，字节序与抓包主机相同
+        family = int.from_bytes(data[:4], 'little') if len(data) >= 4 else None
+        return 4 if family in (socket.AF_INET, socket.AF_INET << 24) else None
+    return None
+
+
+def _read_pcap(view, size):
+    magic = int.from_bytes(view[:4], 'little')
+    if magic in (PCAP_MAGIC, PCAP_MAGIC_NS):
+        order = '<'
+    else:
+        order = '>'
+        magic = int.from_bytes(view[:4], 'big')
+    scale = 1 if magic == PCAP_MAGIC_NS else 1000
+    linktype = struct.unpack_from(order + 'I', view, 20)[0] & 0xFFFF
+    record = struct.Struct(order + 'IIII')
+    offset = PCAP_HEADER.size
+    while offset + record.size <= size:
+        sec, frac, caplen, length = record.unpack_from(view, offset)
+        offset += record.size
+        if offset + caplen > size:
+            return
+        packet = view[offset:offset + caplen]
+        yield sec * 1_000_000_000 + frac * scale, linktype, packet, caplen < length
+        packet.release()
+        offset += caplen
+
+
+def _read_pcapng(view, size):
+    interfaces = []  # (链路类型, 每个时间戳单位的纳秒数)
+    order = '<'
+    offset = 0
+    last_ts = 0
+    while offset + PCAPNG_BLOCK.size <= size:
+        if int.from_bytes(view[offset:offset + 4], 'little') == PCAPNG_SHB:
+            # 每个节头块重新确定字节序，接口编号也从头开始
+            order = '<' if int.from_bytes(view[offset + 8:offset + 12], 'little') == PCAPNG_BYTE_ORDER else '>'
+            interfaces = []
+        block_type, block_length = struct.unpack_from(order + 'II', view, offset)
+        if block_length < 12 or offset + block_length > size:
+            return
+        body = offset + PCAPNG_BLOCK.size
+        if block_type == PCAPNG_IDB:
+            linktype = struct.unpack_from(order + 'H', view, body)[0]
+            unit = 1000  # 默认微秒
+            option = body + 8
+            end = offset + block_length - 4
+            while option + 4 <= end:
+                code, length = struct.unpack_from(order + 'HH', view, option)
+                if code == 0:
+                    break
+                if code == OPT_IF_TSRESOL and length >= 1:
+                    resol = view[option + 4]
+                    # 最高位为1时是2的负幂，否则是10的负幂
+                    unit = 1e9 / (1 << (resol & 0x7F)) if resol & 0x80 else 10 ** (9 - resol)
+                option += 4 + _pad4(length)
+            interfaces.append((linktype, unit))
+        elif block_type == PCAPNG_EPB:
+            interface, high, low, caplen, length = struct.unpack_from(order + 'IIIII', view, body)
+            if interface < len(interfaces):
+                linktype, unit = interfaces[interface]
+                data = body + 20
+                last_ts = int(((high << 32) | low) * unit)
+                packet = view[data:data + caplen]
+                yield last_ts, linktype, packet, caplen < length
+                packet.release()
+        elif block_type == PCAPNG_SPB and interfaces:
+            # 简单报文块没有时间戳，沿用上一个报文的时间
+            length = struct.unpack_from(order + 'I', view, body)[0]
+            caplen = min(length, block_length - 16)
+            packet = view[body + 4:body + 4 + caplen]
+            yield last_ts, interfaces[0][0], packet, caplen < length
+            packet.release()
+        offset += block_length
+
+
+def read_capture(path):
+    """
+    逐个生成抓包文件中的 (时间戳ns, 链路类型, 报文视图, 是否被截断)，自动识别 pcap/pcapng
+    报文视图直接指向 mmap，在下一次迭代时被释放，需要保留时先复制（bytes(视图)）
+    """
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < 4:
+            return
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(mm)
+    try:
+        if int.from_bytes(view[:4], 'little') == PCAPNG_SHB:
+            yield from _read_pcapng(view, size)
+        else:
+            yield from _read_pcap(view, size)
+    finally:
+        view.release()
+        mm.close()
+
+
+def _replay_event(kind, target, stats, elapsed, **info):
+    return event(kind, 'REPLAY', target, packets=stats.packets, bytes=stats.bytes, errors=stats.errors,
+                 batches=stats.batches, elapsed=elapsed,
+                 pps=stats.packets / elapsed if elapsed else 0.0,
+                 bps=stats.bytes * 8 / elapsed if elapsed else 0.0, **info)
+
+
+def replay_events(paths, speed=1.0, batch_size=64, loops=1, report_interval=1.0):
+    """
+    回放抓包文件中的IPv4报文（目的地址取自报文本身）
+    speed 为时间缩放倍数：1 为原始节奏，2 为两倍速，0 或 None 为不等待、全速发送；
+    已到发送时间的报文攒成一批用 sendmmsg 发出
+    """
+    # batch_sender 导入 IP，而 IP 在模块加载时导入本模块，这里延迟导入避免循环
+    from batch_sender import BatchSender
+
+    if isinstance(paths, str):
+        paths = [paths]
+    label = ','.join(paths)
+    skipped = truncated = 0
+    sender = BatchSender(batch_size=batch_size, slot_size=65535)
+    stats = sender.stats
+    add = sender.add
+    yield event(START, 'REPLAY', label, speed=speed or 0, loops=loops)
+    start = time.perf_counter()
+    next_report = start + report_interval
+    try:
+        for _ in range(loops):
+            for path in paths:
+                # 每个文件从第一个报文开始计时
+                first_ts = None
+                file_start = time.perf_counter()
+                for ts_ns, linktype, data, cut in read_capture(path):
+                    offset = _ip_offset(linktype, data)
+                    if offset is None:
+                        skipped += 1
+                        continue
+                    if cut:
+                        truncated += 1
+                        continue
+                    if speed:
+                        if first_ts is None:
+                            first_ts = ts_ns
+                        due = file_start + (ts_ns - first_ts) / 1e9 / speed
+                        now = time.perf_counter()
+                        if due > now:
+                            # 先发出已到时间的报文，再等待这个报文的发送时间
+                            sender.flush()
+                            while due > now:
+                                if now >= next_report:
+                                    next_report = now + report_interval
+                                    yield _replay_event(PROGRESS, label, stats, now - start)
+                                sleep_until(min(due, now + report_interval))
+                                now = time.perf_counter()
+                    add(data[offset:])
+                    now = time.perf_counter()
+                    if now >= next_report:
+                        next_report = now + report_interval
+                        yield _replay_event(PROGRESS, label, stats, now - start)
+                sender.flush()
+    finally:
+        sender.flush()
+        sender.close()
+    elapsed = time.perf_counter() - start
+    stats.elapsed = elapsed
+    yield _replay_event(SUMMARY, label, stats, elapsed, skipped=skipped, truncated=truncated)
@@ -0,0 +1,150 @@
+"""
+按阶段的性能剖析
+
+start_tracing(Tracer(sample_rate)) 之后，ip/icmp/tcp/udp/dns 的发送路径对抽中的报文
+用 perf_counter_ns 记录每个阶段的耗时：socket（创建套接字）、build（struct 打包或模板改写）、checksum、
+ip_header（TCP拼IP头）、connect（UDP取源地址）、sendto、recv（等待回复）和 parse（解析回复）。
+高速路径也按报文抽样：scan/sweep（含多进程分片）、udpload 记录 cookie（算序列号）、build、queue（放入 BatchSender）
+或 sendto，BatchSender 按批记录 sendmmsg；多进程分片的记录由工作进程交回，线程号为工作进程的进程号。
+没有开始剖析时 sample() 直接返回 None，各路径只多一次函数调用和几次 if 判断。
+
+用法与 pcap.start_recording 相同：
+    tracer = Tracer(sample_rate=0.01)
+    start_tracing(tracer)
+    ...
+    stop_tracing()
+    tracer.write_chrome_trace('trace.json')   # chrome://tracing 或 Perfetto 打开
+    tracer.write_collapsed('stages.folded')   # flamegraph.pl / speedscope 的折叠栈格式
+"""
+import itertools
+import json
+import os
+import threading
+import time
+
+_clock = time.perf_counter_ns
+
+MAX_SPANS = 1_000_000  # 最多保存的阶段记录数，超过后只计数不保存
+
+
+class PacketTrace:
+    """一个被抽中的报文：mark(stage) 记录从上一个时间点到现在的耗时，reset() 只移动时间点"""
+    __slots__ = ('tracer', 'protocol', 'tid', 'last')
+
+    def __init__(self, tracer, protocol):
+        self.tracer = tracer
+        self.protocol = protocol
+        self.tid = threading.get_ident()
+        self.last = _clock()
+
+    def mark(self, stage):
+        now = _clock()
+        self.tracer.add(self.protocol, stage, self.tid, self.last, now - self.last)
+        self.last = now
+
+    def reset(self):
+        """跳过一段不计入任何阶段的时间（如把事件交给调用方处理的时间）"""
+        self.last = _clock()
+
+
+class Tracer:
+    """
+    收集各阶段的耗时记录
+    sample_rate 为抽样比例（0~1），按报文计数等间隔抽取，如0.01为每100个报文记录一个
+    """
+
+    def __init__(self, sample_rate=1.0, max_spans=MAX_SPANS):
+        if not 0 < sample_rate <= 1:
+            raise ValueError("抽样比例必须在 (0, 1] 之间")
+        self.sample_rate = sample_rate
+        self.stride = max(1, round(1 / sample_rate))
+        self.max_spans = max_spans
+        self.spans = []  # (协议, 阶段, 线程, 开始ns, 耗时ns)
+        self.dropped = 0
+        self._counter = itertools.count()
+
+    def sample(self, protocol):
+        # itertools.count 的 next() 在 GIL 下是原子的，多个线程共用也不会重复
+        if next(self._counter) % self.stride:
+            return None
+        return PacketTrace(self, protocol)
+
+    def add(self, protocol, stage, tid, start_ns, duration_ns):
+        if len(self.spans) >= self.max_spans:
+            self.dropped += 1
+            return
+        self.spans.append((protocol, stage, tid, start_ns, duration_ns))
+
+    def summary(self):
+        """按 (协议, 阶段) 汇总：{协议: {阶段: {'count', 'total_us', 'mean_us'}}}"""
+        totals = {}
+        for protocol, stage, _, _, duration in self.spans:
+            entry = totals.setdefault((protocol, stage), [0, 0])
+            entry[0] += 1
+            entry[1] += duration
+        result = {}
+        for (protocol, stage), (count, total) in sorted(totals.items()):
+            result.setdefault(protocol, {})[stage] = {
+                'count': count, 'total_us': total / 1e3, 'mean_us': total / count / 1e3}
+        return result
+
+    def chrome_trace(self):
+        """Chrome Trace Event 格式（时间单位为微秒），每个阶段为一个完整事件，按协议分类"""
+        pid = os.getpid()
+        events = [{'name': stage, 'cat': protocol, 'ph': 'X', 'pid': pid, 'tid': tid,
+                   'ts': start / 1e3, 'dur': duration / 1e3}
+                  for protocol, stage, tid, start, duration in self.spans]
+        return {'traceEvents': events, 'displayTimeUnit': 'ns',
+                'otherData': {'sample_rate': self.sample_rate, 'dropped': self.dropped}}
+
+    def collapsed(self):
+        """折叠栈格式：每行 "协议;阶段 总纳秒数"，火焰图宽度即各阶段的总耗时"""
+        totals = {}
+        for protocol, stage, _, _, duration in self.spans:
+            key = f"{protocol};{stage}"
+            totals[key] = totals.get(key, 0) + duration
+        return ''.join(f"{key} {total}\n" for key, total in sorted(totals.items()))
+
+    def write_chrome_trace(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.chrome_trace(), f)
+
+    def write_collapsed(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(self.collapsed())
+
+    def write(self, path):
+        """按扩展名选择格式：.json 为 Chrome Trace，其它为折叠栈"""
+        if path.endswith('.json'):
+            self.write_chrome_trace(path)
+        else:
+            self.write_collapsed(path)
+
+
+_tracer = None
+
+
+def start_tracing(tracer):
+    """之后各协议的发送路径按 tracer 的抽样比例记录阶段耗时"""
+    global _tracer
+    _tracer = tracer
+
+
+def stop_tracing():
+    """停止剖析并返回原来的 tracer"""
+    global _tracer
+    tracer, _tracer = _tracer, None
+    return tracer
+
+
+def current():
+    """当前的 tracer，没有开始剖析时为 None"""
+    return _tracer
+
+
+def sample(protocol):
+    """开始剖析一个报文，没有开始剖析或没被抽中时返回 None"""
+    tracer = _tracer
+    if tracer is None:
+        return None
+    return tracer.sample(protocol)
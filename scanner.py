@@ -0,0 +1,361 @@
+"""
+TCP SYN 扫描引擎
+
+在 send_tcp_syn 的报文格式基础上（TCPSynTemplate），一个长期存在的原始套接字负责发送，
+另一个原始套接字在独立线程中接收 SYN-ACK/RST。
+序列号和源端口由 SynCookie 按 (源地址, 目标地址, 目标端口) 算出，回复到达时重新计算，
+确认号等于序列号+1、目的端口等于算出的源端口才算是我们的探测，不保存每个探测的状态。
+收到 SYN-ACK 为开放，RST 为关闭，超时未回复为过滤（只计数，不逐个记录）。
+"""
+import ipaddress
+import queue
+import socket
+import struct
+import threading
+import time
+
+import profiling
+from bpf import attach_filter, tcp_reply_filter
+from capture import LINK_OFFSET, PacketRing
+from events import ERROR, PROGRESS, REPLY, SUMMARY, event
+from pacing import Pacer
+from syn_cookie import SynCookie
+from TCP import TCP_HEADER, TCP_OPTIONS
+from template import TCPSynTemplate
+from timing import ProbeTimings, enable_kernel_timestamps, format_summary, recv_with_timestamp
+
+OPEN = 'open'
+CLOSED = 'closed'
+FILTERED = 'filtered'
+
+TCP_FLAG_RST = 0x04
+TCP_FLAG_SYN_ACK = 0x12
+
+# 回复报文中需要的TCP字段：源端口、目标端口、序列号、确认号、数据偏移、标志位
+TCP_REPLY = struct.Struct('!HHLLBB')
+
+SYN_SIZE = 20 + TCP_HEADER.size + len(TCP_OPTIONS)  # 一个SYN探测的字节数（IP头+TCP头+选项）
+
+
+def parse_targets(targets):
+    """
+    把目标解析为32位整数地址的生成器
+    支持单个地址、CIDR网段（如 10.0.0.0/24），可传入字符串（逗号分隔）或列表
+    """
+    if isinstance(targets, str):
+        targets = targets.split(',')
+    for target in targets:
+        target = target.strip()
+        if not target:
+            continue
+        network = ipaddress.ip_network(target, strict=False)
+        if network.num_addresses == 1:
+            yield int(network.network_address)
+        else:
+            for host in network.hosts():
+                yield int(host)
+
+
+def parse_ports(ports):
+    """把端口解析为列表，支持 "22,80,8000-8100" 形式的字符串或整数列表"""
+    if isinstance(ports, int):
+        return [ports]
+    if isinstance(ports, str):
+        result = []
+        for part in ports.split(','):
+            part = part.strip()
+            if not part:
+                continue
+            if '-' in part:
+                start, end = part.split('-', 1)
+                result.extend(range(int(start), int(end) + 1))
+            else:
+                result.append(int(part))
+        return result
+    return [int(port) for port in ports]
+
+
+class ScanResult:
+    """扫描结果：有回复的 (地址, 端口) 的状态以及发送统计"""
+
+    def __init__(self):
+        self.states = {}  # (地址字符串, 端口) -> OPEN / CLOSED
+        self.probes = 0  # 探测总数（含发送失败的）
+        self.sent = 0
+        self.received = 0
+        self.send_errors = 0
+        self.send_time = 0.0  # 发送阶段耗时（秒）
+        self.elapsed = 0.0  # 总耗时（秒），包括等待回复
+        self.timings = ProbeTimings()  # 发送时间和回复RTT，只在 track_rtt 时记录
+
+    @property
+    def pps(self):
+        """发送速率（包/秒）"""
+        return self.sent / self.send_time if self.send_time else 0.0
+
+    @property
+    def filtered(self):
+        """没有回复的探测数"""
+        return self.probes - len(self.states)
+
+    def ports_in_state(self, state):
+        return sorted(key for key, value in self.states.items() if value == state)
+
+
+class SynScanner:
+    """
+    SYN扫描器
+    rate 为每秒发包数上限，None 表示不限速；burst 为令牌桶容量（见 pacing.Pacer）
+    src_port 为 None 时每个探测的源端口由 cookie 算出（落在 cookie.port_range 内），否则使用固定源端口
+    track_rtt 为 True 时按 (地址, 端口) 记录发送时间以得到RTT，内存随探测数增长，只适合小规模扫描
+    use_ring 为 True 时通过 AF_PACKET mmap 环（capture.PacketRing）接收回复，适合很高的回复速率
+    on_reply(地址, 端口, 状态, RTT毫秒) 在接收线程中对每个匹配的回复调用
+    """
+
+    def __init__(self, src_ip, targets, ports, src_port=None, rate=None, timeout=2, use_ring=False,
+                 on_reply=None, cookie=None, track_rtt=False, burst=None):
+        self.src_ip = src_ip
+        self.targets = targets
+        self.ports = parse_ports(ports)
+        self.src_port = int(src_port) if src_port else None
+        self.rate = rate
+        self.pacer = Pacer(rate, burst)
+        self.timeout = timeout
+        self.use_ring = use_ring
+        self.on_reply = on_reply
+        self.cookie = cookie or SynCookie()
+        self._saddr = int(ipaddress.IPv4Address(src_ip))
+        self._sent_at = {} if track_rtt else None  # (目标地址, 目标端口) -> 探测序号
+        self._result = ScanResult()
+        self._stop = threading.Event()
+
+    def stop(self):
+        """结束扫描（可在其他线程中调用）：发送循环在下一个探测前退出，不再等待剩余的回复"""
+        self._stop.set()
+
+    def _open_sockets(self):
+        # IPPROTO_RAW + IP_HDRINCL：发送我们自己构建的完整报文
+        send_sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_RAW)
+        send_sock.setsockopt(socket.IPPROTO_IP, socket.IP_HDRINCL, 1)
+        ports = self.src_port or self.cookie.port_range
+        if self.use_ring:
+            try:
+                ring = PacketRing(bpf_filter=tcp_reply_filter(ports, link_offset=LINK_OFFSET))
+            except OSError:
+                send_sock.close()
+                raise
+            ring.add_handler(socket.IPPROTO_TCP, self._handle_reply)
+            return send_sock, ring
+        # IPPROTO_TCP 原始套接字：接收所有TCP报文的副本（含IP头）
+        recv_sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_TCP)
+        # 高速扫描时回复集中到达，加大接收缓冲区以免内核丢包
+        recv_sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        # 内核只交上发往我们源端口（或源端口范围）的TCP报文
+        attach_filter(recv_sock, tcp_reply_filter(ports))
+        enable_kernel_timestamps(recv_sock)
+        recv_sock.settimeout(0.1)
+        return send_sock, recv_sock
+
+    def _handle_reply(self, view, length, recv_ns=None):
+        """解析一个收到的IP+TCP报文，重新计算 cookie 校验成功则记录端口状态"""
+        if length < 40:
+            return
+        ihl = (view[0] & 0x0F) * 4
+        if length < ihl + 14:
+            return
+        sport, dport, _, ack, _, flags = TCP_REPLY.unpack_from(view, ihl)
+        daddr = int.from_bytes(view[12:16], 'big')
+        if not self.cookie.check(self._saddr, daddr, sport, dport, ack, self.src_port):
+            # 不是我们的探测
+            return
+
+        if flags & TCP_FLAG_SYN_ACK == TCP_FLAG_SYN_ACK:
+            state = OPEN
+        elif flags & TCP_FLAG_RST:
+            state = CLOSED
+        else:
+            return
+        addr = str(ipaddress.IPv4Address(daddr))
+        states = self._result.states
+        if (addr, sport) in states:
+            # 重传的 SYN-ACK
+            return
+        states[(addr, sport)] = state
+        self._result.received += 1
+        rtt = None
+        if self._sent_at is not None:
+            probe = self._sent_at.pop((daddr, sport), None)
+            if probe is not None:
+                rtt = self._result.timings.finish(probe, recv_ns) / 1e6
+        if self.on_reply is not None:
+            self.on_reply(addr, sport, state, rtt)
+
+    def _receive_loop(self, recv_sock):
+        if self.use_ring:
+            recv_sock.run(self._stop)
+            return
+        buffer = bytearray(65535)
+        view = memoryview(buffer)
+        while not self._stop.is_set():
+            try:
+                length, _, recv_ns = recv_with_timestamp(recv_sock, buffer)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            self._handle_reply(view, length, recv_ns)
+
+    def _probes(self):
+        """按 地址 x 端口 依次生成探测，地址同时给出整数和字符串两种形式"""
+        for daddr in parse_targets(self.targets):
+            dst_ip = socket.inet_ntoa(daddr.to_bytes(4, 'big'))
+            for dport in self.ports:
+                yield daddr, dst_ip, dport
+
+    def run(self):
+        result = self._result
+        start = time.perf_counter()
+        send_sock, recv_sock = self._open_sockets()
+        receiver = threading.Thread(target=self._receive_loop, args=(recv_sock,), daemon=True)
+        receiver.start()
+
+        template = TCPSynTemplate(self.src_ip, '0.0.0.0', self.src_port or 0, 0)
+        saddr = self._saddr
+        probe = self.cookie.probe
+        fixed_port = self.src_port
+        sent_at = self._sent_at
+        start_probe = result.timings.start
+        sendto = send_sock.sendto
+        wait = self.pacer.wait
+        stopped = self._stop.is_set
+        sample = profiling.sample
+
+        try:
+            for daddr, dst_ip, dport in self._probes():
+                if stopped():
+                    break
+                wait()
+                trace = sample('SCAN')
+                seq, sport = probe(saddr, daddr, dport)
+                if trace:
+                    trace.mark('cookie')
+                packet = template.build(seq, src_port=fixed_port or sport, dst_port=dport, daddr=daddr)
+                if trace:
+                    trace.mark('build')
+                result.probes += 1
+                if sent_at is not None:
+                    sent_at[(daddr, dport)] = start_probe()
+                try:
+                    # 目的端口对原始套接字无意义，内核只使用地址
+                    sendto(packet, (dst_ip, 0))
+                    if trace:
+                        trace.mark('sendto')
+                    result.sent += 1
+                except OSError:
+                    result.send_errors += 1
+            result.send_time = time.perf_counter() - start
+
+            # 等待剩余的回复，全部探测都有回复时提前结束
+            deadline = time.perf_counter() + self.timeout
+            while result.received < result.sent and time.perf_counter() < deadline and not self._stop.wait(0.05):
+                pass
+        finally:
+            self._stop.set()
+            receiver.join()
+            send_sock.close()
+            recv_sock.close()
+
+        if sent_at is not None:
+            sent_at.clear()
+        result.elapsed = time.perf_counter() - start
+        return result
+
+
+def format_scan_result(result):
+    """把扫描结果格式化为文本"""
+    lines = []
+    entries = result.ports_in_state(OPEN)
+    lines.append(f"开放: {len(entries)}")
+    for addr, port in entries:
+        lines.append(f"  {addr}:{port}")
+    lines.append(f"关闭: {len(result.ports_in_state(CLOSED))}")
+    lines.append(f"过滤: {result.filtered}")
+    lines.append(f"已发送 = {result.sent}, 已接收 = {result.received}, 发送失败 = {result.send_errors}")
+    timings = result.timings.summary()
+    if timings['sent']:
+        lines.append(f"响应时间: {format_summary(timings)}")
+    lines.append(f"发送速率: {result.pps:.0f} 包/秒, 总耗时: {result.elapsed:.2f} 秒")
+    return '\n'.join(lines)
+
+
+def scan_events(src_ip, targets, ports, rate=None, timeout=2, states=(OPEN,), burst=None, report_interval=1.0):
+    """
+    SYN扫描的事件流：扫描在后台线程中运行，states 中状态的回复一到达就产生事件，
+    每 report_interval 秒产生一个进度事件（累计发送数），
+    结束时产生汇总事件（info['result'] 为 ScanResult）；提前关闭生成器会停止扫描
+    """
+    replies = queue.SimpleQueue()
+
+    def on_reply(addr, port, state, rtt):
+        if state in states:
+            replies.put(event(REPLY, 'SCAN', addr, rtt=rtt, port=port, state=state))
+
+    scanner = SynScanner(src_ip, targets, ports, rate=rate, timeout=timeout, on_reply=on_reply, burst=burst)
+    outcome = []
+
+    def run():
+        try:
+            outcome.append(scanner.run())
+        except (socket.error, ValueError) as e:
+            outcome.append(e)
+        replies.put(None)
+
+    def progress():
+        result = scanner._result
+        elapsed = time.perf_counter() - start
+        return event(PROGRESS, 'SCAN', label, packets=result.sent, errors=result.send_errors,
+                     bytes=result.sent * SYN_SIZE, elapsed=elapsed, pps=result.sent / elapsed if elapsed else 0.0,
+                     bps=result.sent * SYN_SIZE * 8 / elapsed if elapsed else 0.0, target_pps=rate)
+
+    label = str(targets)
+    start = time.perf_counter()
+    next_report = start + report_interval
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    try:
+        while True:
+            now = time.perf_counter()
+            if now >= next_report:
+                next_report = now + report_interval
+                yield progress()
+            try:
+                item = replies.get(timeout=next_report - now)
+            except queue.Empty:
+                continue
+            if item is None:
+                break
+            yield item
+    finally:
+        # 提前关闭事件流（GUI取消、CLI中断）时停止发送并等扫描线程关闭套接字
+        scanner.stop()
+        thread.join()
+
+    result = outcome[0]
+    if isinstance(result, Exception):
+        yield event(ERROR, 'SCAN', label, message=f'扫描失败: {result}')
+        return
+    timings = result.timings.summary()
+    yield event(SUMMARY, 'SCAN', label, open=len(result.ports_in_state(OPEN)),
+                closed=len(result.ports_in_state(CLOSED)), filtered=result.filtered,
+                sent=result.sent, received=result.received, send_errors=result.send_errors,
+                timings=timings if timings['sent'] else {}, pps=result.pps, target_pps=rate, elapsed=result.elapsed,
+                result=result)
+
+
+def syn_scan(src_ip, targets, ports, rate=None, timeout=2):
+    """对网段和端口列表进行SYN扫描，返回格式化的结果（附带响应时间）"""
+    try:
+        result = SynScanner(src_ip, targets, ports, rate=rate, timeout=timeout, track_rtt=True).run()
+    except (socket.error, ValueError) as e:
+        return f'扫描失败: {e}'
+    return format_scan_result(result)
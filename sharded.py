@@ -0,0 +1,461 @@
+"""
+多进程分片发送
+
+SYN扫描和批量Ping的探测空间（地址 x 端口）按序号取模分给多个工作进程，
+每个进程有自己的 IP_HDRINCL 套接字、报文模板和 BatchSender，报文构建和校验和计算不再受GIL限制。
+工作进程只负责发送，计数写在共享内存数组中各自的一段里（单写者，不需要加锁），父进程定时读取汇总。
+
+回复由父进程统一接收。为了让父进程不需要知道每个探测的状态，探测是无状态的：
+SYN 的序列号和源端口由 SynCookie 按地址、端口和本次运行的随机密钥算出；ICMP 序列号的低位直接是轮次，
+其余高位是按地址算出的 cookie。工作进程只拿到密钥，收到回复时父进程重新计算并比较即可；
+Ping 的发送时间写在 Echo 负载里，随回复原样带回。
+perf_counter_ns 在 Linux 上是系统范围的 CLOCK_MONOTONIC，工作进程写入的时间可以直接和父进程的接收时间相减。
+开始剖析（profiling.start_tracing）后，各工作进程按同样的抽样比例记录阶段耗时，结束时交回父进程的 tracer。
+"""
+import bisect
+import ipaddress
+import multiprocessing
+import os
+import select
+import socket
+import struct
+import time
+
+import profiling
+from batch_sender import BatchSender
+from bpf import attach_filter, icmp_echo_reply_filter, tcp_reply_filter
+from checksum import update_checksum_bytes
+from events import ERROR, PROGRESS, REPLY, SUMMARY, Event, event
+from ICMP import ICMP_ECHO_REPLY, ICMP_HEADER, ICMP_PAYLOAD, PingStats
+from pacing import Pacer
+from scanner import CLOSED, OPEN, TCP_FLAG_RST, TCP_FLAG_SYN_ACK, TCP_REPLY, parse_ports
+from syn_cookie import SynCookie
+from template import IP_LEN, ICMPEchoTemplate, TCPSynTemplate
+from timing import enable_kernel_timestamps, now_ns, percentile, recv_with_timestamp
+
+# 每个工作进程在共享计数数组中的字段
+SENT = 0
+ERRORS = 1
+BYTES = 2
+DONE = 3
+_FIELDS = 4
+
+_U16 = struct.Struct('!H')
+_U64 = struct.Struct('!Q')
+_ZERO_U64 = bytes(_U64.size)
+_ICMP_STAMP = IP_LEN + ICMP_HEADER.size  # Echo 负载中发送时间的偏移
+
+
+class AddressSpace:
+    """
+    由地址和CIDR网段组成的地址空间，按序号随机访问，不展开成列表
+    address(i) 为第 i 个地址（32位整数）
+    """
+
+    def __init__(self, targets):
+        if isinstance(targets, str):
+            targets = targets.split(',')
+        self.ranges = []  # (起始地址, 个数)
+        self._offsets = []
+        self.size = 0
+        for target in targets:
+            target = target.strip()
+            if not target:
+                continue
+            network = ipaddress.ip_network(target, strict=False)
+            start, count = int(network.network_address), network.num_addresses
+            if count > 2:
+                # 去掉网络地址和广播地址，与 ipaddress 的 hosts() 一致
+                start, count = start + 1, count - 2
+            self.ranges.append((start, count))
+            self._offsets.append(self.size)
+            self.size += count
+
+    def __len__(self):
+        return self.size
+
+    def address(self, index):
+        position = bisect.bisect_right(self._offsets, index) - 1
+        return self.ranges[position][0] + index - self._offsets[position]
+
+
+class ShardCounters:
+    """共享内存中的计数，每个工作进程一段：已发送、发送失败、字节数、是否结束"""
+
+    def __init__(self, workers, context):
+        self.workers = workers
+        self.array = context.Array('Q', workers * _FIELDS, lock=False)
+
+    def total(self, field):
+        array = self.array
+        return sum(array[worker * _FIELDS + field] for worker in range(self.workers))
+
+    def worker(self, worker, field):
+        return self.array[worker * _FIELDS + field]
+
+
+def _round_bits(count):
+    """Ping count 轮时序列号中轮次占的位数"""
+    if not 0 < count <= 0x10000:
+        raise ValueError("轮数必须在 1~65536 之间")
+    return (count - 1).bit_length()
+
+
+def _sweep_seq(cookie_seq, daddr, round_no, round_bits):
+    """Echo 序列号：低 round_bits 位为轮次，高位为按地址算出的 cookie（与轮次无关）"""
+    return ((cookie_seq(0, daddr, 0) << round_bits) | round_no) & 0xFFFF
+
+
+def _publish(counters, worker, stats, done=0):
+    base = worker * _FIELDS
+    counters[base + SENT] = stats.packets
+    counters[base + ERRORS] = stats.errors
+    counters[base + BYTES] = stats.bytes
+    counters[base + DONE] = done
+
+
+def _paced(indices, rate, batch_size):
+    """把探测序号按批切分；限速时每批从令牌桶（pacing.Pacer）取够令牌再放行"""
+    wait = Pacer(rate).wait
+    batch = []
+    for index in indices:
+        batch.append(index)
+        if len(batch) < batch_size:
+            continue
+        wait(len(batch))
+        yield batch
+        batch = []
+    if batch:
+        wait(len(batch))
+        yield batch
+
+
+def _scan_worker(worker, workers, counters, space, ports, src_ip, key, rate, batch_size):
+    template = TCPSynTemplate(src_ip, '0.0.0.0', 0, 0)
+    build = template.build
+    probe = SynCookie(key).probe
+    saddr = template.saddr
+    address = space.address
+    port_count = len(ports)
+    sample = profiling.sample
+    with BatchSender(batch_size=batch_size) as sender:
+        add = sender.add
+        for batch in _paced(range(worker, len(space) * port_count, workers), rate, batch_size):
+            for index in batch:
+                trace = sample('SCAN')
+                daddr = address(index // port_count)
+                dport = ports[index % port_count]
+                seq, sport = probe(saddr, daddr, dport)
+                if trace:
+                    trace.mark('cookie')
+                packet = build(seq, src_port=sport, dst_port=dport, daddr=daddr)
+                if trace:
+                    trace.mark('build')
+                add(packet)
+                if trace:
+                    trace.mark('queue')
+            sender.flush()
+            _publish(counters, worker, sender.stats)
+        _publish(counters, worker, sender.stats, done=1)
+
+
+def _sweep_worker(worker, workers, counters, space, count, icmp_id, key, rate, batch_size, interval):
+    # 负载前8字节留给发送时间，模板中为0，写入时间后增量更新ICMP校验和
+    template = ICMPEchoTemplate('0.0.0.0', '0.0.0.0', icmp_id, _ZERO_U64 + ICMP_PAYLOAD[_U64.size:])
+    buffer = template.buffer
+    address = space.address
+    cookie_seq = SynCookie(key).seq
+    round_bits = _round_bits(count)
+    sample = profiling.sample
+    with BatchSender(batch_size=batch_size) as sender:
+        add = sender.add
+        for round_no in range(count):
+            if round_no:
+                time.sleep(interval)
+            for batch in _paced(range(worker, len(space), workers), rate, batch_size):
+                for index in batch:
+                    trace = sample('SWEEP')
+                    daddr = address(index)
+                    template.build(_sweep_seq(cookie_seq, daddr, round_no, round_bits), daddr=daddr)
+                    if trace:
+                        trace.mark('build')
+                    stamp = _U64.pack(now_ns())
+                    buffer[_ICMP_STAMP:_ICMP_STAMP + _U64.size] = stamp
+                    checksum = _U16.unpack_from(buffer, IP_LEN + 2)[0]
+                    _U16.pack_into(buffer, IP_LEN + 2, update_checksum_bytes(checksum, _ZERO_U64, stamp))
+                    if trace:
+                        trace.mark('checksum')
+                    add(buffer)
+                    if trace:
+                        trace.mark('queue')
+                sender.flush()
+                _publish(counters, worker, sender.stats)
+        _publish(counters, worker, sender.stats, done=1)
+
+
+def _run_worker(worker, profile, index, workers, counters, *args):
+    """
+    工作进程入口：profile 为 (队列, 抽样比例, 记录数上限) 时（父进程在剖析）用自己的 tracer 记录，
+    结束时把 (进程号, 阶段记录) 放进队列交回父进程
+    """
+    tracer = None
+    if profile is not None:
+        spans, sample_rate, max_spans = profile
+        tracer = profiling.Tracer(sample_rate, max_spans)
+        profiling.start_tracing(tracer)
+    try:
+        worker(index, workers, counters, *args)
+    finally:
+        if tracer is not None:
+            spans.put((os.getpid(), tracer.spans))
+
+
+def _context():
+    # fork 启动最快，工作进程直接继承共享数组和地址空间
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    return multiprocessing.get_context()
+
+
+class _Pool:
+    """启动工作进程并跟踪它们是否结束，stop() 之后 failures() 为异常退出的工作进程"""
+
+    def __init__(self, worker, workers, args):
+        context = _context()
+        self.counters = ShardCounters(workers, context)
+        self.start = time.perf_counter()
+        self.send_time = None
+        self._terminated = set()  # 被 stop() 终止的工作进程序号
+        self._tracer = profiling.current()
+        self._spans = profile = None
+        if self._tracer is not None:
+            self._spans = context.SimpleQueue()
+            profile = (self._spans, self._tracer.sample_rate, self._tracer.max_spans)
+        self.processes = [context.Process(target=_run_worker,
+                                          args=(worker, profile, index, workers, self.counters.array) + args,
+                                          daemon=True)
+                          for index in range(workers)]
+        for process in self.processes:
+            process.start()
+
+    def _collect_spans(self):
+        """把工作进程交回的阶段记录并入父进程的 tracer，线程号换成工作进程的进程号以便区分"""
+        spans = self._spans
+        if spans is None:
+            return
+        add = self._tracer.add
+        while not spans.empty():
+            pid, records = spans.get()
+            for protocol, stage, _, start, duration in records:
+                add(protocol, stage, pid, start, duration)
+
+    def sending(self):
+        # 工作进程要等记录写进管道才能退出，发送期间也要及时读走
+        self._collect_spans()
+        if self.send_time is not None:
+            return False
+        if any(process.is_alive() for process in self.processes):
+            return True
+        self.send_time = time.perf_counter() - self.start
+        return False
+
+    def stop(self):
+        for index, process in enumerate(self.processes):
+            if process.is_alive():
+                process.terminate()
+                self._terminated.add(index)
+        while any(process.is_alive() for process in self.processes):
+            self._collect_spans()
+            time.sleep(0.01)
+        self._collect_spans()
+        for process in self.processes:
+            process.join()
+
+    def failures(self):
+        """[(序号, 退出码)]：没有正常结束、也不是被 stop() 终止的工作进程，它负责的探测没有发完"""
+        return [(index, process.exitcode) for index, process in enumerate(self.processes)
+                if process.exitcode != 0 and index not in self._terminated]
+
+    def errors(self, protocol, target):
+        """每个异常退出的工作进程一个错误事件"""
+        for index, exitcode in self.failures():
+            yield event(ERROR, protocol, target,
+                        message=f'工作进程 {index} 异常退出（退出码 {exitcode}），已发送 {self.counters.worker(index, SENT)} 个探测')
+
+    def progress(self, protocol, target):
+        counters = self.counters
+        sent = counters.total(SENT)
+        sent_bytes = counters.total(BYTES)
+        elapsed = time.perf_counter() - self.start
+        return event(PROGRESS, protocol, target, packets=sent, errors=counters.total(ERRORS), bytes=sent_bytes,
+                     workers_done=counters.total(DONE), elapsed=elapsed,
+                     pps=sent / elapsed if elapsed else 0.0,
+                     bps=sent_bytes * 8 / elapsed if elapsed else 0.0)
+
+    @property
+    def pps(self):
+        send_time = self.send_time or (time.perf_counter() - self.start)
+        return self.counters.total(SENT) / send_time if send_time else 0.0
+
+
+def _receive(sock, pool, timeout, report_interval, protocol, target, buffer):
+    """
+    工作进程发送期间及结束后 timeout 秒内，逐个生成收到的报文长度和接收时间；
+    每 report_interval 秒插入一个进度事件（以 Event 形式生成）
+    """
+    deadline = None
+    next_report = time.monotonic() + report_interval
+    while True:
+        now = time.monotonic()
+        if deadline is None and not pool.sending():
+            deadline = now + timeout
+        if deadline is not None and now >= deadline:
+            return
+        if now >= next_report:
+            next_report = now + report_interval
+            yield pool.progress(protocol, target)
+        readable, _, _ = select.select([sock], [], [], 0.05)
+        if not readable:
+            continue
+        while True:
+            try:
+                length, _, recv_ns = recv_with_timestamp(sock, buffer)
+            except BlockingIOError:
+                break
+            yield length, recv_ns
+
+
+def sharded_scan_events(src_ip, targets, ports, workers=None, rate=None, timeout=2, states=(OPEN,),
+                        batch_size=64, report_interval=1.0):
+    """
+    多进程SYN扫描；rate 为所有进程合计的每秒发包数
+    产生 states 中状态的回复事件、定时的进度事件和最后的汇总事件（没有回复的探测计为过滤），
+    有工作进程异常退出时在汇总之前为每个这样的进程产生一个错误事件
+    """
+    workers = workers or os.cpu_count() or 1
+    space = AddressSpace(targets)
+    ports = parse_ports(ports)
+    cookie = SynCookie()
+    saddr = int(ipaddress.IPv4Address(src_ip))
+    label = str(targets)
+
+    responded = {}  # (地址, 端口) -> 状态
+    buffer = bytearray(65535)
+    pool = None
+    sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_TCP)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 8 * 1024 * 1024)
+        attach_filter(sock, tcp_reply_filter(cookie.port_range))
+        enable_kernel_timestamps(sock)
+        sock.setblocking(False)
+        pool = _Pool(_scan_worker, workers, (space, ports, src_ip, cookie.key,
+                                             rate / workers if rate else None, batch_size))
+        for item in _receive(sock, pool, timeout, report_interval, 'SCAN', label, buffer):
+            if isinstance(item, Event):
+                yield item
+                continue
+            length = item[0]
+            ihl = (buffer[0] & 0x0F) * 4
+            if length < ihl + TCP_REPLY.size:
+                continue
+            sport, dport, _, ack, _, flags = TCP_REPLY.unpack_from(buffer, ihl)
+            daddr = int.from_bytes(buffer[12:16], 'big')
+            if (daddr, sport) in responded or not cookie.check(saddr, daddr, sport, dport, ack):
+                continue
+            if flags & TCP_FLAG_SYN_ACK == TCP_FLAG_SYN_ACK:
+                state = OPEN
+            elif flags & TCP_FLAG_RST:
+                state = CLOSED
+            else:
+                continue
+            responded[(daddr, sport)] = state
+            if state in states:
+                yield event(REPLY, 'SCAN', socket.inet_ntoa(buffer[12:16]), port=sport, state=state)
+    finally:
+        if pool is not None:
+            pool.stop()
+        sock.close()
+
+    yield from pool.errors('SCAN', label)
+    open_count = sum(1 for state in responded.values() if state == OPEN)
+    closed_count = len(responded) - open_count
+    elapsed = time.perf_counter() - pool.start
+    yield event(SUMMARY, 'SCAN', label, open=open_count, closed=closed_count,
+                filtered=len(space) * len(ports) - len(responded), sent=pool.counters.total(SENT),
+                received=len(responded), send_errors=pool.counters.total(ERRORS), timings={},
+                pps=pool.pps, target_pps=rate, elapsed=elapsed, workers=workers)
+
+
+def sharded_sweep_events(targets, count=1, workers=None, rate=None, timeout=2, interval=1.0,
+                         batch_size=64, report_interval=1.0):
+    """
+    多进程批量Ping：每个目标 count 轮；回复到达时产生事件，
+    最后为每个有回复的目标产生汇总事件，再产生一个目标为 "all" 的总体汇总；
+    有工作进程异常退出时在汇总之前为每个这样的进程产生一个错误事件
+    """
+    workers = workers or os.cpu_count() or 1
+    space = AddressSpace(targets)
+    icmp_id = os.getpid() & 0xFFFF
+    cookie = SynCookie()
+    round_bits = _round_bits(count)
+    round_mask = (1 << round_bits) - 1
+
+    stats = {}  # 有回复的目标 -> PingStats
+    seen = set()  # (地址, 轮次)
+    buffer = bytearray(2048)
+    pool = None
+    sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 8 * 1024 * 1024)
+        attach_filter(sock, icmp_echo_reply_filter(icmp_id))
+        enable_kernel_timestamps(sock)
+        sock.setblocking(False)
+        pool = _Pool(_sweep_worker, workers, (space, count, icmp_id, cookie.key,
+                                              rate / workers if rate else None, batch_size, interval))
+        for item in _receive(sock, pool, timeout, report_interval, 'SWEEP', str(targets), buffer):
+            if isinstance(item, Event):
+                yield item
+                continue
+            length, recv_ns = item
+            ihl = (buffer[0] & 0x0F) * 4
+            if length < ihl + ICMP_HEADER.size + _U64.size:
+                continue
+            icmp_type, _, _, reply_id, seq = ICMP_HEADER.unpack_from(buffer, ihl)
+            if icmp_type != ICMP_ECHO_REPLY or reply_id != icmp_id:
+                continue
+            saddr = int.from_bytes(buffer[12:16], 'big')
+            round_no = seq & round_mask
+            if (round_no >= count or _sweep_seq(cookie.seq, saddr, round_no, round_bits) != seq
+                    or (saddr, round_no) in seen):
+                continue
+            seen.add((saddr, round_no))
+            host = socket.inet_ntoa(buffer[12:16])
+            host_stats = stats.get(host)
+            if host_stats is None:
+                host_stats = stats[host] = PingStats(host)
+                host_stats.sent = count
+            rtt = max(0, recv_ns - _U64.unpack_from(buffer, ihl + ICMP_HEADER.size)[0]) / 1e6
+            host_stats.received += 1
+            host_stats.rtts.append(rtt)
+            yield event(REPLY, 'SWEEP', host, seq=round_no, rtt=rtt)
+    finally:
+        if pool is not None:
+            pool.stop()
+        sock.close()
+
+    yield from pool.errors('SWEEP', str(targets))
+    rtts = []
+    for host_stats in stats.values():
+        rtts += host_stats.rtts
+        yield event(SUMMARY, 'SWEEP', host_stats.host, sent=count, received=host_stats.received,
+                    lost=host_stats.lost, loss_rate=host_stats.loss_rate,
+                    timings={'min': host_stats.min_rtt, 'avg': host_stats.avg_rtt, 'max': host_stats.max_rtt,
+                             'p90': host_stats.percentile(90)})
+    rtts.sort()
+    sent = len(space) * count
+    timings = {}
+    if rtts:
+        timings = {'min': rtts[0], 'avg': sum(rtts) / len(rtts), 'max': rtts[-1], 'p90': percentile(rtts, 90)}
+    yield event(SUMMARY, 'SWEEP', 'all', sent=sent, received=len(rtts), lost=sent - len(rtts),
+                loss_rate=(sent - len(rtts)) / sent * 100 if sent else 0.0, timings=timings,
+                alive=len(stats), pps=pool.pps, workers=workers)
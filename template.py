@@ -0,0 +1,182 @@
+"""
+预编译报文模板
+
+IP头 + 传输层头 + 负载在构造时一次性打包进一个可复用的 bytearray，
+之后每生成一个报文只用 pack_into 改写变化的字段（标识、序列号、端口、目的地址），
+校验和由构造时算好的“不变部分反码和”加上变化字段得到，不再重新打包和整段求和。
+
+build() 返回的是模板内部的缓冲区，下一次 build() 会覆盖它；
+需要保留报文时请自行 bytes(packet)。
+"""
+import random
+import socket
+import struct
+
+from checksum import finish_checksum, ones_complement_sum
+from ICMP import ICMP_ECHO_REQUEST, ICMP_HEADER, ICMP_PAYLOAD
+from IP import IP_HEADER, ip_to_int
+from TCP import TCP_FLAG_SYN, TCP_HEADER, TCP_OPTIONS, TCP_WINDOW
+from UDP import UDP_HEADER
+
+_U16 = struct.Struct('!H')
+_U32 = struct.Struct('!L')
+_U16_PAIR = struct.Struct('!HH')  # 端口对 / ICMP标识符+序列号
+_PORTS_SEQ = struct.Struct('!HHL')
+
+IP_LEN = IP_HEADER.size
+
+
+def _pseudo_header_sum(saddr, protocol, length):
+    """伪头部中不变部分（源地址、协议号、长度）的反码和，目的地址由 build() 累加"""
+    return (saddr >> 16) + (saddr & 0xFFFF) + protocol + length
+
+
+class PacketTemplate:
+    """IP报文模板：负责IP头部，传输层字段由子类处理"""
+
+    def __init__(self, src_ip, dst_ip, protocol, transport, ttl=64):
+        self.protocol = protocol
+        self.saddr = ip_to_int(src_ip)
+        self.daddr = ip_to_int(dst_ip)
+        self.buffer = bytearray(IP_LEN + len(transport))
+
+        # 标识、校验和、目的地址置0，其余字段固定
+        IP_HEADER.pack_into(self.buffer, 0,
+                            (4 << 4) + 5,  # 版本和头部长度
+                            0,  # 服务类型
+                            len(self.buffer),  # 总长度
+                            0,  # 标识
+                            0,  # 标志和片偏移
+                            ttl,  # 生存时间
+                            protocol,  # 协议
+                            0,  # 校验和
+                            _U32.pack(self.saddr),  # 源IP地址
+                            b'\x00\x00\x00\x00'  # 目标IP地址
+                            )
+        self.buffer[IP_LEN:] = transport
+        self._ip_sum = ones_complement_sum(memoryview(self.buffer)[:IP_LEN])
+        self._ip_id = random.randint(1, 65535)
+
+    @property
+    def transport(self):
+        """传输层部分的视图（不含IP头），用于内核自行构建IP头的套接字"""
+        return memoryview(self.buffer)[IP_LEN:]
+
+    def _patch_ip(self, daddr, ip_id):
+        """改写IP头的标识和目的地址，并由部分和得到新的头部校验和"""
+        if ip_id is None:
+            ip_id = self._ip_id = (self._ip_id + 1) & 0xFFFF
+        buf = self.buffer
+        _U16.pack_into(buf, 4, ip_id)
+        _U32.pack_into(buf, 16, daddr)
+        _U16.pack_into(buf, 10, finish_checksum(self._ip_sum + ip_id + (daddr >> 16) + (daddr & 0xFFFF)))
+
+
+class TCPSynTemplate(PacketTemplate):
+    """TCP SYN报文模板（含MSS/窗口扩大/SACK选项），每个报文只改端口、序列号和目的地址"""
+
+    def __init__(self, src_ip, dst_ip, src_port, dst_port, options=TCP_OPTIONS, flags=TCP_FLAG_SYN, ttl=64):
+        tcp_length = TCP_HEADER.size + len(options)
+        tcp_header = bytearray(tcp_length)
+        TCP_HEADER.pack_into(tcp_header, 0,
+                             0,  # 源端口（每包填写）
+                             0,  # 目标端口（每包填写）
+                             0,  # 序列号（每包填写）
+                             0,  # 确认号
+                             ((tcp_length // 4) << 12) | flags,  # 数据偏移和标志位
+                             TCP_WINDOW,  # 窗口大小
+                             0,  # 校验和
+                             0  # 紧急指针
+                             )
+        tcp_header[TCP_HEADER.size:] = options
+        super().__init__(src_ip, dst_ip, socket.IPPROTO_TCP, tcp_header, ttl)
+
+        self.src_port = int(src_port)
+        self.dst_port = int(dst_port)
+        self._tcp_sum = ones_complement_sum(tcp_header, _pseudo_header_sum(self.saddr, socket.IPPROTO_TCP, tcp_length))
+
+    def build(self, seq, src_port=None, dst_port=None, daddr=None, ip_id=None):
+        """生成一个SYN报文，daddr 为32位整数形式的目的地址"""
+        sport = self.src_port if src_port is None else src_port
+        dport = self.dst_port if dst_port is None else dst_port
+        daddr = self.daddr if daddr is None else daddr
+        buf = self.buffer
+
+        _PORTS_SEQ.pack_into(buf, IP_LEN, sport, dport, seq)
+        _U16.pack_into(buf, IP_LEN + 16, finish_checksum(
+            self._tcp_sum + (daddr >> 16) + (daddr & 0xFFFF) + sport + dport + (seq >> 16) + (seq & 0xFFFF)))
+        self._patch_ip(daddr, ip_id)
+        return buf
+
+
+class UDPTemplate(PacketTemplate):
+    """UDP报文模板（负载固定），每个报文只改端口和目的地址，校验和包含伪头部"""
+
+    def __init__(self, src_ip, dst_ip, src_port, dst_port, payload=b'', ttl=64):
+        udp_length = UDP_HEADER.size + len(payload)
+        udp_packet = UDP_HEADER.pack(0, 0, udp_length, 0) + payload
+        super().__init__(src_ip, dst_ip, socket.IPPROTO_UDP, udp_packet, ttl)
+
+        self.src_port = int(src_port)
+        self.dst_port = int(dst_port)
+        self._udp_sum = ones_complement_sum(udp_packet, _pseudo_header_sum(self.saddr, socket.IPPROTO_UDP, udp_length))
+
+    def build(self, src_port=None, dst_port=None, daddr=None, ip_id=None):
+        sport = self.src_port if src_port is None else src_port
+        dport = self.dst_port if dst_port is None else dst_port
+        daddr = self.daddr if daddr is None else daddr
+        buf = self.buffer
+
+        _U16_PAIR.pack_into(buf, IP_LEN, sport, dport)
+        # UDP中校验和为0表示“未计算”，算出0时按RFC 768写成0xFFFF
+        _U16.pack_into(buf, IP_LEN + 6, finish_checksum(
+            self._udp_sum + (daddr >> 16) + (daddr & 0xFFFF) + sport + dport) or 0xFFFF)
+        self._patch_ip(daddr, ip_id)
+        return buf
+
+
+class UDPPayloadTemplate(PacketTemplate):
+    """
+    负载逐包变化的UDP报文模板（目的地址和端口固定）
+    payload 需提供 initial（初始负载字节）和 fill(视图, 序号)：把本包负载写进视图并返回负载的反码和，
+    校验和由固定部分（伪头部+UDP头）的部分和加上负载和得到
+    """
+
+    def __init__(self, src_ip, dst_ip, src_port, dst_port, payload, ttl=64):
+        initial = payload.initial
+        udp_length = UDP_HEADER.size + len(initial)
+        header = UDP_HEADER.pack(int(src_port), int(dst_port), udp_length, 0)
+        super().__init__(src_ip, dst_ip, socket.IPPROTO_UDP, header + initial, ttl)
+
+        self.payload = payload
+        self._payload_view = memoryview(self.buffer)[IP_LEN + UDP_HEADER.size:]
+        self._udp_sum = ones_complement_sum(header, _pseudo_header_sum(self.saddr, socket.IPPROTO_UDP, udp_length)
+                                            + (self.daddr >> 16) + (self.daddr & 0xFFFF))
+
+    def build(self, seq, ip_id=None):
+        buf = self.buffer
+        payload_sum = self.payload.fill(self._payload_view, seq)
+        _U16.pack_into(buf, IP_LEN + 6, finish_checksum(self._udp_sum + payload_sum) or 0xFFFF)
+        self._patch_ip(self.daddr, ip_id)
+        return buf
+
+
+class ICMPEchoTemplate(PacketTemplate):
+    """ICMP Echo Request报文模板，每个报文只改标识符、序列号和目的地址"""
+
+    def __init__(self, src_ip, dst_ip, icmp_id, payload=ICMP_PAYLOAD, ttl=64):
+        icmp_packet = ICMP_HEADER.pack(ICMP_ECHO_REQUEST, 0, 0, 0, 0) + payload
+        super().__init__(src_ip, dst_ip, socket.IPPROTO_ICMP, icmp_packet, ttl)
+
+        self.icmp_id = icmp_id
+        self._icmp_sum = ones_complement_sum(icmp_packet)
+
+    def build(self, seq, icmp_id=None, daddr=None, ip_id=None):
+        icmp_id = self.icmp_id if icmp_id is None else icmp_id
+        daddr = self.daddr if daddr is None else daddr
+        buf = self.buffer
+
+        _U16_PAIR.pack_into(buf, IP_LEN + 4, icmp_id, seq)
+        _U16.pack_into(buf, IP_LEN + 2, finish_checksum(self._icmp_sum + icmp_id + seq))
+        self._patch_ip(daddr, ip_id)
+        return buf
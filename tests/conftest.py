@@ -0,0 +1,20 @@
+import os
+import socket
+import sys
+
+import pytest
+
+# 模块都在仓库根目录，不是包
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _can_open_raw_socket():
+    try:
+        socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP).close()
+        return True
+    except PermissionError:
+        return False
+
+
+# 需要原始套接字（root 或 CAP_NET_RAW）的测试
+raw_socket = pytest.mark.skipif(not _can_open_raw_socket(), reason="需要原始套接字权限")
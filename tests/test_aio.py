@@ -0,0 +1,40 @@
+import asyncio
+
+from aio import AsyncPinger, icmp_ping_async
+from conftest import raw_socket
+from ICMP import next_icmp_id
+
+
+@raw_socket
+def test_ping_loopback():
+    stats = asyncio.run(icmp_ping_async('127.0.0.1', count=2, timeout=1, interval=0.01))
+    assert (stats.sent, stats.received) == (2, 2)
+
+
+@raw_socket
+def test_concurrent_pings_share_one_socket():
+    async def main():
+        async with AsyncPinger() as pinger:
+            return await pinger.ping_many(['127.0.0.1', '127.0.0.2', '127.0.0.3'], count=2, timeout=1,
+                                          interval=0.01)
+
+    results = asyncio.run(main())
+    assert sorted(results) == ['127.0.0.1', '127.0.0.2', '127.0.0.3']
+    assert all(stats.received == 2 for stats in results.values())
+
+
+@raw_socket
+def test_hostname_replies_are_matched():
+    stats = asyncio.run(icmp_ping_async('localhost', count=2, timeout=1, interval=0.01))
+    assert stats.host == 'localhost'
+    assert stats.received == 2
+
+
+@raw_socket
+def test_pingers_get_distinct_identifiers():
+    async def main():
+        async with AsyncPinger() as first, AsyncPinger() as second:
+            return first._icmp_id, second._icmp_id, next_icmp_id()
+
+    first, second, later = asyncio.run(main())
+    assert len({first, second, later}) == 3
@@ -0,0 +1,30 @@
+import socket
+import struct
+
+import pytest
+
+from batch_sender import BatchSender
+from conftest import raw_socket
+from IP import build_ip_header
+
+
+def udp_packet(port, payload):
+    segment = struct.pack('!HHHH', 40000, port, 8 + len(payload), 0) + payload
+    return bytes(build_ip_header('127.0.0.1', '127.0.0.1', socket.IPPROTO_UDP, len(segment))) + segment
+
+
+@raw_socket
+@pytest.mark.parametrize('use_sendmmsg', [True, False])
+def test_batches_reach_the_receiver(use_sendmmsg):
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(('127.0.0.1', 0))
+    receiver.settimeout(1)
+    port = receiver.getsockname()[1]
+    try:
+        with BatchSender(batch_size=4, use_sendmmsg=use_sendmmsg) as sender:
+            stats = sender.send(udp_packet(port, b'%d' % i) for i in range(10))
+            sender.add(b'short')
+        assert (stats.packets, stats.batches, stats.errors) == (10, 3, 1)
+        assert sorted(int(receiver.recv(64)) for _ in range(10)) == list(range(10))
+    finally:
+        receiver.close()
@@ -0,0 +1,19 @@
+import bench
+
+
+def test_compare_flags_regressions():
+    baseline = {'results': {'a': {'ns_op': 100, 'alloc_bytes': 0}, 'b': {'ns_op': 100, 'alloc_bytes': 0},
+                            'c': {'ns_op': 100, 'alloc_bytes': 0}, 'd': {'ns_op': 100, 'alloc_bytes': 0}}}
+    results = {'a': {'ns_op': 150, 'alloc_bytes': 0}, 'b': {'ns_op': 50, 'alloc_bytes': 0},
+               'c': {'ns_op': 101, 'alloc_bytes': 4096}, 'd': {'ns_op': 102, 'alloc_bytes': 0},
+               'e': {'ns_op': 10, 'alloc_bytes': 0}, 'f': {'skipped': '需要 root'}}
+    verdicts = bench.compare(results, baseline, threshold=0.1)
+    assert verdicts == {'a': 'slower', 'b': 'faster', 'c': 'more_alloc', 'd': 'ok', 'e': 'new', 'f': 'skipped'}
+    assert bench.compare(results, None)['a'] == 'new'
+
+
+def test_baseline_round_trip(tmp_path):
+    path = str(tmp_path / 'baseline.json')
+    assert bench.load_baseline(path) is None
+    bench.save_baseline({'a': {'ns_op': 1.5}}, path)
+    assert bench.load_baseline(path)['results'] == {'a': {'ns_op': 1.5}}
@@ -0,0 +1,121 @@
+import socket
+import struct
+
+import pytest
+
+from bpf import (BPF_ABS, BPF_B, BPF_H, BPF_IND, BPF_JEQ, BPF_JGE, BPF_JGT, BPF_JMP, BPF_JSET, BPF_LD, BPF_LDX,
+                 BPF_MSH, BPF_RET, BPF_W, compile_filter, icmp_echo_reply_filter, icmp_error_filter,
+                 tcp_reply_filter, udp_from_port_filter)
+from ICMP import ICMP_HEADER
+from IP import build_ip_header
+
+_SIZES = {BPF_B: 1, BPF_H: 2, BPF_W: 4}
+
+
+def run(program, packet):
+    """经典BPF解释器（只实现过滤器用到的指令），返回接收的字节数，0为丢弃"""
+    a = x = 0
+    pc = 0
+    while True:
+        code, jt, jf, k = program[pc]
+        cls = code & 0x07
+        if cls == BPF_RET:
+            return k
+        if cls == BPF_LDX and code & 0xE0 == BPF_MSH:
+            if k >= len(packet):
+                return 0
+            x = (packet[k] & 0x0F) * 4
+        elif cls == BPF_LD:
+            size = _SIZES[code & 0x18]
+            offset = k + (x if code & 0xE0 == BPF_IND else 0)
+            if offset + size > len(packet):
+                return 0
+            a = int.from_bytes(packet[offset:offset + size], 'big')
+        elif cls == BPF_JMP:
+            op = code & 0xF0
+            taken = {BPF_JEQ: a == k, BPF_JGE: a >= k, BPF_JGT: a > k, BPF_JSET: bool(a & k)}[op]
+            pc += jt if taken else jf
+        else:
+            raise AssertionError(f"未知指令 {code:#x}")
+        pc += 1
+
+
+def ip(protocol, payload, src='10.0.0.2', dst='10.0.0.1'):
+    return build_ip_header(src, dst, protocol, len(payload)) + payload
+
+
+def tcp(sport, dport):
+    return struct.pack('!HHLLHHHH', sport, dport, 1, 2, (5 << 12) | 0x12, 1024, 0, 0)
+
+
+def echo_reply(icmp_id):
+    return ICMP_HEADER.pack(0, 0, 0, icmp_id, 1) + b'x' * 8
+
+
+def test_icmp_echo_reply_filter():
+    program = icmp_echo_reply_filter(icmp_id=0x1234)
+    assert run(program, ip(socket.IPPROTO_ICMP, echo_reply(0x1234)))
+    assert not run(program, ip(socket.IPPROTO_ICMP, echo_reply(0x1235)))
+    assert not run(program, ip(socket.IPPROTO_ICMP, ICMP_HEADER.pack(8, 0, 0, 0x1234, 1)))
+    assert not run(program, ip(socket.IPPROTO_UDP, echo_reply(0x1234)))
+
+
+def test_icmp_id_range():
+    program = icmp_echo_reply_filter(id_range=(100, 200))
+    assert [bool(run(program, ip(socket.IPPROTO_ICMP, echo_reply(i)))) for i in (99, 100, 200, 201)] == \
+           [False, True, True, False]
+
+
+def test_tcp_reply_filter_port_range():
+    program = tcp_reply_filter((40000, 40010), src_port=80)
+    assert run(program, ip(socket.IPPROTO_TCP, tcp(80, 40005)))
+    assert not run(program, ip(socket.IPPROTO_TCP, tcp(80, 40011)))
+    assert not run(program, ip(socket.IPPROTO_TCP, tcp(443, 40005)))
+
+
+def test_fragments_are_dropped():
+    packet = bytearray(ip(socket.IPPROTO_TCP, tcp(80, 40000)))
+    packet[6:8] = struct.pack('!H', 10)  # 片偏移不为0
+    assert not run(tcp_reply_filter(40000), bytes(packet))
+
+
+def test_ip_options_shift_transport_header():
+    header = bytearray(build_ip_header('10.0.0.2', '10.0.0.1', socket.IPPROTO_UDP, 8 + 4))
+    header[0] = 0x46  # 24字节IP头
+    packet = bytes(header) + b'\x01\x01\x01\x00' + struct.pack('!HHHH', 53, 5000, 8, 0)
+    assert run(udp_from_port_filter(53), packet)
+    assert run(udp_from_port_filter(53, 5000), packet)
+    assert not run(udp_from_port_filter(53, 5001), packet)
+
+
+def test_icmp_error_filter_matches_quoted_header():
+    inner = ip(socket.IPPROTO_UDP, struct.pack('!HHHH', 33434, 33435, 8, 0), src='10.0.0.1', dst='10.9.9.9')
+    outer = ip(socket.IPPROTO_ICMP, ICMP_HEADER.pack(11, 0, 0, 0, 0) + inner)
+    assert run(icmp_error_filter(socket.IPPROTO_UDP, 33434), outer)
+    assert not run(icmp_error_filter(socket.IPPROTO_UDP, 33435), outer)
+
+
+def test_link_offset():
+    program = tcp_reply_filter(40000, link_offset=14)
+    assert run(program, b'\x00' * 14 + ip(socket.IPPROTO_TCP, tcp(80, 40000)))
+
+
+def test_short_packet_is_dropped():
+    assert not run(tcp_reply_filter(40000), b'\x45\x00')
+
+
+def test_too_long_program():
+    with pytest.raises(ValueError):
+        compile_filter([('ip', 1, 9, 'eq', 6)] * 300)
+
+
+def test_attach_to_socket():
+    # 挂载需要权限时跳过，只验证内核接受编译出的程序
+    try:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP)
+    except PermissionError:
+        pytest.skip("需要原始套接字权限")
+    from bpf import attach_filter, detach_filter
+    with sock:
+        attach_filter(sock, icmp_echo_reply_filter(icmp_id=1))
+        detach_filter(sock)
@@ -0,0 +1,52 @@
+import socket
+import struct
+
+from bpf import icmp_echo_reply_filter
+from capture import LINK_OFFSET, PacketRing
+from checksum import calculate_checksum
+from conftest import raw_socket
+
+
+def echo_request(icmp_id, seq):
+    header = struct.pack('!BBHHH', 8, 0, 0, icmp_id, seq) + b'ring'
+    return header[:2] + struct.pack('!H', calculate_checksum(header)) + header[4:]
+
+
+@raw_socket
+def test_ring_delivers_icmp_frames_to_the_handler():
+    seen = []
+
+    def handle(view, length, recv_ns=None):
+        ihl = (view[0] & 0x0F) * 4
+        seen.append(struct.unpack_from('!BBHHH', view, ihl))
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP)
+    try:
+        with PacketRing('lo', block_size=1 << 16, block_nr=4, retire_ms=5) as ring:
+            ring.add_handler(socket.IPPROTO_ICMP, handle)
+            sock.sendto(echo_request(0x5A5A, 7), ('127.0.0.1', 0))
+            ring.run_for(0.2)
+    finally:
+        sock.close()
+    ours = {(icmp_type, seq) for icmp_type, _, _, icmp_id, seq in seen if icmp_id == 0x5A5A}
+    assert ours == {(8, 7), (0, 7)}
+    assert ring.stats.dispatched >= 2
+
+
+@raw_socket
+def test_filter_is_compiled_for_the_link_header():
+    seen = []
+    sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP)
+    try:
+        bpf_filter = icmp_echo_reply_filter(0x5A5B, link_offset=LINK_OFFSET)
+        with PacketRing('lo', block_size=1 << 16, block_nr=4, retire_ms=5, bpf_filter=bpf_filter) as ring:
+            ring.add_handler(socket.IPPROTO_ICMP, lambda view, length, recv_ns: seen.append(bytes(view)))
+            sock.sendto(echo_request(0x5A5A, 1), ('127.0.0.1', 0))
+            sock.sendto(echo_request(0x5A5B, 2), ('127.0.0.1', 0))
+            ring.run_for(0.2)
+    finally:
+        sock.close()
+    # 只有标识符匹配的 Echo Reply 进了环，请求和另一个标识符的回复都在内核里被丢掉
+    assert len(seen) == 1 and ring.stats.frames == 1
+    icmp_type, _, _, icmp_id, seq = struct.unpack_from('!BBHHH', seen[0], 20)
+    assert (icmp_type, icmp_id, seq) == (0, 0x5A5B, 2)
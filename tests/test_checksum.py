@@ -0,0 +1,83 @@
+import os
+import socket
+import struct
+
+import pytest
+
+from checksum import (calculate_checksum, calculate_checksums, finish_checksum, ones_complement_sum,
+                      transport_checksum, update_checksum, update_checksum32, update_checksum_bytes)
+
+
+def reference_checksum(data):
+    """逐个16位字累加的 RFC 1071 实现"""
+    if len(data) % 2:
+        data += b'\x00'
+    total = 0
+    for (word,) in struct.iter_unpack('!H', data):
+        total += word
+        total = (total & 0xFFFF) + (total >> 16)
+    return ~total & 0xFFFF
+
+
+@pytest.mark.parametrize('size', [0, 1, 2, 3, 20, 21, 60, 1499, 1500])
+def test_matches_reference(size):
+    data = os.urandom(size)
+    assert calculate_checksum(data) == reference_checksum(data)
+
+
+@pytest.mark.parametrize('data', [b'', b'\x00\x00', b'\xff\xff', b'\xff\xff\xff\xff', b'\x00\x01\xff\xfe'])
+def test_edge_values(data):
+    assert calculate_checksum(data) == reference_checksum(data)
+
+
+def test_accepts_bytearray_and_memoryview():
+    data = os.urandom(41)
+    expected = reference_checksum(data)
+    assert calculate_checksum(bytearray(data)) == expected
+    assert calculate_checksum(memoryview(data)) == expected
+
+
+def test_checksum_of_checksummed_data_is_zero():
+    header = bytearray(os.urandom(20))
+    header[10:12] = b'\x00\x00'
+    struct.pack_into('!H', header, 10, calculate_checksum(header))
+    assert calculate_checksum(header) == 0
+
+
+def test_batch():
+    packets = [os.urandom(n) for n in (20, 33, 64)]
+    assert calculate_checksums(packets) == [reference_checksum(p) for p in packets]
+    buffer = os.urandom(40 * 5)
+    assert calculate_checksums(buffer, stride=40) == [reference_checksum(buffer[i:i + 40]) for i in range(0, 200, 40)]
+
+
+def test_partial_sums_combine():
+    a, b = os.urandom(20), os.urandom(30)
+    assert finish_checksum(ones_complement_sum(b, ones_complement_sum(a))) == reference_checksum(a + b)
+
+
+def test_incremental_updates():
+    data = bytearray(os.urandom(40))
+    checksum = calculate_checksum(data)
+
+    old = struct.unpack_from('!H', data, 6)[0]
+    struct.pack_into('!H', data, 6, 0x1234)
+    checksum = update_checksum(checksum, old, 0x1234)
+    assert checksum == reference_checksum(bytes(data))
+
+    old = struct.unpack_from('!L', data, 12)[0]
+    struct.pack_into('!L', data, 12, 0xDEADBEEF)
+    checksum = update_checksum32(checksum, old, 0xDEADBEEF)
+    assert checksum == reference_checksum(bytes(data))
+
+    old_bytes = bytes(data[20:28])
+    data[20:28] = b'newbytes'
+    checksum = update_checksum_bytes(checksum, old_bytes, b'newbytes')
+    assert checksum == reference_checksum(bytes(data))
+
+
+def test_transport_checksum_includes_pseudo_header():
+    src, dst = socket.inet_aton('10.0.0.1'), socket.inet_aton('10.0.0.2')
+    segment = os.urandom(27)
+    pseudo = src + dst + struct.pack('!BBH', 0, socket.IPPROTO_UDP, len(segment))
+    assert transport_checksum(src, dst, socket.IPPROTO_UDP, segment) == reference_checksum(pseudo + segment)
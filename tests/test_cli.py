@@ -0,0 +1,60 @@
+import json
+
+import cli
+from conftest import raw_socket
+
+
+def run_cli(capsys, *argv):
+    code = cli.run(list(argv))
+    lines = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    return code, lines
+
+
+def test_read_targets_from_arguments_and_files(tmp_path):
+    path = tmp_path / 'targets.txt'
+    path.write_text('10.0.0.1  # 网关\n\n10.0.0.0/30\n', encoding='utf-8')
+    args = cli.build_parser().parse_args(['icmp', '10.0.0.9,10.0.0.8', '-f', str(path)])
+    assert list(cli.read_targets(args)) == ['10.0.0.9', '10.0.0.8', '10.0.0.1', '10.0.0.0/30']
+    assert list(cli.expand_addresses(['10.0.0.0/30', 'example.com'])) == ['10.0.0.1', '10.0.0.2', 'example.com']
+
+
+@raw_socket
+def test_ping_events_are_json_lines(capsys):
+    code, lines = run_cli(capsys, 'icmp', '127.0.0.1', '-n', '2', '-i', '0.01', '-t', '1')
+    assert code == 0
+    assert [e['kind'] for e in lines if e['kind'] != 'sent'] == ['start', 'reply', 'reply', 'summary']
+    assert lines[-1]['target'] == '127.0.0.1' and lines[-1]['received'] == 2
+
+
+def test_worker_exception_becomes_error_event(capsys, monkeypatch):
+    def broken(args):
+        def make_events(target, port):
+            raise RuntimeError('坏了')
+        return make_events
+
+    monkeypatch.setattr(cli, '_per_target_events', broken)
+    code, lines = run_cli(capsys, 'udp', '127.0.0.1', '-p', '9,10')
+    assert code == 1
+    assert [e['kind'] for e in lines] == ['error', 'error']
+    assert all('坏了' in e['message'] for e in lines)
+
+
+@raw_socket
+def test_invalid_ip_target_reports_error(capsys):
+    code, lines = run_cli(capsys, 'ip', 'notanip')
+    assert code == 1
+    assert lines[0]['kind'] == 'error'
+
+
+@raw_socket
+def test_hostname_tcp_target_reports_error(capsys):
+    code, lines = run_cli(capsys, 'tcp', 'localhost', '-p', '80')
+    assert code == 1
+    assert lines[0]['kind'] == 'error'
+
+
+@raw_socket
+def test_out_of_range_udp_port_reports_error(capsys):
+    code, lines = run_cli(capsys, 'udp', '127.0.0.1', '-p', '70000')
+    assert code == 1
+    assert lines[0]['kind'] == 'error'
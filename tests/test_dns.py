@@ -0,0 +1,117 @@
+import struct
+
+import pytest
+
+from DNS import (ANSWER, AUTHORITY, QTYPE_A, QTYPE_CNAME, QTYPE_MX, QTYPE_TXT, DNSMessage, DNSParseError,
+                 DNSQueryError, build_dns_query, iter_tcp_messages, parse_dns_response, read_name)
+
+
+def encode_name(name):
+    return b''.join(bytes([len(part)]) + part.encode() for part in name.split('.')) + b'\x00'
+
+
+def rr(name, type_, data, ttl=300):
+    return name + struct.pack('!HHIH', type_, 1, ttl, len(data)) + data
+
+
+def response(transaction_id=0x1234, answers=(), authority=(), flags=0x8180, question='example.com'):
+    header = struct.pack('!HHHHHH', transaction_id, flags, 1, len(answers), len(authority), 0)
+    return header + encode_name(question) + struct.pack('!HH', QTYPE_A, 1) + b''.join(answers) + b''.join(authority)
+
+
+# 问题中的域名从偏移12开始，压缩指针 0xC00C 指向它
+POINTER = b'\xc0\x0c'
+
+
+def test_query_round_trip():
+    packet, transaction_id = build_dns_query('www.example.com', transaction_id=7)
+    message = DNSMessage(packet)
+    assert transaction_id == 7
+    assert message.id == 7
+    assert message.questions == [('www.example.com', QTYPE_A, 1)]
+    assert message.answers == []
+
+
+def test_answers_with_compression():
+    data = response(answers=[
+        rr(POINTER, QTYPE_CNAME, b'\x03www' + POINTER),
+        rr(b'\x03www' + POINTER, QTYPE_A, bytes([93, 184, 216, 34])),
+        rr(POINTER, QTYPE_MX, struct.pack('!H', 10) + b'\x04mail' + POINTER),
+        rr(POINTER, QTYPE_TXT, b'\x05hello\x05world'),
+    ])
+    message = DNSMessage(data)
+    records = message.answers
+    assert [r.name for r in records] == ['example.com', 'www.example.com', 'example.com', 'example.com']
+    assert records[0].data == 'www.example.com'
+    assert records[1].data == '93.184.216.34'
+    assert records[2].data == (10, 'mail.example.com')
+    assert records[3].data == ('hello', 'world')
+    assert parse_dns_response(data, 0x1234) == ['93.184.216.34']
+
+
+def test_sections_are_separated():
+    data = response(answers=[rr(POINTER, QTYPE_A, b'\x01\x02\x03\x04')],
+                    authority=[rr(POINTER, QTYPE_A, b'\x05\x06\x07\x08')])
+    sections = [section for section, _ in DNSMessage(data).iter_records()]
+    assert sections == [ANSWER, AUTHORITY]
+
+
+def test_rcode():
+    assert DNSMessage(response(flags=0x8183)).rcode == 3
+
+
+def test_pointer_loop_is_rejected():
+    # 偏移12处的指针指向自己
+    data = struct.pack('!HHHHHH', 1, 0x8180, 1, 0, 0, 0) + b'\xc0\x0c' + b'\x00\x01\x00\x01'
+    with pytest.raises(DNSParseError):
+        DNSMessage(data)
+
+
+def test_two_pointer_loop_is_rejected():
+    view = memoryview(b'\xc0\x02\xc0\x00')
+    with pytest.raises(DNSParseError):
+        read_name(view, 0)
+
+
+def test_overlong_name_is_rejected():
+    # 每个标签63字节，5个标签超过255字节
+    name = b''.join(b'\x3f' + b'a' * 63 for _ in range(5)) + b'\x00'
+    with pytest.raises(DNSParseError):
+        read_name(memoryview(name), 0)
+
+
+@pytest.mark.parametrize('cut', [5, 14, 20])
+def test_truncated_header_and_question(cut):
+    data = response(answers=[rr(POINTER, QTYPE_A, b'\x01\x02\x03\x04')])
+    with pytest.raises(DNSParseError):
+        DNSMessage(data[:cut])
+
+
+def test_truncated_record():
+    data = response(answers=[rr(POINTER, QTYPE_A, b'\x01\x02\x03\x04')])
+    message = DNSMessage(data[:-2])
+    with pytest.raises(DNSParseError):
+        message.answers
+    assert isinstance(parse_dns_response(data[:-2], 0x1234), DNSQueryError)
+
+
+def test_truncated_txt_string():
+    # 声明长度 9，记录里只剩 5 个字节；后面的记录数据不能被当成字符串内容
+    data = response(answers=[rr(POINTER, QTYPE_TXT, b'\x09hello'), rr(POINTER, QTYPE_A, b'\x01\x02\x03\x04')])
+    with pytest.raises(DNSParseError):
+        DNSMessage(data).answers
+
+
+def test_id_mismatch():
+    error = parse_dns_response(response(transaction_id=1), 2)
+    assert isinstance(error, DNSQueryError) and error.rcode is None
+    assert error == "响应ID不匹配"
+
+
+def test_tcp_stream():
+    a = response(transaction_id=1)
+    b = response(transaction_id=2)
+    stream = len(a).to_bytes(2, 'big') + a + len(b).to_bytes(2, 'big') + b
+    assert [m.id for m in iter_tcp_messages(stream)] == [1, 2]
+    with pytest.raises(DNSParseError):
+        list(iter_tcp_messages(stream[:-1]))
@@ -0,0 +1,138 @@
+import socket
+import struct
+import threading
+
+import pytest
+
+from conftest import raw_socket
+from DNS import QTYPE_A, RCODE_REFUSED, RCODE_SERVFAIL, DNSCache, DNSQueryError, DNSResolver
+
+# 按域名决定应答：响应码和A记录
+ANSWERS = {
+    'ok.test': (0, [bytes([10, 0, 0, 1])]),
+    'nx.test': (3, []),
+    'nodata.test': (0, []),
+    'fail.test': (RCODE_SERVFAIL, []),
+    'refused.test': (RCODE_REFUSED, []),
+}
+
+
+def question_name(query):
+    labels = []
+    offset = 12
+    while query[offset]:
+        labels.append(query[offset + 1:offset + 1 + query[offset]].decode())
+        offset += 1 + query[offset]
+    return '.'.join(labels)
+
+
+def answer(query):
+    rcode, records = ANSWERS[question_name(query)]
+    question = query[12:]
+    header = struct.pack('!HHHHHH', struct.unpack_from('!H', query)[0], 0x8180 | rcode, 1, len(records), 0, 0)
+    body = b''.join(b'\xc0\x0c' + struct.pack('!HHIH', QTYPE_A, 1, 60, 4) + data for data in records)
+    return header + question + body
+
+
+@pytest.fixture
+def server():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sock.bind(('127.0.0.1', 53))
+    except OSError as e:
+        sock.close()
+        pytest.skip(f"无法监听 127.0.0.1:53: {e}")
+    sock.settimeout(0.1)
+    stop = threading.Event()
+
+    def serve():
+        while not stop.is_set():
+            try:
+                data, addr = sock.recvfrom(512)
+            except socket.timeout:
+                continue
+            sock.sendto(answer(data), addr)
+
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    yield '127.0.0.1'
+    stop.set()
+    thread.join()
+    sock.close()
+
+
+def test_cache_entries_expire_after_ttl():
+    cache = DNSCache(maxsize=2)
+    cache.put('a.test', QTYPE_A, ['10.0.0.1'], 10, now=0)
+    assert cache.get('A.test', now=5) == ['10.0.0.1']
+    assert cache.get('a.test', now=10) is None
+    cache.put('a.test', QTYPE_A, [], 1, now=0)
+    cache.put('b.test', QTYPE_A, [], 1, now=0)
+    cache.put('c.test', QTYPE_A, [], 1, now=0)
+    assert len(cache) == 2 and cache.get('a.test', now=0) is None
+
+
+def test_resolve_many_answers_from_the_cache(server):
+    with DNSResolver(server, timeout=1) as resolver:
+        assert resolver.resolve_many(['ok.test', 'nx.test']) == {'ok.test': ['10.0.0.1'], 'nx.test': []}
+        hits = resolver.cache.hits
+        assert resolver.resolve('ok.test') == ['10.0.0.1']
+        assert resolver.cache.hits == hits + 1
+
+
+def test_server_given_by_hostname(server):
+    with DNSResolver('localhost', timeout=1) as resolver:
+        assert resolver.dns_server == server
+        assert resolver.resolve('ok.test') == ['10.0.0.1']
+
+
+def test_rcodes_are_surfaced(server):
+    with DNSResolver(server, timeout=1) as resolver:
+        results = resolver.resolve_many(list(ANSWERS))
+    assert results['ok.test'] == ['10.0.0.1']
+    assert results['nx.test'] == []
+    assert results['nodata.test'] == []
+    assert isinstance(results['fail.test'], DNSQueryError) and results['fail.test'].rcode == RCODE_SERVFAIL
+    assert isinstance(results['refused.test'], DNSQueryError) and results['refused.test'].rcode == RCODE_REFUSED
+
+
+def test_failures_are_not_cached(server):
+    with DNSResolver(server, timeout=1) as resolver:
+        resolver.resolve_many(['fail.test', 'nx.test'])
+        assert resolver.cache.get('fail.test') is None
+        assert resolver.cache.get('nx.test') == []
+
+
+class FailingSocket:
+    """发往某些域名的查询 sendto 失败，其余照常"""
+
+    def __init__(self, sock, failing):
+        self._sock = sock
+        self._failing = failing
+
+    def sendto(self, packet, address):
+        if any(name.encode() in packet for name in self._failing):
+            raise OSError(101, 'Network is unreachable')
+        return self._sock.sendto(packet, address)
+
+    def __getattr__(self, name):
+        return getattr(self._sock, name)
+
+
+def test_send_error_fails_only_that_query(server):
+    with DNSResolver(server, timeout=1) as resolver:
+        resolver.sock = FailingSocket(resolver.sock, ['nodata'])
+        results = resolver.resolve_many(['ok.test', 'nodata.test', 'a' * 300 + '.test'])
+        resolver.sock = resolver.sock._sock
+    assert results['ok.test'] == ['10.0.0.1']
+    assert isinstance(results['nodata.test'], DNSQueryError) and results['nodata.test'].rcode is None
+    assert isinstance(results['a' * 300 + '.test'], DNSQueryError)
+
+
+@raw_socket
+def test_ring_receive_path(server):
+    with DNSResolver(server, timeout=1, use_ring=True) as resolver:
+        results = resolver.resolve_many(['ok.test', 'nx.test', 'fail.test'])
+    assert results['ok.test'] == ['10.0.0.1']
+    assert results['nx.test'] == []
+    assert results['fail.test'].rcode == RCODE_SERVFAIL
@@ -0,0 +1,43 @@
+import ipaddress
+import json
+
+from events import REPLY, SUMMARY, JSONSink, TextSink, event
+from ICMP import PingStats
+
+
+def test_json_nested_values_are_stringified():
+    e = event(SUMMARY, 'TRACE', '10.0.0.1', hops=[[1, ipaddress.IPv4Address('10.0.0.254'), 0.5]],
+              extra={'addr': ipaddress.IPv4Address('10.0.0.1'), 'raw': b'\x01\xff'}, ports={22})
+    record = json.loads(JSONSink().format(e))
+    assert record['hops'] == [[1, '10.0.0.254', 0.5]]
+    assert record['extra'] == {'addr': '10.0.0.1', 'raw': '\x01\xff'}
+    assert record['ports'] == [22]
+
+
+def test_json_omits_result_objects():
+    e = event(SUMMARY, 'SWEEP', 'h', sent=1, stats=PingStats('h'), data=b'ab')
+    record = json.loads(JSONSink().format(e))
+    assert 'stats' not in record
+    assert record['sent'] == 1
+    assert record['data'] == 'ab'
+
+
+def test_json_reply_fields():
+    record = json.loads(JSONSink().format(event(REPLY, 'ICMP', 'h', seq=1, rtt=1.23456789)))
+    assert record == {'kind': 'reply', 'protocol': 'ICMP', 'target': 'h', 'seq': 1, 'rtt': 1.234568}
+
+
+def test_text_sink_closes_generator():
+    closed = []
+
+    def events():
+        try:
+            yield event(REPLY, 'ICMP', 'h', seq=1, rtt=1.0, addr='h', size=32, ttl=64)
+            yield event(REPLY, 'ICMP', 'h', seq=2, rtt=1.0, addr='h', size=32, ttl=64)
+        finally:
+            closed.append(True)
+
+    lines = TextSink().lines(events())
+    next(lines)
+    lines.close()
+    assert closed == [True]
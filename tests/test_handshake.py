@@ -0,0 +1,38 @@
+import socket
+
+from conftest import raw_socket
+from events import REPLY, SUMMARY, TextSink
+from handshake import CLOSE_FIN, handshake_events
+
+
+@raw_socket
+def test_listening_and_closed_ports():
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(8)
+    port = listener.getsockname()[1]
+    try:
+        events = list(handshake_events('127.0.0.1', '127.0.0.1', f'{port},{port + 1}', timeout=0.5))
+    finally:
+        listener.close()
+    states = {e.info['port']: e.info['state'] for e in events if e.kind == REPLY}
+    assert states == {port: 'open', port + 1: 'closed'}
+    assert [e for e in events if e.kind == REPLY and e.info['port'] == port][0].info['handshake'] is not None
+    assert events[-1].info['open'] == 1 and events[-1].info['closed'] == 1
+
+
+@raw_socket
+def test_reset_after_handshake_counts_as_open():
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(8)
+    port = listener.getsockname()[1]
+    try:
+        events = list(handshake_events('127.0.0.1', '127.0.0.1', str(port), close=CLOSE_FIN, timeout=0.5))
+    finally:
+        listener.close()
+    summary = events[-1]
+    assert summary.kind == SUMMARY
+    assert summary.info['open'] == 1
+    assert sum(summary.info['closed_by'].values()) == 1
+    assert '关闭:' in TextSink().format(summary)
@@ -0,0 +1,44 @@
+import socket
+import struct
+
+from interfaces import (IFA_ADDRESS, IFA_LOCAL, IFF_UP, IFLA_ADDRESS, IFLA_IFNAME, IFLA_MTU, _parse_address,
+                        _parse_link, read_netlink, read_sysfs)
+
+
+def loopback(interfaces):
+    return next(iface for iface in interfaces.values() if iface.is_loopback)
+
+
+def test_netlink_and_sysfs_agree_on_loopback():
+    netlink = loopback(read_netlink())
+    sysfs = loopback(read_sysfs())
+    assert netlink.name == sysfs.name == 'lo'
+    assert netlink.index == sysfs.index
+    assert netlink.mtu == sysfs.mtu > 0
+    assert netlink.is_up
+    assert ('127.0.0.1', 8) in netlink.ipv4
+    assert '127.0.0.1' in [address for address, _ in sysfs.ipv4]
+
+
+def rtattr(kind, data):
+    length = 4 + len(data)
+    return struct.pack('=HH', length, kind) + data + bytes(-length % 4)
+
+
+def test_parse_link_and_address_messages():
+    # 与内核转储相同的布局（主机字节序）：ifinfomsg/ifaddrmsg 之后跟若干 rtattr
+    link = (struct.pack('=BxHiII', socket.AF_UNSPEC, 1, 7, IFF_UP, 0)
+            + rtattr(IFLA_IFNAME, b'eth9\0') + rtattr(IFLA_MTU, struct.pack('=I', 9000))
+            + rtattr(IFLA_ADDRESS, bytes.fromhex('02fc00000001')))
+    iface = _parse_link(memoryview(link), 0, len(link))
+    assert (iface.index, iface.name, iface.mtu, iface.mac, iface.is_up) == (7, 'eth9', 9000, '02-FC-00-00-00-01', True)
+
+    address = (struct.pack('=BBBBI', socket.AF_INET, 24, 0, 0, 7)
+               + rtattr(IFA_ADDRESS, socket.inet_aton('10.0.0.2')) + rtattr(IFA_LOCAL, socket.inet_aton('10.0.0.1')))
+    assert _parse_address(memoryview(address), 0, len(address)) == (7, socket.AF_INET, '10.0.0.1', 24)
+    address6 = struct.pack('=BBBBI', socket.AF_INET6, 64, 0, 0, 7) + rtattr(IFA_ADDRESS, bytes(15) + b'\1')
+    assert _parse_address(memoryview(address6), 0, len(address6)) == (7, socket.AF_INET6, '::1', 64)
+
+
+def test_sysfs_reports_the_real_prefix():
+    assert ('127.0.0.1', 8) in loopback(read_sysfs()).ipv4
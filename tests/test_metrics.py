@@ -0,0 +1,67 @@
+from events import ERROR, PROGRESS, SENT, SUMMARY, TIMEOUT, event
+from metrics import EventMetrics, Registry
+
+
+def test_counters_and_histograms_are_exported():
+    registry = Registry()
+    sent = registry.counter('rawsock_packets_sent_total', '已发送报文数', protocol='ICMP')
+    assert registry.counter('rawsock_packets_sent_total', protocol='ICMP') is sent
+    sent.inc()
+    sent.inc(2)
+    rtt = registry.histogram('rawsock_rtt_seconds', 'RTT', buckets=(0.001, 0.01), protocol='ICMP')
+    for value in (0.0005, 0.002, 0.003, 0.5):
+        rtt.observe(value)
+    assert sent.value == 3
+    assert (rtt.count, rtt.counts()) == (4, [1, 2, 1])
+    assert rtt.quantile(0.5) == 0.01
+    text = registry.prometheus_text()
+    assert 'rawsock_packets_sent_total{protocol="ICMP"} 3' in text
+    assert 'rawsock_rtt_seconds_bucket{le="0.01",protocol="ICMP"} 3' in text
+    assert 'rawsock_rtt_seconds_bucket{le="+Inf",protocol="ICMP"} 4' in text
+
+
+def values(registry):
+    return {name: sum(entry['value'] for entry in entries)
+            for name, entries in registry.snapshot().items() if name.endswith('_total')}
+
+
+def test_progress_and_summary_fields_are_not_double_counted():
+    registry = Registry()
+    metrics = EventMetrics(registry)
+    metrics.record(event(PROGRESS, 'SCAN', 'net', packets=100, errors=1))
+    metrics.record(event(PROGRESS, 'SCAN', 'net', packets=250, errors=1))
+    metrics.record(event(SUMMARY, 'SCAN', 'net', sent=300, send_errors=2))
+    assert values(registry) == {'rawsock_packets_sent_total': 300, 'rawsock_errors_total': 2}
+
+
+def test_trace_timeouts_come_from_progress():
+    registry = Registry()
+    metrics = EventMetrics(registry)
+    metrics.record(event(PROGRESS, 'TRACE', '2 个目标', sent=30, errors=0, timeouts=4))
+    metrics.record(event(PROGRESS, 'TRACE', '2 个目标', sent=32, errors=0, timeouts=9))
+    assert values(registry) == {'rawsock_packets_sent_total': 32, 'rawsock_timeouts_total': 9}
+
+
+def test_timeout_events_are_not_counted_again_from_summary():
+    registry = Registry()
+    metrics = EventMetrics(registry)
+    metrics.record(event(TIMEOUT, 'CONNECT', '10.0.0.1', seq=0, port=80))
+    metrics.record(event(SUMMARY, 'CONNECT', '10.0.0.1', sent=1, send_errors=0, timeouts=1))
+    assert values(registry) == {'rawsock_packets_sent_total': 1, 'rawsock_timeouts_total': 1}
+
+
+def test_per_packet_sent_events_win_over_summary():
+    registry = Registry()
+    metrics = EventMetrics(registry)
+    metrics.record(event(SENT, 'ICMP', '10.0.0.1', seq=1))
+    metrics.record(event(SUMMARY, 'ICMP', '10.0.0.1', sent=1, received=0))
+    assert values(registry) == {'rawsock_packets_sent_total': 1}
+
+
+def test_errors_are_labelled_by_kind():
+    registry = Registry()
+    metrics = EventMetrics(registry)
+    metrics.record(event(ERROR, 'SCAN', 'net', message='扫描失败: 权限不足'))
+    metrics.record(event(SUMMARY, 'SCAN', 'net', sent=10, send_errors=3))
+    errors = {entry['labels']['kind']: entry['value'] for entry in registry.snapshot()['rawsock_errors_total']}
+    assert errors == {'event': 1, 'send': 3}
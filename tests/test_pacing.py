@@ -0,0 +1,52 @@
+import pytest
+
+from pacing import Pacer
+
+
+def test_unlimited_never_waits():
+    pacer = Pacer(None)
+    for _ in range(100):
+        assert pacer.delay() == 0.0
+        pacer.take()
+    assert pacer.stats()['error'] is None
+
+
+def test_steady_rate_without_burst():
+    pacer = Pacer(100, burst=1)
+    pacer.take(now=0.0)
+    assert pacer.delay(now=0.0) == pytest.approx(0.01)
+    assert pacer.delay(now=0.01) == 0.0
+    pacer.take(now=0.01)
+    assert pacer.delay(now=0.015) == pytest.approx(0.005)
+
+
+def test_burst_after_idle_is_bounded():
+    pacer = Pacer(1000, burst=5)
+    pacer.take(now=0.0)
+    # 空闲很久之后最多连续放行 burst 个
+    now = 10.0
+    released = 0
+    while pacer.delay(now=now) == 0.0:
+        pacer.take(now=now)
+        released += 1
+    assert released == 5
+
+
+def test_batches_borrow_later_tokens():
+    pacer = Pacer(1000, burst=1)
+    pacer.take(10, now=0.0)
+    assert pacer.delay(now=0.0) == pytest.approx(0.010)
+
+
+def test_achieved_rate():
+    pacer = Pacer(1000, burst=1)
+    for i in range(101):
+        pacer.take(now=i / 1000)
+    stats = pacer.stats(now=0.1)
+    assert stats['achieved'] == pytest.approx(1000)
+    assert abs(stats['error']) < 1e-6
+
+
+def test_default_burst():
+    assert Pacer(100000).burst == 500
+    assert Pacer(10).burst == 1
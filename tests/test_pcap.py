@@ -0,0 +1,75 @@
+import os
+import socket
+
+import pytest
+
+import pcap
+from pcap import LINKTYPE_RAW, PcapWriter, read_capture
+from template import TCPSynTemplate
+
+PACKETS = [bytes(TCPSynTemplate('10.0.0.1', '10.0.0.2', 1000 + i, 80).build(i)) for i in range(5)] + [b'\x45' * 61]
+
+
+@pytest.mark.parametrize('fmt,ext', [('pcap', '.pcap'), ('pcapng', '.pcapng')])
+def test_round_trip(tmp_path, fmt, ext):
+    path = str(tmp_path / ('out' + ext))
+    with PcapWriter(path, format=fmt) as writer:
+        for i, packet in enumerate(PACKETS):
+            writer.write(packet, ts_ns=1_700_000_000_123_456_789 + i)
+    records = [(ts, linktype, bytes(packet), truncated) for ts, linktype, packet, truncated in read_capture(path)]
+    assert [r[2] for r in records] == PACKETS
+    assert [r[0] for r in records] == [1_700_000_000_123_456_789 + i for i in range(len(PACKETS))]
+    assert all(r[1] == LINKTYPE_RAW and not r[3] for r in records)
+
+
+def test_snaplen_truncates(tmp_path):
+    path = str(tmp_path / 'short.pcap')
+    with PcapWriter(path, snaplen=20) as writer:
+        writer.write(PACKETS[0], ts_ns=1)
+    [(_, _, packet, truncated)] = [(a, b, bytes(c), d) for a, b, c, d in read_capture(path)]
+    assert packet == PACKETS[0][:20]
+    assert truncated
+
+
+def test_rotation(tmp_path):
+    path = str(tmp_path / 'rot.pcap')
+    with PcapWriter(path, rotate_bytes=200, buffer_size=0) as writer:
+        for packet in PACKETS:
+            writer.write(packet, ts_ns=1)
+    assert len(writer.paths) > 1
+    assert all(os.path.exists(p) for p in writer.paths)
+    read_back = [bytes(packet) for p in writer.paths for _, _, packet, _ in read_capture(p)]
+    assert read_back == PACKETS
+
+
+def test_empty_file(tmp_path):
+    path = tmp_path / 'empty.pcap'
+    path.write_bytes(b'')
+    assert list(read_capture(str(path))) == []
+
+
+def test_record_resolves_hostname(tmp_path):
+    path = str(tmp_path / 'out.pcap')
+    with PcapWriter(path) as writer:
+        pcap.start_recording(writer)
+        try:
+            pcap.record(b'\x08\x00' + b'\x00' * 6, 'localhost', socket.IPPROTO_ICMP)
+        finally:
+            pcap.stop_recording()
+    [(_, _, packet, _)] = [(ts, lt, bytes(p), t) for ts, lt, p, t in read_capture(path)]
+    assert packet[16:20] == socket.inet_aton('127.0.0.1')
+    assert pcap.record_errors == 0
+
+
+def test_record_swallows_writer_errors():
+    class BrokenWriter:
+        def write(self, packet):
+            raise OSError('磁盘已满')
+
+    pcap.start_recording(BrokenWriter())
+    try:
+        pcap.record(PACKETS[0])
+        pcap.record(b'\x00' * 8, 'no-such-host.invalid', socket.IPPROTO_UDP)
+    finally:
+        pcap.stop_recording()
+    assert pcap.record_errors == 2
@@ -0,0 +1,35 @@
+import json
+
+import pytest
+
+import profiling
+
+
+def test_sample_is_a_no_op_without_a_tracer():
+    assert profiling.sample('ICMP') is None
+
+
+def test_stride_sampling_and_summary(tmp_path):
+    tracer = profiling.Tracer(sample_rate=0.25, max_spans=3)
+    profiling.start_tracing(tracer)
+    try:
+        for _ in range(8):
+            trace = profiling.sample('UDP')
+            if trace:
+                trace.mark('build')
+                trace.mark('sendto')
+    finally:
+        assert profiling.stop_tracing() is tracer
+    assert [span[:2] for span in tracer.spans] == [('UDP', 'build'), ('UDP', 'sendto'), ('UDP', 'build')]
+    assert tracer.dropped == 1
+    assert tracer.summary()['UDP']['build']['count'] == 2
+    path = tmp_path / 'trace.json'
+    tracer.write(str(path))
+    events = json.loads(path.read_text())['traceEvents']
+    assert [e['name'] for e in events] == ['build', 'sendto', 'build']
+    assert tracer.collapsed().splitlines()[0].startswith('UDP;build ')
+
+
+def test_sample_rate_must_be_a_fraction():
+    with pytest.raises(ValueError):
+        profiling.Tracer(sample_rate=0)
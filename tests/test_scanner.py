@@ -0,0 +1,50 @@
+import socket
+import time
+
+from conftest import raw_socket
+from events import PROGRESS, SUMMARY
+from scanner import CLOSED, OPEN, SynScanner, parse_ports, parse_targets, scan_events
+
+
+def test_parse_targets_expands_networks():
+    assert list(parse_targets('10.0.0.1, 10.0.1.0/30')) == [0x0A000001, 0x0A000101, 0x0A000102]
+    assert list(parse_targets(['10.0.0.9/32', ''])) == [0x0A000009]
+
+
+def test_parse_ports():
+    assert parse_ports('22, 80,8000-8002') == [22, 80, 8000, 8001, 8002]
+    assert parse_ports(443) == [443]
+    assert parse_ports(['53', 123]) == [53, 123]
+
+
+@raw_socket
+def test_scan_finds_listening_port():
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(8)
+    port = listener.getsockname()[1]
+    try:
+        result = SynScanner('127.0.0.1', '127.0.0.1', [port, port + 1], timeout=0.5).run()
+    finally:
+        listener.close()
+    assert result.ports_in_state(OPEN) == [('127.0.0.1', port)]
+    assert result.ports_in_state(CLOSED) == [('127.0.0.1', port + 1)]
+
+
+@raw_socket
+def test_closing_scan_events_stops_the_scan():
+    # 全端口、每秒1000个探测，不取消要发一分多钟
+    events = scan_events('127.0.0.1', '127.0.0.1', '1-65535', rate=1000, timeout=5, states=(OPEN, CLOSED))
+    next(events)
+    start = time.monotonic()
+    events.close()
+    assert time.monotonic() - start < 2
+
+
+@raw_socket
+def test_scan_reports_progress_while_sending():
+    events = list(scan_events('127.0.0.1', '127.0.0.1', '1-20', rate=50, timeout=0.2, report_interval=0.1))
+    progress = [e.info['packets'] for e in events if e.kind == PROGRESS]
+    assert len(progress) >= 2
+    assert progress == sorted(progress) and 0 < progress[-1] <= 20
+    assert events[-1].kind == SUMMARY
@@ -0,0 +1,107 @@
+import socket
+
+import pytest
+
+import profiling
+import sharded
+from conftest import raw_socket
+from events import ERROR, SUMMARY
+from syn_cookie import SynCookie
+
+
+def _failing_worker(worker, workers, counters, *args):
+    if worker == 1:
+        raise RuntimeError('工作进程出错')
+
+
+def _idle_worker(worker, workers, counters, *args):
+    pass
+
+
+def finish(pool):
+    for process in pool.processes:
+        process.join(5)
+    pool.stop()
+
+
+def _tracing_worker(worker, workers, counters, *args):
+    profiling.sample('TEST').mark('work')
+
+
+def test_address_space_skips_network_and_broadcast():
+    space = sharded.AddressSpace('10.0.0.5, 10.0.1.0/30, 10.0.2.0/31')
+    assert len(space) == 5
+    assert [space.address(i) for i in range(len(space))] == [0x0A000005, 0x0A000101, 0x0A000102,
+                                                             0x0A000200, 0x0A000201]
+
+
+@raw_socket
+def test_sweep_counts_loopback_replies():
+    events = list(sharded.sharded_sweep_events(['127.0.0.1', '127.0.0.2'], count=2, workers=2, timeout=0.5,
+                                               interval=0.01))
+    summary = events[-1]
+    assert summary.kind == SUMMARY
+    assert summary.info['sent'] == 4 and summary.info['received'] == 4
+
+
+def test_round_is_carried_in_the_sequence_number():
+    seq = SynCookie().seq
+    bits = sharded._round_bits(5)
+    assert bits == 3
+    tags = [sharded._sweep_seq(seq, 0x7F000001, round_no, bits) for round_no in range(5)]
+    assert [tag & 0b111 for tag in tags] == list(range(5))
+    assert len({tag >> bits for tag in tags}) == 1
+    with pytest.raises(ValueError):
+        sharded._round_bits(0x10001)
+
+
+def test_pool_reports_failed_workers():
+    pool = sharded._Pool(_failing_worker, 3, ())
+    finish(pool)
+    assert [index for index, _ in pool.failures()] == [1]
+    [error] = pool.errors('SCAN', '10.0.0.0/24')
+    assert error.kind == ERROR and '工作进程 1' in error.info['message']
+
+
+def test_pool_without_failures():
+    pool = sharded._Pool(_idle_worker, 2, ())
+    finish(pool)
+    assert pool.failures() == []
+
+
+def test_pool_collects_worker_spans():
+    tracer = profiling.Tracer()
+    profiling.start_tracing(tracer)
+    try:
+        finish(sharded._Pool(_tracing_worker, 2, ()))
+    finally:
+        profiling.stop_tracing()
+    assert [span[:2] for span in tracer.spans] == [('TEST', 'work')] * 2
+    assert len({span[2] for span in tracer.spans}) == 2
+
+
+@raw_socket
+def test_sweep_reports_failed_worker(monkeypatch):
+    monkeypatch.setattr(sharded, '_sweep_worker', _failing_worker)
+    events = list(sharded.sharded_sweep_events(['127.0.0.1'], workers=2, timeout=0.1))
+    assert [e.kind for e in events if e.kind == ERROR] == [ERROR]
+    assert events[-1].kind == SUMMARY
+
+
+@raw_socket
+def test_socket_is_closed_when_the_pool_fails_to_start(monkeypatch):
+    opened = []
+
+    class RecordingSocket(socket.socket):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            opened.append(self)
+
+    def failing_pool(*args):
+        raise OSError('无法创建工作进程')
+
+    monkeypatch.setattr(sharded.socket, 'socket', RecordingSocket)
+    monkeypatch.setattr(sharded, '_Pool', failing_pool)
+    with pytest.raises(OSError):
+        list(sharded.sharded_sweep_events(['127.0.0.1'], workers=1, timeout=0.1))
+    assert len(opened) == 1 and opened[0].fileno() == -1
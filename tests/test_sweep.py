@@ -0,0 +1,79 @@
+import threading
+import time
+
+import ICMP
+from conftest import raw_socket
+from events import ERROR, REPLY, SUMMARY
+from ICMP import ping_sweep, ping_sweep_events
+
+
+def run_briefly(func, limit=5):
+    """在线程中运行，超过 limit 秒未返回即视为卡住"""
+    result = []
+    thread = threading.Thread(target=lambda: result.append(func()), daemon=True)
+    thread.start()
+    thread.join(limit)
+    assert not thread.is_alive(), "调用没有在限定时间内返回"
+    return result[0]
+
+
+def test_empty_target_list_returns():
+    assert run_briefly(lambda: ping_sweep([], count=1, timeout=1)) == {}
+
+
+def test_unresolvable_target_reports_error():
+    events = run_briefly(lambda: list(ping_sweep_events(['no-such-host.invalid'], count=1, timeout=1)))
+    assert [e.kind for e in events] == [ERROR]
+
+
+@raw_socket
+def test_loopback_replies_are_matched():
+    stats = ping_sweep(['127.0.0.1', '127.0.0.2'], count=3, timeout=1, interval=0.01)
+    assert sorted(stats) == ['127.0.0.1', '127.0.0.2']
+    for host_stats in stats.values():
+        assert (host_stats.sent, host_stats.received) == (3, 3)
+        assert host_stats.min_rtt is not None
+
+
+@raw_socket
+def test_all_sends_failing_does_not_hang():
+    # 没有 SO_BROADCAST 时发往广播地址会被拒绝
+    events = run_briefly(lambda: list(ping_sweep_events(['255.255.255.255'], count=2, timeout=1, interval=0.01)))
+    assert [e.kind for e in events] == [ERROR, ERROR, SUMMARY]
+    assert events[-1].info['received'] == 0
+
+
+@raw_socket
+def test_hostname_targets_match_replies():
+    events = run_briefly(lambda: list(ping_sweep_events(['localhost'], count=2, timeout=1, interval=0.01)))
+    assert [e.kind for e in events].count(REPLY) == 2
+    assert events[-1].target == 'localhost'
+    assert events[-1].info['received'] == 2
+
+
+@raw_socket
+def test_ring_receive_path():
+    events = run_briefly(lambda: list(ping_sweep_events(['127.0.0.1'], count=3, timeout=1, interval=0.01,
+                                                        use_ring=True)))
+    replies = [e for e in events if e.kind == REPLY]
+    assert [e.seq for e in replies] == [0, 1, 2]
+    assert all(0 <= e.rtt < 1000 for e in replies)
+
+
+@raw_socket
+def test_rate_spaces_out_sends(monkeypatch):
+    sent = []
+    sendto = ICMP._sendto
+
+    def recording_sendto(sock, packet, address, timeout=0.05):
+        sent.append(time.perf_counter())
+        return sendto(sock, packet, address, timeout)
+
+    monkeypatch.setattr(ICMP, '_sendto', recording_sendto)
+    targets = [f'127.0.0.{i}' for i in range(1, 6)]
+    events = run_briefly(lambda: list(ping_sweep_events(targets, count=2, timeout=1, interval=0.01, rate=100,
+                                                        burst=1)))
+    assert [e.kind for e in events].count(REPLY) == 10
+    assert len(sent) == 10
+    # 每秒100个：相邻两次发送至少间隔10毫秒，包括两轮之间
+    assert min(b - a for a, b in zip(sent, sent[1:])) >= 0.0095
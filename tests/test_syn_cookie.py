@@ -0,0 +1,36 @@
+from syn_cookie import PORT_RANGE, SynCookie
+
+SADDR = 0xC0000201
+DADDR = 0xC6336407
+
+
+def test_probe_passes_check():
+    cookie = SynCookie()
+    seq, sport = cookie.probe(SADDR, DADDR, 443)
+    assert PORT_RANGE[0] <= sport <= PORT_RANGE[1]
+    assert cookie.check(SADDR, DADDR, 443, sport, (seq + 1) & 0xFFFFFFFF)
+
+
+def test_wrong_ack_port_or_key_fails():
+    cookie = SynCookie()
+    seq, sport = cookie.probe(SADDR, DADDR, 443)
+    ack = (seq + 1) & 0xFFFFFFFF
+    assert not cookie.check(SADDR, DADDR, 443, sport, seq)
+    assert not cookie.check(SADDR, DADDR, 80, sport, ack)
+    assert not cookie.check(SADDR, DADDR + 1, 443, sport, ack)
+    assert not cookie.check(SADDR, DADDR, 443, sport + 1 if sport < PORT_RANGE[1] else sport - 1, ack)
+    assert not SynCookie().check(SADDR, DADDR, 443, sport, ack)
+
+
+def test_same_key_same_values():
+    a = SynCookie()
+    b = SynCookie(a.key)
+    assert a.probe(SADDR, DADDR, 22) == b.probe(SADDR, DADDR, 22)
+
+
+def test_fixed_port():
+    cookie = SynCookie()
+    seq = cookie.seq(SADDR, DADDR, 80)
+    assert cookie.check(SADDR, DADDR, 80, 5000, seq + 1, fixed_port=5000)
+    assert not cookie.check(SADDR, DADDR, 80, 5001, seq + 1, fixed_port=5000)
+
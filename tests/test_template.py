@@ -0,0 +1,68 @@
+import socket
+
+import pytest
+
+from checksum import calculate_checksum, transport_checksum
+from ICMP import ICMP_HEADER, ICMP_PAYLOAD
+from IP import IP_HEADER, build_ip_header, ip_to_int
+from TCP import TCP_FLAG_SYN, TCP_HEADER, TCP_OPTIONS, TCP_WINDOW, calculate_tcp_checksum
+from template import IP_LEN, ICMPEchoTemplate, TCPSynTemplate, UDPTemplate
+from UDP import UDP_HEADER, calculate_udp_checksum
+
+SRC = '192.0.2.1'
+DST = '198.51.100.7'
+
+
+def legacy_tcp_syn(src, dst, sport, dport, seq, ip_id):
+    """与 TCP.tcp_syn_events 相同的逐字段构建方式"""
+    offset = (TCP_HEADER.size + len(TCP_OPTIONS)) // 4
+    header = bytearray(TCP_HEADER.pack(sport, dport, seq, 0, (offset << 12) | TCP_FLAG_SYN, TCP_WINDOW, 0, 0)
+                       + TCP_OPTIONS)
+    header[16:18] = calculate_tcp_checksum(src, dst, header).to_bytes(2, 'big')
+    return build_ip_header(src, dst, socket.IPPROTO_TCP, len(header), ip_id=ip_id) + bytes(header)
+
+
+@pytest.mark.parametrize('dst,sport,dport,seq,ip_id', [
+    (DST, 40000, 80, 0, 1),
+    ('10.255.255.254', 65535, 1, 0xFFFFFFFF, 0xFFFF),
+    ('1.2.3.4', 32768, 443, 0x12345678, 4242),
+])
+def test_tcp_syn_matches_legacy_builder(dst, sport, dport, seq, ip_id):
+    template = TCPSynTemplate(SRC, '0.0.0.0', 0, 0)
+    packet = template.build(seq, src_port=sport, dst_port=dport, daddr=ip_to_int(dst), ip_id=ip_id)
+    assert bytes(packet) == legacy_tcp_syn(SRC, dst, sport, dport, seq, ip_id)
+
+
+def test_template_reuse_overwrites_fields():
+    template = TCPSynTemplate(SRC, DST, 1000, 2000)
+    template.build(1, ip_id=7)
+    packet = bytes(template.build(99, dst_port=22, daddr=ip_to_int('10.0.0.9'), ip_id=8))
+    assert packet == legacy_tcp_syn(SRC, '10.0.0.9', 1000, 22, 99, 8)
+
+
+def test_udp_matches_legacy_checksum():
+    payload = b'Hello UDP!'
+    template = UDPTemplate(SRC, DST, 5353, 53, payload)
+    packet = bytes(template.build(ip_id=5))
+    segment = bytearray(UDP_HEADER.pack(5353, 53, UDP_HEADER.size + len(payload), 0) + payload)
+    segment[6:8] = calculate_udp_checksum(SRC, DST, segment).to_bytes(2, 'big')
+    assert packet == build_ip_header(SRC, DST, socket.IPPROTO_UDP, len(segment), ip_id=5) + bytes(segment)
+
+
+@pytest.mark.parametrize('seq', [0, 1, 0xFFFF])
+def test_icmp_echo_checksums(seq):
+    template = ICMPEchoTemplate(SRC, DST, 0x1234)
+    packet = bytes(template.build(seq, ip_id=9))
+    expected = bytearray(ICMP_HEADER.pack(8, 0, 0, 0x1234, seq) + ICMP_PAYLOAD)
+    expected[2:4] = calculate_checksum(expected).to_bytes(2, 'big')
+    assert packet[IP_LEN:] == bytes(expected)
+    assert calculate_checksum(packet[:IP_LEN]) == 0
+
+
+def test_headers_verify():
+    template = TCPSynTemplate(SRC, DST, 1, 2)
+    packet = bytes(template.build(123456))
+    fields = IP_HEADER.unpack_from(packet)
+    assert fields[2] == len(packet)
+    assert calculate_checksum(packet[:IP_LEN]) == 0
+    assert transport_checksum(fields[8], fields[9], socket.IPPROTO_TCP, packet[IP_LEN:]) == 0
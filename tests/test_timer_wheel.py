@@ -0,0 +1,45 @@
+from timer_wheel import TimerWheel
+
+
+def test_expires_in_order_of_ticks():
+    wheel = TimerWheel(tick=0.01, slots=8, now=0)
+    wheel.add('a', 0.05, now=0)
+    wheel.add('b', 0.02, now=0)
+    assert len(wheel) == 2
+    assert wheel.advance(now=0.015) == []
+    assert wheel.advance(now=0.025) == ['b']
+    assert wheel.advance(now=0.06) == ['a']
+    assert len(wheel) == 0
+
+
+def test_cancel_and_reschedule():
+    wheel = TimerWheel(tick=0.01, slots=8, now=0)
+    wheel.add('a', 0.02, now=0)
+    wheel.add('b', 0.02, now=0)
+    assert wheel.cancel('a')
+    assert not wheel.cancel('a')
+    # 重复注册覆盖之前的定时器
+    wheel.add('b', 0.05, now=0)
+    assert wheel.advance(now=0.03) == []
+    assert wheel.advance(now=0.06) == ['b']
+
+
+def test_timers_longer_than_one_revolution():
+    wheel = TimerWheel(tick=0.01, slots=4, now=0)
+    wheel.add('far', 0.1, now=0)
+    assert wheel.advance(now=0.05) == []
+    assert wheel.advance(now=0.11) == ['far']
+
+
+def test_large_jump_expires_everything():
+    wheel = TimerWheel(tick=0.01, slots=4, now=0)
+    for i in range(10):
+        wheel.add(i, 0.01 * (i + 1), now=0)
+    assert sorted(wheel.advance(now=100)) == list(range(10))
+
+
+def test_next_timeout():
+    wheel = TimerWheel(tick=0.01, slots=8, now=0)
+    assert wheel.next_timeout(now=0) is None
+    wheel.add('a', 0.05, now=0)
+    assert 0 <= wheel.next_timeout(now=0.001) <= 0.01
@@ -0,0 +1,42 @@
+import socket
+
+from timing import ProbeTimings, enable_kernel_timestamps, format_summary, now_ns, percentile, recv_with_timestamp
+
+
+def test_percentile_nearest_rank():
+    values = list(range(1, 11))
+    assert percentile(values, 50) == 5
+    assert percentile(values, 90) == 9
+    assert percentile(values, 99) == 10
+    assert percentile([], 50) is None
+
+
+def test_probe_timings_summary():
+    timings = ProbeTimings()
+    for rtt_ms in (3, 1, 2):
+        index = timings.start(0)
+        timings.finish(index, rtt_ms * 1_000_000)
+    timings.start(0)
+    # 重复的回复不覆盖第一次的RTT
+    assert timings.finish(0, 9_000_000) == 3_000_000
+    summary = timings.summary()
+    assert (summary['sent'], summary['received']) == (4, 3)
+    assert (summary['min'], summary['avg'], summary['max'], summary['p50']) == (1.0, 2.0, 3.0, 2.0)
+    assert 'p99 = 3.000ms' in format_summary(summary)
+    assert format_summary(ProbeTimings().summary()) == '无回复'
+
+
+def test_kernel_timestamp_is_on_the_monotonic_clock():
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        receiver.bind(('127.0.0.1', 0))
+        assert enable_kernel_timestamps(receiver)
+        before = now_ns()
+        sender.sendto(b'x', receiver.getsockname())
+        length, addr, recv_ns = recv_with_timestamp(receiver, bytearray(16))
+        assert length == 1 and addr[1] == sender.getsockname()[1]
+        assert before - 1_000_000 <= recv_ns <= now_ns()
+    finally:
+        receiver.close()
+        sender.close()
@@ -0,0 +1,27 @@
+from conftest import raw_socket
+from events import PROGRESS, REPLY, SUMMARY
+from traceroute import HopCache, trace_events
+
+
+def test_hop_cache_keeps_the_shorter_path_per_prefix(tmp_path):
+    cache = HopCache(prefix_len=24)
+    cache.put('10.1.2.3', 5, {1: '192.168.0.1', 2: '10.0.0.1', 5: '10.1.2.3'})
+    cache.put('10.1.2.200', 7, {1: '192.168.0.1'})
+    assert cache.get('10.1.2.99') == (5, {1: '192.168.0.1', 2: '10.0.0.1'})
+    assert cache.get('10.1.3.1') is None
+    path = tmp_path / 'hops.json'
+    cache.save(str(path))
+    loaded = HopCache.load(str(path))
+    assert len(loaded) == 1 and loaded.get('10.1.2.1') == cache.get('10.1.2.1')
+    assert len(HopCache.load(str(tmp_path / 'missing.json'))) == 0
+
+
+@raw_socket
+def test_replies_beyond_the_path_end_are_not_reported():
+    # 环回地址对每个 TTL 都回复端口不可达，第一轮打乱后更远的跳可能先到
+    for _ in range(5):
+        events = [e for e in trace_events('127.0.0.1', ['127.0.0.1'], max_ttl=10, timeout=0.5)
+                  if e.kind != PROGRESS]
+        assert [e.kind for e in events] == [REPLY, SUMMARY]
+        assert events[0].seq == 1 and events[0].info['reached']
+        assert events[1].info['distance'] == 1
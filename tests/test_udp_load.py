@@ -0,0 +1,49 @@
+from events import SUMMARY
+from timing import LATENCY_BUCKETS
+from udp_load import SEQ_WINDOW, LoadReceiverStats
+
+
+def record(stats, *seqs):
+    for seq in seqs:
+        stats.record(seq, 0, 0, 64)
+
+
+def test_duplicates_and_reordering():
+    stats = LoadReceiverStats(1)
+    record(stats, 0, 2, 1, 2, 3, 0)
+    assert (stats.received, stats.duplicates, stats.reordered, stats.lost) == (4, 2, 1, 0)
+
+
+def test_huge_sequence_number_does_not_grow_memory():
+    stats = LoadReceiverStats(1)
+    record(stats, 0, 2 ** 63, 2 ** 63)
+    assert len(stats._seen) == SEQ_WINDOW
+    assert stats.received == 2 and stats.duplicates == 1
+
+
+def test_sequence_behind_the_window_is_dropped():
+    stats = LoadReceiverStats(1)
+    record(stats, 5, 5 + SEQ_WINDOW, 5, 6 + SEQ_WINDOW // 2, 6 + SEQ_WINDOW // 2)
+    assert stats.out_of_window == 1
+    assert stats.duplicates == 1
+    assert stats.received == 3
+
+
+def test_window_wraps_without_false_duplicates():
+    stats = LoadReceiverStats(1)
+    record(stats, *range(3 * SEQ_WINDOW + 10))
+    assert stats.duplicates == 0 and stats.lost == 0
+
+
+
+def test_latency_is_bucketed_in_fixed_memory():
+    stats = LoadReceiverStats(1)
+    for seq in range(1000):
+        # 单向时延 1..1000 微秒；时钟偏差造成的负值按0计
+        stats.record(seq, 0, (seq + 1) * 1000, 64)
+    stats.record(1000, 5000, 0, 64)
+    assert len(stats.latency.counts) == len(LATENCY_BUCKETS) + 1
+    latency = stats.as_event(SUMMARY, '0.0.0.0', 9).info['latency']
+    assert (latency['received'], latency['min'], latency['max']) == (1001, 0.0, 1.0)
+    assert 0.5 <= latency['p50'] <= 0.5 * 2 ** 0.25
+    assert 0.99 <= latency['p99'] <= 1.0
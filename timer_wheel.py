@@ -0,0 +1,68 @@
+"""
+时间轮：大量超时定时器的 O(1) 插入/取消和批量到期
+
+每个槽对应一个 tick，定时器按到期 tick 放进对应的槽，超过一圈的定时器在槽里等待后续轮次。
+advance() 只扫描从上次推进到现在经过的槽，而不是逐个检查所有定时器。
+"""
+import time
+
+
+class TimerWheel:
+    def __init__(self, tick=0.01, slots=512, now=None):
+        self.tick = tick
+        self.slots = [[] for _ in range(slots)]
+        self._deadlines = {}  # key -> 到期 tick，用于取消（惰性删除）
+        self._current = self._tick_of(time.monotonic() if now is None else now)
+
+    def _tick_of(self, when):
+        return int(when / self.tick)
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def add(self, key, delay, now=None):
+        """注册一个 delay 秒后到期的定时器，同一个 key 重复注册会覆盖之前的定时器"""
+        now = time.monotonic() if now is None else now
+        # 至少落在下一个 tick，避免插入到已经扫描过的槽
+        expire = max(self._tick_of(now + delay), self._current + 1)
+        self._deadlines[key] = expire
+        self.slots[expire % len(self.slots)].append((expire, key))
+
+    def cancel(self, key):
+        """取消定时器，槽里的条目在到期扫描时被丢弃"""
+        return self._deadlines.pop(key, None) is not None
+
+    def next_timeout(self, now=None):
+        """距离下一个 tick 的秒数，没有定时器时返回 None，可直接作为 select/poll 的超时"""
+        if not self._deadlines:
+            return None
+        now = time.monotonic() if now is None else now
+        return max(0.0, (self._current + 1) * self.tick - now)
+
+    def advance(self, now=None):
+        """推进到当前时间，返回所有已到期（且未被取消）的 key"""
+        now = time.monotonic() if now is None else now
+        target = self._tick_of(now)
+        expired = []
+        if not self._deadlines:
+            self._current = target
+            return expired
+
+        slots = self.slots
+        deadlines = self._deadlines
+        # 落后超过一圈时每个槽只需扫描一次
+        start = max(self._current + 1, target - len(slots) + 1)
+        for tick in range(start, target + 1):
+            slot = slots[tick % len(slots)]
+            if not slot:
+                continue
+            remaining = []
+            for expire, key in slot:
+                if expire > target:
+                    remaining.append((expire, key))
+                elif deadlines.get(key) == expire:
+                    del deadlines[key]
+                    expired.append(key)
+            slot[:] = remaining
+        self._current = target
+        return expired
@@ -0,0 +1,171 @@
+"""
+探测计时
+
+发送时间用单调时钟 time.perf_counter_ns 记录；接收时间优先使用内核打上的 SO_TIMESTAMPNS 时间戳，
+它是报文到达内核的时刻，不包含在套接字队列里等待和Python调度的时间。
+内核时间戳是 CLOCK_REALTIME，读取时用同一时刻的 (perf_counter_ns - time_ns) 差值换算到单调时钟，
+所以即使系统时间被调整，RTT 也只受几微秒的换算误差影响。
+
+每个探测的发送时间和RTT存放在两个 array('q') 中，按探测序号索引，
+写入只是追加/按下标赋值，不需要加锁。
+不需要逐个探测记录、样本数又没有上限的场合（如UDP接收端的单向时延）用 LatencyHistogram 分桶统计。
+"""
+import math
+import socket
+import struct
+import time
+from array import array
+from bisect import bisect_left
+
+SO_TIMESTAMPNS = getattr(socket, 'SO_TIMESTAMPNS', 35)
+SCM_TIMESTAMPNS = SO_TIMESTAMPNS
+_TIMESPEC = struct.Struct('qq')
+_ANCILLARY_SIZE = socket.CMSG_SPACE(_TIMESPEC.size)
+# LatencyHistogram 的桶上界（纳秒）：1微秒到约68秒，每翻一倍分4个桶
+LATENCY_BUCKETS = tuple(round(1000 * 2 ** (i / 4)) for i in range(105))
+
+now_ns = time.perf_counter_ns
+
+
+def enable_kernel_timestamps(sock):
+    """让内核为收到的报文附加纳秒时间戳，不支持时返回 False"""
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMPNS, 1)
+    except OSError:
+        return False
+    return True
+
+
+def recv_with_timestamp(sock, buffer, realtime=False):
+    """
+    接收一个报文到 buffer，返回 (长度, 地址, 接收时间ns)
+    接收时间已换算到 perf_counter_ns 的时钟；没有内核时间戳时取当前时间
+    realtime 为 True 时返回系统时间（time.time_ns 的时钟），用于和对端写入报文的时间比较（单向时延）
+    """
+    length, ancdata, _, addr = sock.recvmsg_into([buffer], _ANCILLARY_SIZE)
+    recv_ns = time.time_ns() if realtime else now_ns()
+    for level, kind, data in ancdata:
+        if level == socket.SOL_SOCKET and kind == SCM_TIMESTAMPNS and len(data) >= _TIMESPEC.size:
+            sec, nsec = _TIMESPEC.unpack_from(data)
+            kernel_ns = sec * 1_000_000_000 + nsec
+            if realtime:
+                return length, addr, kernel_ns
+            return length, addr, kernel_ns + (recv_ns - time.time_ns())
+    return length, addr, recv_ns
+
+
+def percentile(sorted_values, p):
+    """最近秩法求百分位，sorted_values 需已排序"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class ProbeTimings:
+    """
+    按探测序号记录发送时间和RTT（纳秒）
+    start() 返回序号，finish(序号) 计算RTT；未收到回复的探测RTT为 -1
+    """
+    __slots__ = ('sent_ns', 'rtt_ns')
+
+    def __init__(self):
+        self.sent_ns = array('q')
+        self.rtt_ns = array('q')
+
+    def __len__(self):
+        return len(self.sent_ns)
+
+    def start(self, sent_ns=None):
+        self.sent_ns.append(now_ns() if sent_ns is None else sent_ns)
+        self.rtt_ns.append(-1)
+        return len(self.sent_ns) - 1
+
+    def finish(self, index, recv_ns=None):
+        """记录回复时间，返回RTT（纳秒）；重复的回复不覆盖第一次的结果"""
+        if self.rtt_ns[index] >= 0:
+            return self.rtt_ns[index]
+        rtt = max(0, (now_ns() if recv_ns is None else recv_ns) - self.sent_ns[index])
+        self.rtt_ns[index] = rtt
+        return rtt
+
+    def rtts(self):
+        """所有已完成探测的RTT（纳秒）"""
+        return [rtt for rtt in self.rtt_ns if rtt >= 0]
+
+    def summary(self):
+        """统计摘要，时间单位为毫秒"""
+        values = sorted(self.rtts())
+        result = {'sent': len(self.sent_ns), 'received': len(values)}
+        if values:
+            result.update(
+                min=values[0] / 1e6,
+                avg=sum(values) / len(values) / 1e6,
+                max=values[-1] / 1e6,
+                p50=percentile(values, 50) / 1e6,
+                p90=percentile(values, 90) / 1e6,
+                p99=percentile(values, 99) / 1e6,
+            )
+        return result
+
+
+class LatencyHistogram:
+    """
+    固定分桶的时延统计（纳秒），内存不随样本数增长
+    分位数取所在桶的上界（不超过最大值），相对误差不超过约19%；最小、最大和平均值是精确的
+    """
+    __slots__ = ('counts', 'count', 'total', 'min', 'max')
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)  # 最后一项为超过最大上界的样本
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def __len__(self):
+        return self.count
+
+    def add(self, value_ns):
+        self.counts[bisect_left(LATENCY_BUCKETS, value_ns)] += 1
+        self.count += 1
+        self.total += value_ns
+        if self.min is None or value_ns < self.min:
+            self.min = value_ns
+        if self.max is None or value_ns > self.max:
+            self.max = value_ns
+
+    def percentile(self, p):
+        """与 percentile() 相同的最近秩，只遍历桶计数，不排序"""
+        if not self.count:
+            return None
+        rank = max(1, math.ceil(p / 100 * self.count))
+        running = 0
+        for index, count in enumerate(self.counts):
+            running += count
+            if running >= rank:
+                break
+        bound = LATENCY_BUCKETS[index] if index < len(LATENCY_BUCKETS) else self.max
+        return min(bound, self.max)
+
+    def summary(self):
+        """格式同 ProbeTimings.summary()，时间单位为毫秒"""
+        result = {'sent': self.count, 'received': self.count}
+        if self.count:
+            result.update(
+                min=self.min / 1e6,
+                avg=self.total / self.count / 1e6,
+                max=self.max / 1e6,
+                p50=self.percentile(50) / 1e6,
+                p90=self.percentile(90) / 1e6,
+                p99=self.percentile(99) / 1e6,
+            )
+        return result
+
+
+def format_summary(summary):
+    """把 summary() 格式化为一行文本"""
+    if not summary.get('received'):
+        return "无回复"
+    return (f"最短 = {summary['min']:.3f}ms，最长 = {summary['max']:.3f}ms，平均 = {summary['avg']:.3f}ms，"
+            f"p50 = {summary['p50']:.3f}ms，p90 = {summary['p90']:.3f}ms，p99 = {summary['p99']:.3f}ms")
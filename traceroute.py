@@ -0,0 +1,373 @@
+"""
+并行路由追踪
+
+传统 traceroute 逐跳发送、逐跳等待，每个目标要几十秒，上千个目标要几个小时。
+这里对所有目标、所有 TTL 同时发探测（顺序随机打乱，避免短时间内集中打到同一台路由器），
+回来的 ICMP 超时/不可达报文按其中引用的原始IP头匹配到探测：
+内层目的地址 + IP标识（由 TTL 得出）唯一确定一个探测，报文本身不需要携带任何状态。
+一个目标的源端口、目的端口和负载在所有 TTL 上都相同，经过按五元组分流的负载均衡时各跳走同一条路径（Paris traceroute 的做法）。
+
+每个目标先探测前 span 跳，没到达且最近几跳还有回复时再探测后面的跳。
+发现的路径按目标网段（默认 /24）缓存在 HopCache 中：同一网段的其余目标直接复用到达目标前两跳为止的路径，
+只从倒数第二跳开始探测；同一次运行中同网段的目标会先等第一个目标完成再开始。
+"""
+import json
+import os
+import random
+import select
+import socket
+import time
+from collections import deque
+
+from bpf import attach_filter, icmp_error_filter
+import metrics
+from events import PROGRESS, REPLY, SUMMARY, event
+from ICMP import ICMP_DEST_UNREACHABLE, ICMP_HEADER, ICMP_TIME_EXCEEDED
+from IP import build_ip_header, ip_to_int
+from pacing import Pacer
+from syn_cookie import PORT_RANGE
+from timer_wheel import TimerWheel
+from timing import ProbeTimings, enable_kernel_timestamps, recv_with_timestamp
+from UDP import UDP_HEADER, calculate_udp_checksum
+
+TRACE_PORT = 33434  # 传统 traceroute 的起始目的端口
+TRACE_PAYLOAD = b'\x00' * 32  # 报文总长60字节，与 traceroute 默认相同
+MAX_TTL = 30
+SPAN = 16  # 每轮探测的跳数
+GAP_LIMIT = 5  # 连续这么多跳没有回复时停止
+PREFIX_LEN = 24
+SEND_BATCH = 256
+
+_CACHE_HITS = metrics.counter('rawsock_cache_hits_total', '缓存命中次数', cache='hop')
+_CACHE_MISSES = metrics.counter('rawsock_cache_misses_total', '缓存未命中次数', cache='hop')
+
+
+class HopCache:
+    """
+    按网段缓存路径：网段 -> (到达目标的跳数, {TTL: 路由器地址})
+    只缓存到达了目标的路径；save/load 以 JSON 保存，供之后的运行复用
+    """
+
+    def __init__(self, prefix_len=PREFIX_LEN):
+        self.prefix_len = prefix_len
+        self._entries = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def prefix(self, daddr):
+        shift = 32 - self.prefix_len
+        return (ip_to_int(daddr) >> shift) << shift
+
+    def get(self, daddr):
+        """返回 (跳数, {TTL: 地址})，没有缓存时返回 None"""
+        entry = self._entries.get(self.prefix(daddr))
+        (_CACHE_MISSES if entry is None else _CACHE_HITS).inc()
+        return entry
+
+    def put(self, daddr, distance, hops):
+        """
+        hops 为 {TTL: 地址}，只保留目标之前的路由器
+        最近几跳的回复被限速丢掉时测得的跳数会偏大，同一网段已有更短的路径时保留较短的
+        """
+        prefix = self.prefix(daddr)
+        entry = self._entries.get(prefix)
+        if entry is not None and entry[0] < distance:
+            return
+        self._entries[prefix] = (distance, {ttl: addr for ttl, addr in hops.items() if ttl < distance})
+
+    def save(self, path):
+        entries = {socket.inet_ntoa(prefix.to_bytes(4, 'big')): {'distance': distance, 'hops': hops}
+                   for prefix, (distance, hops) in self._entries.items()}
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'prefix_len': self.prefix_len, 'prefixes': entries}, f, indent=1, sort_keys=True)
+
+    @classmethod
+    def load(cls, path, prefix_len=PREFIX_LEN):
+        """读取 save() 写出的文件，文件不存在时返回空缓存"""
+        if not os.path.exists(path):
+            return cls(prefix_len)
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        cache = cls(data.get('prefix_len', prefix_len))
+        for prefix, entry in data.get('prefixes', {}).items():
+            cache._entries[ip_to_int(prefix)] = (entry['distance'],
+                                                 {int(ttl): addr for ttl, addr in entry['hops'].items()})
+        return cache
+
+
+class Trace:
+    """一个目标的追踪状态"""
+    __slots__ = ('target', 'daddr', 'segment', 'hops', 'replies', 'cached', 'end', 'reached', 'next_ttl',
+                 'outstanding', 'probes', 'start')
+
+    def __init__(self, target, daddr, segment):
+        self.target = target
+        self.daddr = daddr
+        self.segment = segment  # UDP头+负载，所有 TTL 共用
+        self.hops = {}  # TTL -> (地址, RTT毫秒)，缓存的跳 RTT 为 None
+        self.replies = {}  # TTL -> 回复事件，目标完成后按 TTL 顺序产生
+        self.cached = 0
+        self.end = None  # 收到目标不可达（来自目标本身或路由器）的最小 TTL，更远的跳不再探测
+        self.reached = False  # end 处回复的是目标本身
+        self.next_ttl = 1
+        self.outstanding = 0  # 已排队或在途的探测数
+        self.probes = 0
+        self.start = time.perf_counter()
+
+
+class Tracer:
+    """
+    并行路由追踪器
+    rate 为每秒发送的探测数上限（None 不限速），burst 为令牌桶容量；cache 为 HopCache，None 时不复用路径
+    """
+
+    def __init__(self, src_ip, max_ttl=MAX_TTL, timeout=2, rate=None, cache=None, dst_port=TRACE_PORT, span=SPAN,
+                 burst=None):
+        self.src_ip = src_ip
+        self.max_ttl = max_ttl
+        self.timeout = timeout
+        self.rate = rate
+        self.pacer = Pacer(rate, burst)
+        self.cache = cache
+        self.dst_port = dst_port
+        self.span = span
+        self.src_port = random.randint(*PORT_RANGE)
+        self.timings = ProbeTimings()
+        self.sent = 0
+        self.send_errors = 0
+        self.timeouts = 0  # 超时的探测数，探测超时不单独产生事件
+        # IP标识 = 基数 + TTL，只用于区分同一目标的探测，随机基数让上一次运行迟到的回复匹配不上
+        self._id_base = random.getrandbits(16)
+        self._queue = deque()  # 待发送的 (Trace, TTL)
+        self._in_flight = {}  # (目的地址, IP标识) -> (Trace, TTL, 探测序号)
+        self._exploring = {}  # 网段 -> 等待该网段第一个目标完成的 Trace 列表
+        self._wheel = TimerWheel(tick=0.01)
+        self._done = []
+
+    def _ip_id(self, ttl):
+        return (self._id_base + ttl) % 0xFFFF + 1
+
+    def _segment(self, target):
+        segment = bytearray(UDP_HEADER.pack(self.src_port, self.dst_port, UDP_HEADER.size + len(TRACE_PAYLOAD), 0)
+                            + TRACE_PAYLOAD)
+        segment[6:8] = calculate_udp_checksum(self.src_ip, target, segment).to_bytes(2, 'big')
+        return bytes(segment)
+
+    def _enqueue(self, trace, last_ttl):
+        for ttl in range(trace.next_ttl, min(last_ttl, self.max_ttl) + 1):
+            self._queue.append((trace, ttl))
+            trace.outstanding += 1
+        trace.next_ttl = max(trace.next_ttl, min(last_ttl, self.max_ttl) + 1)
+
+    def _begin(self, trace, wait=True):
+        """按缓存决定第一轮探测的跳；同网段已有目标在探测时先等待（wait 为 False 时不等待）"""
+        cache = self.cache
+        entry = cache.get(trace.daddr) if cache is not None else None
+        if entry is None and cache is not None and wait:
+            prefix = cache.prefix(trace.daddr)
+            waiting = self._exploring.get(prefix)
+            if waiting is not None:
+                waiting.append(trace)
+                return
+            self._exploring[prefix] = []
+        if entry is not None:
+            distance, hops = entry
+            for ttl, addr in hops.items():
+                if ttl <= distance - 2:
+                    trace.hops[ttl] = (addr, None)
+            trace.cached = len(trace.hops)
+            trace.next_ttl = max(1, distance - 1)
+            self._enqueue(trace, distance + 1)
+        else:
+            self._enqueue(trace, self.span)
+        if not trace.outstanding:
+            self._settle(trace)
+
+    def _settle(self, trace):
+        """一个目标的探测都已回复或超时：继续探测后面的跳，或者结束"""
+        if trace.outstanding:
+            return
+        last_reply = max(trace.hops, default=0)
+        if trace.end is None and trace.next_ttl <= self.max_ttl and trace.next_ttl - 1 - last_reply < GAP_LIMIT:
+            self._enqueue(trace, trace.next_ttl + self.span - 1)
+            return
+        self._done.append(trace)
+        cache = self.cache
+        if cache is None:
+            return
+        if trace.reached:
+            cache.put(trace.daddr, trace.end, {ttl: hop[0] for ttl, hop in trace.hops.items()})
+        # 放行等待这个网段的目标，缓存命中的只探测最后几跳；没有到达时各自完整探测
+        for waiting in self._exploring.pop(cache.prefix(trace.daddr), ()):
+            self._begin(waiting, wait=False)
+
+    def _send(self, sock, trace, ttl):
+        ip_id = self._ip_id(ttl)
+        packet = build_ip_header(self.src_ip, trace.target, socket.IPPROTO_UDP, len(trace.segment),
+                                 ttl=ttl, ip_id=ip_id) + trace.segment
+        key = (trace.daddr, ip_id)
+        self._in_flight[key] = (trace, ttl, self.timings.start())
+        trace.probes += 1
+        try:
+            sock.sendto(packet, (trace.target, 0))
+            self.sent += 1
+        except OSError:
+            self.send_errors += 1
+        self._wheel.add(key, self.timeout)
+
+    def _handle(self, view, length, addr, recv_ns):
+        """按ICMP差错报文中引用的原始IP头找到探测，把回复记到所属目标上"""
+        ihl = (view[0] & 0x0F) * 4
+        inner = ihl + ICMP_HEADER.size
+        if length < inner + 20:
+            return
+        icmp_type, code = view[ihl], view[ihl + 1]
+        if icmp_type not in (ICMP_TIME_EXCEEDED, ICMP_DEST_UNREACHABLE):
+            return
+        inner_ihl = (view[inner] & 0x0F) * 4
+        if view[inner + 9] != socket.IPPROTO_UDP or length < inner + inner_ihl + 2:
+            return
+        if int.from_bytes(view[inner + inner_ihl:inner + inner_ihl + 2], 'big') != self.src_port:
+            return
+        key = (int.from_bytes(view[inner + 16:inner + 20], 'big'), int.from_bytes(view[inner + 4:inner + 6], 'big'))
+        probe = self._in_flight.pop(key, None)
+        if probe is None:
+            return
+        self._wheel.cancel(key)
+        trace, ttl, index = probe
+        rtt = self.timings.finish(index, recv_ns) / 1e6
+        hop = addr[0]
+        reached = icmp_type == ICMP_DEST_UNREACHABLE and hop == trace.target
+        # 回复可能乱序到达（第一轮打乱了顺序），路径在 TTL 最小的不可达处结束，之前记录的更远的跳作废，
+        # 所以回复事件先留在目标上，目标完成、终点确定后再产生
+        if icmp_type == ICMP_DEST_UNREACHABLE and (trace.end is None or ttl < trace.end):
+            trace.end = ttl
+            trace.reached = reached
+            for far in [t for t in trace.hops if t > ttl]:
+                del trace.hops[far]
+                trace.replies.pop(far, None)
+        if trace.end is None or ttl <= trace.end:
+            trace.hops[ttl] = (hop, rtt)
+            trace.replies[ttl] = event(REPLY, 'TRACE', trace.target, seq=ttl, rtt=rtt, hop=hop, reached=reached,
+                                       icmp_type=icmp_type, icmp_code=code)
+        trace.outstanding -= 1
+        self._settle(trace)
+
+    def _expire(self, key):
+        trace, _, _ = self._in_flight.pop(key)
+        self.timeouts += 1
+        trace.outstanding -= 1
+        self._settle(trace)
+
+    def _summary(self, trace):
+        last = trace.end or max(trace.hops, default=0)
+        hops = [[ttl, *trace.hops.get(ttl, (None, None))] for ttl in range(1, last + 1)]
+        return event(SUMMARY, 'TRACE', trace.target, hops=hops, distance=trace.end if trace.reached else None,
+                     reached=trace.reached, cached=trace.cached, probes=trace.probes,
+                     elapsed=time.perf_counter() - trace.start)
+
+    def _progress(self, label, elapsed):
+        return event(PROGRESS, 'TRACE', label, sent=self.sent, errors=self.send_errors, timeouts=self.timeouts,
+                     in_flight=len(self._in_flight), queued=len(self._queue), elapsed=elapsed)
+
+    def run(self, targets, label=None, report_interval=1.0):
+        """
+        每个目标完成时按 TTL 顺序产生其各跳的回复事件（只含路径终点及之前的跳），
+        然后产生其汇总事件（hops 为 [TTL, 地址, RTT] 列表，没有回复的跳地址为 None）；
+        给出 label 时每 report_interval 秒和结束时产生一个进度事件（累计的发送数和超时数）
+        """
+        send_sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_RAW)
+        send_sock.setsockopt(socket.IPPROTO_IP, socket.IP_HDRINCL, 1)
+        recv_sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP)
+        recv_sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        try:
+            attach_filter(recv_sock, icmp_error_filter(socket.IPPROTO_UDP, self.src_port))
+        except OSError:
+            pass
+        enable_kernel_timestamps(recv_sock)
+        recv_sock.setblocking(False)
+
+        seen = set()
+        for target in targets:
+            daddr = ip_to_int(target)
+            if daddr not in seen:
+                seen.add(daddr)
+                self._begin(Trace(target, daddr, self._segment(target)))
+        # 第一轮打乱顺序，把同一跳的探测分散开（路由器普遍限制ICMP差错报文的速率）
+        first = list(self._queue)
+        random.shuffle(first)
+        self._queue = queue = deque(first)
+
+        in_flight = self._in_flight
+        wheel = self._wheel
+        buffer = bytearray(2048)
+        view = memoryview(buffer)
+        pacer = self.pacer
+        start = time.perf_counter()
+        next_report = start + report_interval if label is not None else None
+        try:
+            while queue or in_flight:
+                wait = None
+                # 每次最多发 SEND_BATCH 个就去收一次回复，避免接收缓冲区溢出
+                for _ in range(SEND_BATCH):
+                    if not queue:
+                        break
+                    delay = pacer.delay()
+                    if delay:
+                        wait = delay
+                        break
+                    trace, ttl = queue.popleft()
+                    if trace.end is not None and ttl > trace.end:
+                        # 已经到达目标或不可达，更远的跳不用再发
+                        trace.outstanding -= 1
+                        self._settle(trace)
+                        continue
+                    pacer.take()
+                    self._send(send_sock, trace, ttl)
+
+                timeout = wheel.next_timeout()
+                if wait is not None:
+                    timeout = wait if timeout is None else min(timeout, wait)
+                if wait is None and (queue or not in_flight):
+                    # 还有没发完的探测，或者排队的探测全部跳过、已经没有在途探测
+                    timeout = 0
+                if next_report is not None:
+                    report_wait = max(0.0, next_report - time.perf_counter())
+                    timeout = report_wait if timeout is None else min(timeout, report_wait)
+                readable, _, _ = select.select([recv_sock], [], [], timeout)
+                if readable:
+                    while True:
+                        try:
+                            length, addr, recv_ns = recv_with_timestamp(recv_sock, buffer)
+                        except BlockingIOError:
+                            break
+                        self._handle(view, length, addr, recv_ns)
+
+                for key in wheel.advance():
+                    self._expire(key)
+                for trace in self._done:
+                    for ttl in sorted(trace.replies):
+                        yield trace.replies[ttl]
+                    trace.replies.clear()
+                    yield self._summary(trace)
+                self._done.clear()
+                if next_report is not None:
+                    now = time.perf_counter()
+                    if now >= next_report:
+                        next_report = now + report_interval
+                        yield self._progress(label, now - start)
+            if label is not None:
+                yield self._progress(label, time.perf_counter() - start)
+        finally:
+            send_sock.close()
+            recv_sock.close()
+
+
+def trace_events(src_ip, targets, max_ttl=MAX_TTL, timeout=2, rate=None, cache=None, dst_port=TRACE_PORT,
+                 burst=None, report_interval=1.0):
+    """对所有目标并行追踪路由，每个目标完成时产生其各跳的回复事件和汇总事件，另有定期的进度事件"""
+    tracer = Tracer(src_ip, max_ttl, timeout, rate, cache, dst_port, burst=burst)
+    targets = list(targets)
+    label = targets[0] if len(targets) == 1 else f'{len(targets)} 个目标'
+    yield from tracer.run(targets, label, report_interval)
@@ -0,0 +1,265 @@
+"""
+UDP 负载生成与接收统计
+
+发送端在一个长期存在的 IP_HDRINCL 套接字上用 UDPPayloadTemplate 逐包改写负载，
+校验和（含伪头部）由模板的部分和加上负载和得到，报文凑满一批后经 BatchSender（sendmmsg）发出；
+可以限定速率（令牌桶，见 pacing.Pacer，每批不超过桶容量），也可以不限速全力发送。
+
+负载有三种：
+    FixedPayload    固定内容
+    RandomPayload   随机内容（预先生成一组随机负载轮流使用，发送时不再调用随机数）
+    PatternPayload  以 LOAD_HEADER（魔数、会话号、序号、发送时间）开头，其余为固定填充
+
+接收端（普通UDP套接字）解析 PatternPayload 的头部，统计丢失、乱序、重复和单向时延。
+单向时延 = 内核接收时间戳 - 报文中的发送时间，两端都是系统时间，跨主机时需要两端时钟同步（NTP/PTP），
+时钟偏差造成的负值按0计。
+"""
+import os
+import random
+import socket
+import struct
+import time
+
+import profiling
+from batch_sender import BatchSender
+from checksum import ones_complement_sum
+from events import PROGRESS, START, SUMMARY, event
+from pacing import Pacer
+from template import UDPPayloadTemplate
+from timing import LatencyHistogram, enable_kernel_timestamps, recv_with_timestamp
+
+LOAD_MAGIC = b'RSLD'
+# 魔数、会话号、序号、发送时间（time.time_ns）
+LOAD_HEADER = struct.Struct('!4sLQQ')
+# 接收端识别重复的序号窗口：只记住最高序号往前这么多个序号，序号来自报文，不能按它分配内存
+SEQ_WINDOW = 1 << 17
+_FILL = bytes(range(256))
+
+
+def _filler(size):
+    return (_FILL * (size // len(_FILL) + 1))[:size]
+
+
+class FixedPayload:
+    """每个报文负载相同"""
+
+    def __init__(self, data=b'Hello UDP!'):
+        self.initial = bytes(data)
+        self._sum = ones_complement_sum(self.initial)
+
+    def fill(self, view, seq):
+        return self._sum
+
+
+class RandomPayload:
+    """随机负载：预先生成 pool 个随机负载及其反码和，按序号轮流写入"""
+
+    def __init__(self, size=64, pool=64):
+        self._pool = [os.urandom(size) for _ in range(pool)]
+        self._sums = [ones_complement_sum(data) for data in self._pool]
+        self.initial = self._pool[0]
+
+    def fill(self, view, seq):
+        index = seq % len(self._pool)
+        view[:] = self._pool[index]
+        return self._sums[index]
+
+
+class PatternPayload:
+    """带序号和发送时间的负载，接收端据此统计丢失、乱序和时延；size 至少为头部长度（24字节）"""
+
+    def __init__(self, size=64, session=None):
+        if size < LOAD_HEADER.size:
+            raise ValueError(f"负载长度至少为 {LOAD_HEADER.size} 字节")
+        self.session = random.getrandbits(32) if session is None else session
+        filler = _filler(size - LOAD_HEADER.size)
+        self.initial = LOAD_HEADER.pack(LOAD_MAGIC, self.session, 0, 0) + filler
+        # 头部长度为偶数，填充部分的和可以单独算好
+        self._filler_sum = ones_complement_sum(filler)
+        self._base = (ones_complement_sum(LOAD_MAGIC) + (self.session >> 16) + (self.session & 0xFFFF)
+                      + self._filler_sum)
+
+    def fill(self, view, seq):
+        sent_ns = time.time_ns()
+        LOAD_HEADER.pack_into(view, 0, LOAD_MAGIC, self.session, seq, sent_ns)
+        return (self._base + (seq >> 48) + ((seq >> 32) & 0xFFFF) + ((seq >> 16) & 0xFFFF) + (seq & 0xFFFF)
+                + (sent_ns >> 48) + ((sent_ns >> 32) & 0xFFFF) + ((sent_ns >> 16) & 0xFFFF) + (sent_ns & 0xFFFF))
+
+
+PAYLOADS = {'fixed': FixedPayload, 'random': RandomPayload, 'pattern': PatternPayload}
+
+
+def make_payload(kind='pattern', size=64):
+    if kind == 'fixed':
+        return FixedPayload(_filler(size))
+    return PAYLOADS[kind](size)
+
+
+def _load_event(kind, dst_ip, stats, elapsed, target_pps=None):
+    return event(kind, 'UDPLOAD', dst_ip, packets=stats.packets, bytes=stats.bytes, errors=stats.errors,
+                 batches=stats.batches, elapsed=elapsed, target_pps=target_pps,
+                 pps=stats.packets / elapsed if elapsed else 0.0,
+                 bps=stats.bytes * 8 / elapsed if elapsed else 0.0)
+
+
+def load_events(src_ip, dst_ip, dst_port, src_port=None, payload=None, rate=None, count=None, duration=10.0,
+                batch_size=64, report_interval=1.0, burst=None):
+    """
+    发送UDP负载，rate 为每秒包数（None 为不限速），burst 为令牌桶容量，count/duration 任一达到即停止
+    每 report_interval 秒产生一个进度事件，结束时产生汇总事件
+    """
+    payload = payload or PatternPayload()
+    src_port = int(src_port) if src_port else random.randint(32768, 60999)
+    template = UDPPayloadTemplate(src_ip, dst_ip, src_port, dst_port, payload)
+    sender = BatchSender(batch_size=batch_size, slot_size=len(template.buffer))
+    stats = sender.stats
+    add = sender.add
+    build = template.build
+    sample = profiling.sample
+    pacer = Pacer(rate, burst)
+    # 限速时每批不超过桶容量，低速率下逐包按节奏发出
+    full_batch = min(batch_size, pacer.burst) if rate else batch_size
+    yield event(START, 'UDPLOAD', dst_ip, dst_port=int(dst_port), src_port=src_port,
+                size=len(payload.initial), payload=type(payload).__name__, rate=rate)
+
+    seq = 0
+    start = time.perf_counter()
+    next_report = start + report_interval
+    try:
+        while True:
+            now = time.perf_counter()
+            elapsed = now - start
+            if (duration and elapsed >= duration) or (count is not None and seq >= count):
+                break
+            if now >= next_report:
+                next_report += report_interval
+                yield _load_event(PROGRESS, dst_ip, stats, elapsed, rate)
+            batch = full_batch if count is None else min(full_batch, count - seq)
+            pacer.wait(batch)
+            for _ in range(batch):
+                trace = sample('UDPLOAD')
+                packet = build(seq)
+                if trace:
+                    trace.mark('build')
+                add(packet)
+                if trace:
+                    trace.mark('queue')
+                seq += 1
+            sender.flush()
+    finally:
+        sender.flush()
+        sender.close()
+    elapsed = time.perf_counter() - start
+    stats.elapsed = elapsed
+    yield _load_event(SUMMARY, dst_ip, stats, elapsed, rate)
+
+
+class LoadReceiverStats:
+    """一个发送会话的接收统计"""
+
+    def __init__(self, session):
+        self.session = session
+        self.received = 0
+        self.bytes = 0
+        self.duplicates = 0
+        self.reordered = 0
+        self.out_of_window = 0  # 比最高序号落后 SEQ_WINDOW 以上、无法判断是否重复而丢弃的报文
+        self.highest = -1
+        self.latency = LatencyHistogram()  # 单向时延（纳秒），分桶统计，内存固定
+        # 环形标记表：序号 seq 记在 seq % SEQ_WINDOW，只对 (最高序号 - SEQ_WINDOW, 最高序号] 内的序号有效
+        self._seen = bytearray(SEQ_WINDOW)
+
+    def _forget(self, first, last):
+        """最高序号前移时清掉 first..last 的位置，这些位置上是已经滑出窗口的旧序号"""
+        count = min(last - first + 1, SEQ_WINDOW)
+        start = first % SEQ_WINDOW
+        end = start + count
+        seen = self._seen
+        if end <= SEQ_WINDOW:
+            seen[start:end] = bytes(count)
+        else:
+            seen[start:] = bytes(SEQ_WINDOW - start)
+            seen[:end - SEQ_WINDOW] = bytes(end - SEQ_WINDOW)
+
+    def record(self, seq, sent_ns, recv_ns, length):
+        if seq <= self.highest - SEQ_WINDOW:
+            self.out_of_window += 1
+            return
+        if seq > self.highest + 1:
+            self._forget(self.highest + 1, seq - 1)
+        seen = self._seen
+        index = seq % SEQ_WINDOW
+        if seq <= self.highest and seen[index]:
+            self.duplicates += 1
+            return
+        seen[index] = 1
+        self.received += 1
+        self.bytes += length
+        if seq < self.highest:
+            self.reordered += 1
+        else:
+            self.highest = seq
+        self.latency.add(max(0, recv_ns - sent_ns))
+
+    @property
+    def lost(self):
+        return self.highest + 1 - self.received
+
+    @property
+    def loss_rate(self):
+        expected = self.highest + 1
+        return self.lost / expected * 100 if expected > 0 else 0.0
+
+    def as_event(self, kind, target, port):
+        return event(kind, 'UDPRECV', target, port=port, session=self.session, received=self.received,
+                     bytes=self.bytes, lost=self.lost, loss_rate=self.loss_rate, reordered=self.reordered,
+                     duplicates=self.duplicates, out_of_window=self.out_of_window, latency=self.latency.summary())
+
+
+def receive_events(port, bind='0.0.0.0', duration=None, idle=2.0, report_interval=1.0):
+    """
+    接收 PatternPayload 负载并统计；duration 秒后停止，或者收到过报文后空闲 idle 秒停止
+    发送端换了会话号（重新开始发送）时先为上一个会话产生汇总事件
+    """
+    port = int(port)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 8 * 1024 * 1024)
+    sock.bind((bind, port))
+    sock.settimeout(0.1)
+    enable_kernel_timestamps(sock)
+    buffer = bytearray(65535)
+    stats = None
+    yield event(START, 'UDPRECV', bind, port=port)
+
+    start = time.monotonic()
+    last_packet = None
+    next_report = start + report_interval
+    try:
+        while True:
+            now = time.monotonic()
+            if duration and now - start >= duration:
+                break
+            if idle and last_packet is not None and now - last_packet >= idle:
+                break
+            if stats is not None and now >= next_report:
+                next_report = now + report_interval
+                yield stats.as_event(PROGRESS, bind, port)
+            try:
+                length, _, recv_ns = recv_with_timestamp(sock, buffer, realtime=True)
+            except socket.timeout:
+                continue
+            last_packet = time.monotonic()
+            if length < LOAD_HEADER.size:
+                continue
+            magic, session, seq, sent_ns = LOAD_HEADER.unpack_from(buffer)
+            if magic != LOAD_MAGIC:
+                continue
+            if stats is None or session != stats.session:
+                if stats is not None:
+                    yield stats.as_event(SUMMARY, bind, port)
+                stats = LoadReceiverStats(session)
+            stats.record(seq, sent_ns, recv_ns, length)
+    finally:
+        sock.close()
+    if stats is not None:
+        yield stats.as_event(SUMMARY, bind, port)